@@ -0,0 +1,238 @@
+from models import Transaction, TransactionManager
+
+from array import array
+from functools import lru_cache
+from math import exp, log
+from operator import add
+from typing import Iterable, Union
+import re
+import zlib
+
+
+NON_WORD = re.compile(r"[\W\d_]+")
+
+
+def normalize(text: str) -> str:
+    """
+    Normalizes vendor and item text for classification: case-folded, with digits, punctuation and repeated spaces
+    dropped, e.g. 'AMAZON MKTP*2K3 #114' becomes 'amazon mktp k'.
+    """
+    return NON_WORD.sub(" ", text.casefold()).strip()
+
+
+class CategoryClassifier:
+    """
+    Suggests the item category of a transaction from its vendor and item, trained locally on existing transactions.
+
+    The model is a multinomial naive Bayes classifier over hashed features: every word of the normalized vendor and
+    item and every character n-gram of the words, salted by the field, is hashed into one of buckets counters per
+    category. Training only adds counts, so the classifier can be trained incrementally.
+
+    Scores of a vendor, the sum of the log-likelihoods of its features per category, are kept in an LRU cache keyed
+    by the normalized vendor, and so are the scores of items. Vendors repeat a lot in statements, so most
+    classifications cost two cache lookups and a few additions. The caches are cleared when the classifier is trained.
+
+    Attributes:
+        buckets (int): Number of hashed features, a power of two.
+        ngram_range (tuple): Shortest and longest character n-grams.
+        alpha (float): Additive smoothing of the feature counts.
+        categories (list): Categories seen in training, in the order they were first seen.
+
+    Methods:
+        learn: Trains the classifier on one transaction.
+        train: Trains the classifier on many transactions.
+        suggest: Returns the most probable categories of a vendor and item with their probabilities.
+        classify: Returns the most probable category of a vendor and item.
+        classify_many: Classifies a whole batch of vendors and items.
+    """
+
+    def __init__(self, buckets: int = 2 ** 18, ngram_range: tuple[int, int] = (3, 5), alpha: float = 0.1,
+                 cache_size: int = 10_000):
+        if buckets < 1 or buckets & (buckets - 1):
+            raise ValueError("Number of buckets should be a power of two.")
+        if not (0 < ngram_range[0] <= ngram_range[1]):
+            raise ValueError("N-gram range should be a pair of positive lengths, the shorter one first.")
+        if alpha <= 0:
+            raise ValueError("Smoothing should be positive.")
+
+        self.buckets = buckets
+        self.ngram_range = ngram_range
+        self.alpha = alpha
+        self.categories = []
+        self.category_counts = []
+        # hashed feature -> counts of the feature in the training texts of every category, arrays keep them compact
+        self.feature_counts = {}
+        self.feature_totals = []
+        self._tables = None
+        self.vendor_scores = lru_cache(maxsize=cache_size)(
+            lambda vendor: self.score_features(self.features(vendor, b"vendor")))
+        self.item_scores = lru_cache(maxsize=cache_size)(
+            lambda item: self.score_features(self.features(item, b"item")))
+
+    @classmethod
+    def from_transaction_manager(cls, transaction_manager: TransactionManager, **kwargs) -> "CategoryClassifier":
+        """
+        Returns a classifier trained on all transactions of a manager.
+        """
+        classifier = cls(**kwargs)
+        store = transaction_manager.store
+        for user_id in store.users():
+            classifier.train(store.get_user_transactions(user_id) or ())
+        return classifier
+
+    def features(self, text: str, field: bytes) -> list[int]:
+        """
+        Returns the hashed features of normalized text, hashed with CRC-32 so they do not change between processes.
+        """
+        mask = self.buckets - 1
+        salt = zlib.crc32(field)
+        shortest, longest = self.ngram_range
+        features = []
+        for word in text.split():
+            features.append(zlib.crc32(word.encode("utf-8"), salt) & mask)
+            padded = f" {word} ".encode("utf-8")
+            for length in range(shortest, min(longest, len(padded)) + 1):
+                for start in range(len(padded) - length + 1):
+                    features.append(zlib.crc32(
+                        padded[start:start + length], salt ^ length) & mask)
+        return features
+
+    # training
+
+    def learn(self, vendor: str, item: str, category: str) -> None:
+        self.train_features(self.features(normalize(vendor), b"vendor") + self.features(normalize(item), b"item"),
+                            category)
+        self.invalidate()
+
+    def train(self, transactions: Iterable[Transaction]) -> int:
+        """
+        Trains the classifier on transactions.
+
+        Returns:
+            int: Number of transactions trained on.
+        """
+        trained = 0
+        for transaction in transactions:
+            self.train_features(self.features(normalize(transaction.vendor), b"vendor")
+                                + self.features(normalize(transaction.item), b"item"), transaction.item_category)
+            trained += 1
+        if trained:
+            self.invalidate()
+        return trained
+
+    def train_features(self, features: list[int], category: str) -> None:
+        if category in self.categories:
+            index = self.categories.index(category)
+        else:
+            index = len(self.categories)
+            self.categories.append(category)
+            self.category_counts.append(0)
+            self.feature_totals.append(0)
+            for counts in self.feature_counts.values():
+                counts.append(0)
+
+        self.category_counts[index] += 1
+        self.feature_totals[index] += len(features)
+        for feature in features:
+            counts = self.feature_counts.get(feature)
+            if counts is None:
+                counts = self.feature_counts[feature] = array("L", [0]) * len(self.categories)
+            counts[index] += 1
+
+    def invalidate(self) -> None:
+        self._tables = None
+        self.vendor_scores.cache_clear()
+        self.item_scores.cache_clear()
+
+    # inference
+
+    @property
+    def tables(self) -> tuple[list[float], list[float], dict]:
+        """
+        Log priors of the categories, log-likelihoods of unseen features and of every seen feature per category,
+        computed after training on first use.
+        """
+        if self._tables is None:
+            documents = sum(self.category_counts)
+            priors = [log(count / documents) for count in self.category_counts]
+            denominators = [total + self.alpha * self.buckets for total in self.feature_totals]
+            unseen = [log(self.alpha / denominator) for denominator in denominators]
+            likelihoods = {feature: array("d", [log((count + self.alpha) / denominator)
+                                                for count, denominator in zip(counts, denominators)])
+                           for feature, counts in self.feature_counts.items()}
+            self._tables = (priors, unseen, likelihoods)
+        return self._tables
+
+    def score_features(self, features: list[int]) -> list[float]:
+        _, unseen, likelihoods = self.tables
+        scores = [0.0] * len(self.categories)
+        for feature in features:
+            scores = list(map(add, scores, likelihoods.get(feature, unseen)))
+        return scores
+
+    def scores(self, vendor: str, item: str = None) -> list[float]:
+        scores = list(map(add, self.tables[0], self.vendor_scores(normalize(vendor))))
+        if item:
+            scores = list(map(add, scores, self.item_scores(normalize(item))))
+        return scores
+
+    def suggest(self, vendor: str, item: str = None, top: int = 3) -> list[tuple[str, float]]:
+        """
+        Returns the most probable categories of a transaction.
+
+        Args:
+            vendor (str): The vendor of the transaction.
+            item (str, optional): The item of the transaction.
+            top (int): Number of returned categories.
+
+        Returns:
+            list: (category, probability) pairs, the most probable first. Empty if the classifier is not trained.
+        """
+        if not self.categories:
+            return []
+        scores = self.scores(vendor, item)
+        highest = max(scores)
+        weights = [exp(score - highest) for score in scores]
+        total = sum(weights)
+        ranked = sorted(zip(self.categories, weights), key=lambda pair: pair[1], reverse=True)
+        return [(category, weight / total) for category, weight in ranked[:top]]
+
+    def classify(self, vendor: str, item: str = None, min_probability: float = 0.0) -> Union[str, None]:
+        """
+        Returns the most probable category of a transaction, None if the classifier is not trained or the category
+        is less probable than min_probability.
+        """
+        suggestions = self.suggest(vendor, item, top=1)
+        if not suggestions or suggestions[0][1] < min_probability:
+            return None
+        return suggestions[0][0]
+
+    def classify_many(self, rows: Iterable[tuple[str, Union[str, None]]],
+                      min_probability: float = 0.0) -> list[Union[str, None]]:
+        """
+        Classifies a batch of (vendor, item) pairs, e.g. a chunk of an import. Every distinct normalized pair is
+        classified once.
+
+        Returns:
+            list: Category of every pair, None where classify would return None.
+        """
+        rows = [(normalize(vendor), normalize(item) if item else "") for vendor, item in rows]
+        if not self.categories:
+            return [None] * len(rows)
+
+        priors = self.tables[0]
+        categories = self.categories
+        classified = {}
+        for pair in dict.fromkeys(rows):
+            vendor, item = pair
+            scores = list(map(add, priors, self.vendor_scores(vendor)))
+            if item:
+                scores = list(map(add, scores, self.item_scores(item)))
+            highest = max(scores)
+            best = scores.index(highest)
+            if min_probability > 0:
+                probability = 1 / sum(exp(score - highest) for score in scores)
+                classified[pair] = categories[best] if probability >= min_probability else None
+            else:
+                classified[pair] = categories[best]
+        return [classified[pair] for pair in rows]
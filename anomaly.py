@@ -0,0 +1,292 @@
+from models import Transaction, TransactionManager
+from config import CATEGORIES
+
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from math import ceil, log1p, sqrt
+from typing import Union
+import queue
+
+
+class Alert:
+    """
+    Anomaly found by AnomalyDetector in a registered transaction.
+
+    Attributes:
+        kind (str): "cost" for an outlier cost, "vendor" for a vendor the account has not paid before.
+        user_id (str): The ID of the account.
+        transaction_id (str): The ID of the transaction.
+        score (float): For cost alerts the number of standard deviations the log cost lies above the running mean
+            of the account and category, 1.0 for vendor alerts.
+        value: The cost of the transaction for cost alerts, its vendor for vendor alerts.
+        item_category (str): The category of the transaction.
+    """
+
+    __slots__ = ("kind", "user_id", "transaction_id", "score", "value", "item_category")
+
+    def __init__(self, kind: str, user_id: str, transaction_id: str, score: float, value, item_category: str):
+        self.kind = kind
+        self.user_id = user_id
+        self.transaction_id = transaction_id
+        self.score = score
+        self.value = value
+        self.item_category = item_category
+
+    @property
+    def message(self) -> str:
+        # formatted when read, alerts are raised on the ingest path and most are never printed
+        if self.kind == "cost":
+            return (f"Cost {self.value} is {self.score:.1f} standard deviations above the usual "
+                    f"{self.item_category} spend of the account.")
+        return f"Vendor {self.value} was not paid by the account before."
+
+    def __repr__(self) -> str:
+        return f"Alert({self.kind!r}, {self.user_id!r}, {self.transaction_id!r}, {self.score:.2f})"
+
+
+def vendor_key(vendor: str) -> str:
+    """
+    Returns the vendor as it is compared by AnomalyDetector: case-folded, with runs of whitespace as one space.
+    Digits are kept, 'Store 114' and 'Store 115' are different vendors.
+    """
+    return " ".join(vendor.casefold().split())
+
+
+# 64-bit multiplicative hashing constant, the golden ratio
+GOLDEN = 0x9E3779B97F4A7C15
+WORD_MASK = 0xFFFFFFFFFFFFFFFF
+
+
+class VendorSketch:
+    """
+    Fingerprint table of the (account, vendor) pairs seen, in fixed memory.
+
+    Every pair is hashed to a bucket of SLOTS 16-bit fingerprints, a pair is seen if its fingerprint is in its
+    bucket. A pair which was not seen is reported as seen with probability at most SLOTS / 65535, about 1e-4.
+    The table is sized for capacity pairs at half load. A pair hashed to a full bucket overwrites one of its
+    fingerprints, so under pressure the table forgets pairs, which are reported as new when they come again,
+    rather than grow.
+
+    Attributes:
+        capacity (int): Number of pairs the table is sized for.
+        buckets (int): Number of buckets.
+        table (array): Fingerprints, SLOTS per bucket, 0 marks an empty slot.
+        size (int): Number of stored fingerprints.
+        evicted (int): Number of fingerprints overwritten in full buckets.
+    """
+
+    SLOTS = 8
+
+    def __init__(self, capacity: int = 1_000_000):
+        if capacity < 1:
+            raise ValueError("Capacity of the sketch should be positive.")
+
+        self.capacity = capacity
+        self.buckets = ceil(2 * capacity / self.SLOTS)
+        self.table = array("H", bytes(2 * self.SLOTS * self.buckets))
+        self.size = 0
+        self.evicted = 0
+
+    def locate(self, key) -> tuple[int, int]:
+        """
+        Returns the first slot of the bucket of a key and the fingerprint of the key.
+        """
+        # hashes of small integers are the integers themselves, the multiplication spreads them over all bits
+        value = hash(key) * GOLDEN & WORD_MASK
+        return (value >> 32) % self.buckets * self.SLOTS, value & 0xFFFF or 1
+
+    def add(self, key) -> bool:
+        """
+        Adds a key to the sketch.
+
+        Returns:
+            bool: True if the key was seen before, up to the error rate of the sketch.
+        """
+        start, fingerprint = self.locate(key)
+        table = self.table
+        bucket = table[start:start + self.SLOTS]
+        if fingerprint in bucket:
+            return True
+        try:
+            slot = bucket.index(0)
+            self.size += 1
+        except ValueError:
+            slot = fingerprint % self.SLOTS
+            self.evicted += 1
+        table[start + slot] = fingerprint
+        return False
+
+    def __contains__(self, key) -> bool:
+        start, fingerprint = self.locate(key)
+        return fingerprint in self.table[start:start + self.SLOTS]
+
+    @property
+    def nbytes(self) -> int:
+        return self.table.itemsize * len(self.table)
+
+
+class AnomalyDetector:
+    """
+    Flags outlier costs and vendors never paid before as transactions are registered by a TransactionManager.
+
+    The detector is registered as a listener of the manager, so every transaction registered by add_transcation or
+    create_transactions_bulk is checked as it arrives:
+
+    - costs are compared with an exponentially weighted moving average and variance of the log costs of the same
+      account and category, a cost more than threshold standard deviations above the average raises a "cost" alert.
+      Log costs make the heavy-tailed costs of purchases closer to normal, so the threshold means about the same for
+      every account;
+    - the (account, vendor_key(vendor)) pair is added to a VendorSketch, a pair the sketch has not seen raises a
+      "vendor" alert.
+
+    Neither check alerts before the account and category, or the account, have warmup transactions, so new accounts
+    are learned rather than flagged, the number of transactions of an account is read from the statistics of the
+    manager. Memory is bounded: the moving statistics of at most max_keys (account, category) pairs are kept, the
+    least recently used are dropped first, and the sketch has a fixed size.
+
+    Alerts are put on queue without blocking, alerts raised while max_alerts are waiting are counted in dropped.
+    Reversed transactions are ignored, moving statistics cannot take a value back.
+
+    Attributes:
+        transaction_manager (TransactionManager): Manager whose transactions are checked.
+        alpha (float): Weight of the newest cost in the moving statistics.
+        threshold (float): Number of standard deviations above the moving average a cost alert starts at.
+        warmup (int): Number of transactions seen before alerts are raised.
+        max_keys (int): Maximum number of (account, category) pairs with moving statistics.
+        costs (OrderedDict): [count, mean, variance] of the log costs keyed by (user_id, category code), least
+            recently used first.
+        vendors (VendorSketch): Sketch of the vendors paid by every account.
+        queue (queue.SimpleQueue): Raised alerts, consumers can wait for them with queue.get().
+        max_alerts (int): Maximum number of alerts waiting in the queue.
+        dropped (int): Number of alerts which did not fit in the queue.
+
+    Methods:
+        check: Checks a transaction and returns its alerts.
+        prime: Learns from past transactions without raising alerts.
+        drain: Takes all queued alerts.
+    """
+
+    def __init__(self, transaction_manager: TransactionManager, alpha: float = 0.1, threshold: float = 3.0,
+                 warmup: int = 10, max_keys: int = 100_000, vendor_capacity: int = 1_000_000,
+                 vendor_cache: int = 10_000, max_alerts: int = 10_000, prime: bool = True):
+        if not isinstance(transaction_manager, TransactionManager):
+            raise TypeError(
+                f"TransactionManager instance is expected, {type(transaction_manager)} type was given")
+        if not 0 < alpha < 1:
+            raise ValueError("Alpha should be between 0 and 1.")
+        if threshold <= 0:
+            raise ValueError("Threshold should be positive.")
+        if max_keys < 1:
+            raise ValueError("Maximum number of keys should be positive.")
+
+        self.transaction_manager = transaction_manager
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.max_keys = max_keys
+        self.costs = OrderedDict()
+        self.vendors = VendorSketch(vendor_capacity)
+        # statements repeat vendors a lot, a cached key is a few times faster than folding the vendor every time
+        self.vendor_key = lru_cache(maxsize=vendor_cache)(vendor_key)
+        self.max_alerts = max_alerts
+        self.queue = queue.SimpleQueue()
+        self.dropped = 0
+
+        if prime:
+            store = transaction_manager.store
+            for user_id in store.users():
+                self.prime(store.get_user_transactions(user_id) or ())
+        transaction_manager.add_listener(self)
+
+    def transaction_added(self, transaction: Transaction) -> None:
+        for alert in self.check(transaction):
+            if self.queue.qsize() < self.max_alerts:
+                self.queue.put(alert)
+            else:
+                self.dropped += 1
+
+    def transaction_reversed(self, transaction: Transaction) -> None:
+        pass
+
+    def check(self, transaction: Transaction) -> Union[list[Alert], tuple]:
+        """
+        Updates the statistics with a transaction and returns the alerts it raises, an empty tuple if none.
+        """
+        alerts = ()
+        user_id = transaction.user_id
+        cost = transaction.cost
+        value = log1p(cost)
+        key = (user_id, transaction.item_category_code)
+
+        state = self.costs.get(key)
+        if state is None:
+            state = self.costs[key] = [0, value, 0.0]
+            if len(self.costs) > self.max_keys:
+                self.costs.popitem(last=False)
+        else:
+            self.costs.move_to_end(key)
+            count, mean, variance = state
+            deviation = value - mean
+            if count >= self.warmup and variance > 0:
+                score = deviation / sqrt(variance)
+                if score >= self.threshold:
+                    alerts = [Alert("cost", user_id, transaction.transaction_id, score, cost,
+                                    transaction.item_category)]
+            increment = self.alpha * deviation
+            state[1] = mean + increment
+            state[2] = (1 - self.alpha) * (variance + deviation * increment)
+        state[0] += 1
+
+        vendor = transaction.vendor
+        if not self.vendors.add((user_id, self.vendor_key(vendor))) and self.account_transactions(user_id) > self.warmup:
+            alerts = [*alerts, Alert("vendor", user_id, transaction.transaction_id, 1.0, vendor,
+                                     transaction.item_category)]
+        return alerts
+
+    def account_transactions(self, user_id) -> int:
+        # the running statistics of the manager already count the transaction being checked
+        stats = self.transaction_manager.statistics.get(user_id)
+        return stats.costs.count if stats is not None else 0
+
+    def prime(self, transactions) -> int:
+        """
+        Learns the costs and vendors of past transactions, oldest first, without raising alerts.
+
+        Returns:
+            int: Number of transactions learned.
+        """
+        warmup, self.warmup = self.warmup, float("inf")
+        learned = 0
+        try:
+            for transaction in sorted(transactions, key=lambda transaction: transaction.transaction_ordinal):
+                self.check(transaction)
+                learned += 1
+        finally:
+            self.warmup = warmup
+        return learned
+
+    def drain(self) -> list[Alert]:
+        """
+        Takes all alerts from the queue without waiting.
+        """
+        alerts = []
+        while True:
+            try:
+                alerts.append(self.queue.get_nowait())
+            except queue.Empty:
+                return alerts
+
+    def pending(self) -> int:
+        return self.queue.qsize()
+
+    def statistics(self, user_id, category: str) -> Union[tuple[int, float, float], None]:
+        """
+        Returns the number of transactions, the moving average and the moving standard deviation of the log costs of
+        an account in a category, None if they are not tracked.
+        """
+        code = CATEGORIES.codes.get(category)
+        state = self.costs.get((user_id, code))
+        if state is None:
+            return None
+        return state[0], state[1], sqrt(state[2])
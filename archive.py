@@ -0,0 +1,499 @@
+from models import InMemoryTransactionStore, Transaction
+from oplog import decode_key, encode_key
+from query import Predicate, order, paginate, scan_columns, scan_rows, sort_keys, to_ordinal
+from storage import TransactionView
+
+from array import array
+from bisect import bisect_left
+from datetime import date
+from itertools import chain
+from typing import Iterable, Iterator, Union
+import json
+import mmap
+import os
+import struct
+
+
+MAGIC = b"TXARCHV1"
+HEADER = struct.Struct("<8sI")
+# heaps of strings, every heap is stored as its UTF-8 data and the offsets of the strings in the data
+HEAPS = ("transaction_ids", "user_ids", "items", "vendors")
+# heaps of IDs are encoded with oplog.encode_key, which keeps integer IDs apart from strings
+KEY_HEAPS = ("transaction_ids", "user_ids")
+COLUMNS = (("user_column", "L"), ("item_column", "L"), ("vendor_column", "L"), ("costs", "d"), ("quantities", "q"),
+           ("dates", "l"), ("payment_methods", "B"), ("category_column", "H"), ("user_order", "Q"),
+           ("user_bounds", "Q"), ("days", "l"), ("day_bounds", "Q"), ("id_order", "Q"))
+
+
+class StringHeap:
+    """
+    Immutable strings stored back to back in a buffer, the string with index i spans offsets[i] to offsets[i + 1].
+
+    Strings are decoded only when accessed. The heap can stand in for a ColumnEncoder: values is the heap itself and
+    codes, the reverse lookup from string to index, is built on first use.
+    """
+
+    __slots__ = ("data", "offsets", "_codes")
+
+    def __init__(self, data: memoryview, offsets: memoryview):
+        self.data = data
+        self.offsets = offsets
+        self._codes = None
+
+    @staticmethod
+    def build(strings: list[str]) -> tuple[bytes, array]:
+        """
+        Returns the data and the offsets of a heap of the strings.
+        """
+        return StringHeap.build_encoded([string.encode("utf-8") for string in strings])
+
+    @staticmethod
+    def build_encoded(encoded: list[bytes]) -> tuple[bytes, array]:
+        offsets = array("Q", [0])
+        position = 0
+        for string in encoded:
+            position += len(string)
+            offsets.append(position)
+        return b"".join(encoded), offsets
+
+    def __getitem__(self, index: int) -> str:
+        return str(self.data[self.offsets[index]:self.offsets[index + 1]], "utf-8")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+    def decode(self, code: int) -> str:
+        return self[code]
+
+    @property
+    def values(self) -> "StringHeap":
+        return self
+
+    @property
+    def codes(self) -> dict:
+        if self._codes is None:
+            self._codes = {value: code for code, value in enumerate(self)}
+        return self._codes
+
+
+class KeyHeap(StringHeap):
+    """
+    Heap of IDs encoded with oplog.encode_key, so integer IDs are restored as integers like in the operation log.
+    """
+
+    __slots__ = ()
+
+    @staticmethod
+    def build(keys: list) -> tuple[bytes, array]:
+        return StringHeap.build_encoded([encode_key(key) for key in keys])
+
+    def raw(self, index: int) -> bytes:
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1]])
+
+    def __getitem__(self, index: int) -> Union[str, int]:
+        return decode_key(self.raw(index))
+
+
+def write_segment(path: str, transactions: Iterable[Transaction]) -> int:
+    """
+    Writes transactions to an archive segment file.
+
+    Rows are sorted by date and transaction ID, so the rows of a day are contiguous. The file holds a header with the
+    layout of the columns, followed by the string heaps and the fixed-width columns, each aligned to 8 bytes.
+    The file is written under a temporary name and renamed when complete, so a segment is never seen half written.
+
+    Returns:
+        int: Number of written transactions.
+    """
+    # IDs are compared encoded, integer and string IDs cannot be compared with each other
+    transactions = sorted(transactions, key=lambda transaction: (
+        transaction.transaction_ordinal, encode_key(transaction.transaction_id)))
+    columns = {name: array(typecode) for name, typecode in COLUMNS}
+    heaps = {}
+
+    def encode(heap: str, values: list) -> array:
+        codes = heaps[heap] = {}
+        return array("L", [codes.setdefault(value, len(codes)) for value in values])
+
+    encode("transaction_ids", [transaction.transaction_id for transaction in transactions])
+    columns["user_column"] = encode("user_ids", [transaction.user_id for transaction in transactions])
+    columns["item_column"] = encode("items", [transaction.item for transaction in transactions])
+    columns["vendor_column"] = encode("vendors", [transaction.vendor for transaction in transactions])
+    columns["costs"] = array("d", [transaction.cost for transaction in transactions])
+    columns["quantities"] = array("q", [transaction.quantity for transaction in transactions])
+    columns["dates"] = array("l", [transaction.transaction_ordinal for transaction in transactions])
+    methods = {method: index for index, method in enumerate(Transaction.PAYMENT_METHODS)}
+    columns["payment_methods"] = array("B", [methods[transaction.payment_method] for transaction in transactions])
+    columns["category_column"] = array("H", [transaction.item_category_code for transaction in transactions])
+
+    rows = len(transactions)
+    user_rows = [[] for _ in heaps["user_ids"]]
+    for row, user in enumerate(columns["user_column"]):
+        user_rows[user].append(row)
+    columns["user_bounds"].append(0)
+    for rows_of_user in user_rows:
+        columns["user_order"].extend(rows_of_user)
+        columns["user_bounds"].append(len(columns["user_order"]))
+
+    previous = None
+    for row, day in enumerate(columns["dates"]):
+        if day != previous:
+            columns["days"].append(day)
+            columns["day_bounds"].append(row)
+            previous = day
+    columns["day_bounds"].append(rows)
+
+    ids = [encode_key(transaction_id) for transaction_id in heaps["transaction_ids"]]
+    columns["id_order"].extend(sorted(range(rows), key=ids.__getitem__))
+
+    buffers = []
+    for name in HEAPS:
+        heap = KeyHeap if name in KEY_HEAPS else StringHeap
+        data, offsets = heap.build(list(heaps[name]))
+        buffers.append((f"{name}_data", "B", data, len(data)))
+        buffers.append((f"{name}_offsets", "Q", offsets, len(offsets)))
+    for name, typecode in COLUMNS:
+        buffers.append((name, typecode, columns[name], len(columns[name])))
+
+    layout = {}
+    offset = 0
+    for name, typecode, _, length in buffers:
+        offset += -offset % 8
+        layout[name] = (typecode, offset, length)
+        offset += length * array(typecode).itemsize
+    header = json.dumps({"rows": rows, "layout": layout}).encode("utf-8")
+    start = HEADER.size + len(header)
+    start += -start % 8
+
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(header)))
+        f.write(header)
+        f.write(bytes(start - f.tell()))
+        for name, _, buffer, _ in buffers:
+            f.write(bytes(start + layout[name][1] - f.tell()))
+            f.write(buffer)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    return rows
+
+
+class ArchiveSegment:
+    """
+    Read-only transactions of an archive segment file, mapped into memory.
+
+    Columns are memoryviews of the mapped file and strings are decoded from the heaps only when accessed,
+    so opening a segment reads nothing but its header and the pages of the file are loaded by the OS on demand.
+    The segment provides the columns of a ColumnarTransactionStore, which lets query and TransactionView read it
+    the same way as the store.
+
+    Attributes:
+        path (str): Path of the segment file.
+        transaction_ids, user_ids (KeyHeap): Heaps of the IDs of the rows.
+        items, vendors (StringHeap): Heaps of the strings of the rows.
+        user_rows (dict): A dictionary where the key is the user ID and the value is a view of the user's row numbers.
+        date_rows (dict): A dictionary where the key is the day ordinal and the value is the range of rows of that day.
+        generation (int): Always 0, rows of a segment are never renumbered.
+
+    Raises:
+        ValueError: If the file is not an archive segment.
+    """
+
+    PAYMENT_METHODS = Transaction.PAYMENT_METHODS
+    generation = 0
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, header_length = HEADER.unpack_from(self._mapped)
+            if magic != MAGIC:
+                raise ValueError
+            header = json.loads(
+                self._mapped[HEADER.size:HEADER.size + header_length])
+        except (ValueError, struct.error) as e:
+            self._mapped.close()
+            raise ValueError(f"{path} is not a transaction archive segment.") from e
+
+        start = HEADER.size + header_length
+        start += -start % 8
+        view = memoryview(self._mapped)
+        self._views = [view]
+        columns = {}
+        for name, (typecode, offset, length) in header["layout"].items():
+            offset += start
+            column = view[offset:offset + length *
+                          array(typecode).itemsize].cast(typecode)
+            self._views.append(column)
+            columns[name] = column
+
+        for name in HEAPS:
+            heap = KeyHeap if name in KEY_HEAPS else StringHeap
+            setattr(self, name, heap(
+                columns[f"{name}_data"], columns[f"{name}_offsets"]))
+        for name, _ in COLUMNS:
+            setattr(self, name, columns[name])
+        self.rows = header["rows"]
+        # new IDs are mostly generated above the archived ones, the bounds answer most membership tests at once
+        self._id_bounds = (self.transaction_ids.raw(self.id_order[0]), self.transaction_ids.raw(self.id_order[-1])) \
+            if self.rows else None
+        self._deleted = None
+        self._user_rows = None
+        self._date_rows = None
+
+    @property
+    def deleted(self) -> bytes:
+        # rows of a segment are never deleted, the flags only let the segment be queried like a columnar store
+        if self._deleted is None:
+            self._deleted = bytes(self.rows)
+        return self._deleted
+
+    @property
+    def user_rows(self) -> dict:
+        if self._user_rows is None:
+            bounds, order = self.user_bounds, self.user_order
+            self._user_rows = {user_id: order[bounds[code]:bounds[code + 1]]
+                               for code, user_id in enumerate(self.user_ids)}
+        return self._user_rows
+
+    @property
+    def date_rows(self) -> dict:
+        if self._date_rows is None:
+            bounds = self.day_bounds
+            self._date_rows = {day: range(bounds[index], bounds[index + 1])
+                               for index, day in enumerate(self.days)}
+        return self._date_rows
+
+    @property
+    def first_day(self) -> Union[int, None]:
+        return self.days[0] if self.rows else None
+
+    @property
+    def last_day(self) -> Union[int, None]:
+        return self.days[-1] if self.rows else None
+
+    def date_keys(self) -> list[int]:
+        return self.days.tolist()
+
+    def view(self, row: int) -> TransactionView:
+        return TransactionView(self, row)
+
+    def find_row(self, transaction_id) -> Union[int, None]:
+        if self._id_bounds is None or not isinstance(transaction_id, (str, int)):
+            return None
+        key = encode_key(transaction_id)
+        if not self._id_bounds[0] <= key <= self._id_bounds[1]:
+            return None
+        order = self.id_order
+        index = bisect_left(order, key, key=self.transaction_ids.raw)
+        if index < len(order) and self.transaction_ids.raw(order[index]) == key:
+            return order[index]
+        return None
+
+    def get_user_transactions(self, user_id) -> Union[list[TransactionView], None]:
+        rows = self.user_rows.get(user_id)
+        if rows is None:
+            return None
+        return [TransactionView(self, row) for row in rows]
+
+    def get_transaction(self, user_id, transaction_id) -> Union[TransactionView, None]:
+        row = self.find_row(transaction_id)
+        if row is not None and self.user_ids[self.user_column[row]] == user_id:
+            return TransactionView(self, row)
+        return None
+
+    def query(self, predicate: Predicate = None, fields: Iterable[str] = None, order_by=None, limit: int = None,
+              offset: int = 0) -> Iterator:
+        return scan_columns(self, predicate, fields, order_by, limit, offset)
+
+    def users(self) -> list:
+        return list(self.user_ids)
+
+    def close(self) -> None:
+        # views have to be released before the mapping can be closed
+        self._user_rows = None
+        for name in HEAPS:
+            delattr(self, name)
+        for name, _ in COLUMNS:
+            delattr(self, name)
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mapped.close()
+
+    def __contains__(self, transaction_id) -> bool:
+        return self.find_row(transaction_id) is not None
+
+    def __len__(self):
+        return self.rows
+
+
+class TieredTransactionStore:
+    """
+    Storage engine for TransactionManager that keeps recent transactions in a hot store and seals older ones into
+    an archive of memory-mapped segment files.
+
+    New transactions go to the hot store. seal moves every transaction dated before a given day into a new
+    immutable segment in the archive directory, so only recent history stays resident as objects. Reads go to both
+    tiers: get_user_transactions, get_transaction and query return views of the archived rows, which decode their
+    fields straight from the mapped files. Archived transactions cannot be removed, so they cannot be reversed.
+
+    Sealing takes transactions out of the hot store without notifying the listeners of the manager, snapshots of an
+    oplog.OperationLog taken afterwards do not hold the sealed transactions.
+
+    Attributes:
+        hot: Storage engine of the recent transactions, InMemoryTransactionStore by default.
+        directory (str): Directory of the archive segments, segments already in it are opened.
+        segments (list): ArchiveSegment of every segment file, oldest first.
+
+    Methods:
+        seal: Moves the transactions dated before a day from the hot store into a new segment.
+        close: Closes the segment files.
+    """
+
+    SEGMENT_PREFIX = "archive-"
+    SEGMENT_SUFFIX = ".seg"
+
+    def __init__(self, directory: str, hot=None):
+        self.hot = hot if hot is not None else InMemoryTransactionStore()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.segments = [ArchiveSegment(os.path.join(directory, name)) for name in sorted(os.listdir(directory))
+                         if name.startswith(self.SEGMENT_PREFIX) and name.endswith(self.SEGMENT_SUFFIX)]
+
+    @property
+    def tiers(self) -> list:
+        return [*self.segments, self.hot]
+
+    @property
+    def transactions(self) -> dict:
+        return {user_id: self.get_user_transactions(user_id) for user_id in self.users()}
+
+    def seal(self, before: Union[str, date, int]) -> int:
+        """
+        Moves every transaction dated before a day from the hot store into a new archive segment.
+
+        Args:
+            before: The first day that stays in the hot store, as a 'YYYY-mm-dd' string, date or day ordinal.
+
+        Returns:
+            int: Number of sealed transactions.
+        """
+        before = to_ordinal(before)
+        sealed = [transaction for user_id in self.hot.users()
+                  for transaction in self.hot.get_user_transactions(user_id) or ()
+                  if transaction.transaction_ordinal < before]
+        if not sealed:
+            return 0
+
+        number = int(os.path.basename(self.segments[-1].path)[len(self.SEGMENT_PREFIX):-len(self.SEGMENT_SUFFIX)]) \
+            + 1 if self.segments else 0
+        path = os.path.join(
+            self.directory, f"{self.SEGMENT_PREFIX}{number:08d}{self.SEGMENT_SUFFIX}")
+        write_segment(path, sealed)
+        self.segments.append(ArchiveSegment(path))
+
+        # the rows are read before they are removed, as removal may compact the hot store
+        keys = [(transaction.user_id, transaction.transaction_id)
+                for transaction in sealed]
+        for user_id, transaction_id in keys:
+            self.hot.remove(user_id, transaction_id)
+        return len(keys)
+
+    def add(self, transaction: Transaction) -> None:
+        self.hot.add(transaction)
+
+    def add_many(self, transactions: Iterable[Transaction]) -> None:
+        self.hot.add_many(transactions)
+
+    def get_user_transactions(self, user_id) -> Union[list[Transaction], None]:
+        parts = [part for part in (tier.get_user_transactions(user_id) for tier in self.tiers)
+                 if part is not None]
+        return list(chain.from_iterable(parts)) if parts else None
+
+    def get_transaction(self, user_id, transaction_id) -> Union[Transaction, None]:
+        transaction = self.hot.get_transaction(user_id, transaction_id)
+        if transaction is not None:
+            return transaction
+        for segment in reversed(self.segments):
+            transaction = segment.get_transaction(user_id, transaction_id)
+            if transaction is not None:
+                return transaction
+        return None
+
+    def remove(self, user_id, transaction_id) -> Union[Transaction, None]:
+        """
+        Removes a transaction from the hot store.
+
+        Raises:
+            ValueError: If the transaction is archived.
+        """
+        transaction = self.hot.remove(user_id, transaction_id)
+        if transaction is None and any(segment.get_transaction(user_id, transaction_id) is not None
+                                       for segment in self.segments):
+            raise ValueError(
+                f"Transaction {transaction_id} is archived and cannot be removed.")
+        return transaction
+
+    def query(self, predicate: Predicate = None, fields: Iterable[str] = None, order_by=None, limit: int = None,
+              offset: int = 0) -> Iterator:
+        """
+        Runs a query over the segments, skipping those outside the dates the query is limited to, and the hot store.
+        """
+        keys = sort_keys(order_by)
+        paginate((), limit, offset)
+        bounds = predicate.date_range() if predicate is not None else None
+        tiers = [segment for segment in self.segments if bounds is None
+                 or (len(segment) and (bounds[0] is None or segment.last_day >= bounds[0])
+                     and (bounds[1] is None or segment.first_day <= bounds[1]))]
+        tiers.append(self.hot)
+
+        def run(tier, fields, limit):
+            if hasattr(tier, "query"):
+                return tier.query(predicate, fields, order_by, limit, 0)
+            return scan_rows(tier, predicate, fields, order_by, limit, 0)
+
+        if not keys:
+            return paginate(chain.from_iterable(run(tier, fields, None) for tier in tiers), limit, offset)
+
+        # every tier returns its own first offset + limit results, which are ordered once more across the tiers
+        # with the sort fields appended to the projected ones
+        wanted = None if limit is None else offset + limit
+        projected = None if fields is None else tuple(fields)
+        extended = None if projected is None else projected + \
+            tuple(field for field, _ in keys)
+        results = chain.from_iterable(
+            run(tier, extended, wanted) for tier in tiers)
+
+        def key_of(field):
+            if projected is not None:
+                position = len(projected) + \
+                    [name for name, _ in keys].index(field)
+                return lambda result: result[position]
+            if field == "transaction_date":
+                return lambda transaction: transaction.transaction_ordinal
+            return lambda transaction: getattr(transaction, field)
+
+        ordered = paginate(order(results, keys, key_of, wanted), limit, offset)
+        if projected is None:
+            return ordered
+        return (result[:len(projected)] for result in ordered)
+
+    def users(self) -> list:
+        return list(dict.fromkeys(chain.from_iterable(tier.users() for tier in self.tiers)))
+
+    def close(self) -> None:
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+
+    def __contains__(self, transaction_id) -> bool:
+        return transaction_id in self.hot or any(transaction_id in segment for segment in self.segments)
+
+    def __len__(self):
+        return len(self.hot) + sum(map(len, self.segments))
@@ -0,0 +1,89 @@
+"""
+Measures the overhead AnomalyDetector adds to every transaction registered by TransactionManager.add_transcation.
+
+Run from the repository root:
+
+    python -m benchmarks.anomaly_overhead [transactions] [accounts] [budget]
+
+Two managers are filled with the same generated history, 200,000 transactions of 2,000 accounts by default, and one
+of them gets a detector primed on the history. The same stream of new transactions, a tenth of the history, is then
+registered in both, chunk by chunk in turns so that both managers run under the same conditions, and the median
+times per transaction are compared. The check alone is timed as well, by running AnomalyDetector.check over the
+stream again, where the vendors are no longer new. The run fails if the detector makes add_transcation slower by more
+than budget, 1.0 (100%) by default. add_transcation alone takes a few microseconds on an in-memory store, so the
+budget allows the detector a few microseconds per transaction.
+"""
+from anomaly import AnomalyDetector
+from benchmarks.generator import DataGenerator
+
+from statistics import median
+from time import perf_counter
+import gc
+import sys
+
+
+CHUNK = 1_000
+
+
+def manager(transactions: int, accounts: int):
+    generator = DataGenerator(seed=1)
+    transaction_manager = generator.transaction_manager(accounts, transactions)
+    # the history was added to the store directly
+    transaction_manager.statistics.rebuild(transaction_manager.store)
+    account_list = list(transaction_manager.account_manager.accounts.values())
+    for account in account_list:
+        account.balance_cash = 10 ** 9
+    stream = generator.transactions(account_list, transactions // 10)
+    for index, transaction in enumerate(stream):
+        transaction.transaction_id = f"S{index:019d}"
+    return transaction_manager, stream
+
+
+def register(transaction_manager, chunk) -> float:
+    start = perf_counter()
+    for transaction in chunk:
+        transaction_manager.add_transcation(transaction)
+    return (perf_counter() - start) / len(chunk) * 1e6
+
+
+def main(transactions: int = 200_000, accounts: int = 2_000, budget: float = 1.0) -> int:
+    plain, plain_stream = manager(transactions, accounts)
+    detected, detected_stream = manager(transactions, accounts)
+
+    start = perf_counter()
+    detector = AnomalyDetector(detected)
+    print(f"{transactions:,} transactions of {accounts:,} accounts primed in {perf_counter() - start:.1f} s, "
+          f"{len(detector.costs):,} account categories, sketch of {detector.vendors.nbytes:,} bytes")
+
+    gc.collect()
+    plain_times, detected_times = [], []
+    for start in range(0, len(plain_stream), CHUNK):
+        plain_times.append(register(plain, plain_stream[start:start + CHUNK]))
+        detected_times.append(register(detected, detected_stream[start:start + CHUNK]))
+    baseline, with_detector = median(plain_times), median(detected_times)
+    alerts = detector.drain()
+
+    gc.collect()
+    start = perf_counter()
+    for transaction in detected_stream:
+        detector.check(transaction)
+    check = (perf_counter() - start) / len(detected_stream) * 1e6
+
+    overhead = with_detector / baseline - 1
+    print(f"add_transcation:                {baseline:8.2f} us/transaction")
+    print(f"add_transcation with detector:  {with_detector:8.2f} us/transaction  "
+          f"overhead {with_detector - baseline:+.2f} us {overhead:+.1%}")
+    print(f"AnomalyDetector.check, again:   {check:8.2f} us/transaction")
+    print(f"{len(alerts):,} alerts for {len(detected_stream):,} transactions "
+          f"({sum(alert.kind == 'cost' for alert in alerts):,} cost, "
+          f"{sum(alert.kind == 'vendor' for alert in alerts):,} vendor), {detector.dropped:,} dropped")
+
+    if overhead > budget:
+        print(f"overhead is above the budget of {budget:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    arguments = [int(argument) for argument in sys.argv[1:3]] + [float(argument) for argument in sys.argv[3:4]]
+    sys.exit(main(*arguments))
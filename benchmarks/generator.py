@@ -0,0 +1,104 @@
+"""
+Synthetic accounts and transactions for the benchmarks.
+
+Data is generated from a seed, so the same arguments always produce the same accounts and transactions.
+Transaction volumes per user follow a Pareto distribution, PARETO_ALPHA = 1.16 gives the 80/20 rule: a fifth of the
+users hold about 80% of the transactions. Vendors follow a Zipf distribution within their category, costs are
+log-normal and transaction dates are spread over the two years before REFERENCE_DAY, which is fixed so that the data
+does not change from day to day.
+"""
+from models import Account, AccountManager, Transaction, TransactionManager
+from config import CATEGORIES
+
+from datetime import date
+from itertools import accumulate
+import bisect
+import random
+
+
+PARETO_ALPHA = 1.16
+REFERENCE_DAY = date(2026, 1, 1).toordinal()
+HISTORY_DAYS = 730
+SYLLABLES = ("an", "bel", "cor", "da", "el", "fin", "gar", "ha", "is", "jo", "ka", "lin", "mar", "no", "or",
+             "pet", "ra", "sa", "tor", "ul", "ve", "wen", "ya", "zo")
+ITEMS = ("coffee", "groceries", "ticket", "subscription", "book", "dinner", "fuel", "medicine", "gift", "repair")
+VENDORS_PER_CATEGORY = 50
+
+
+def name(generator: random.Random) -> str:
+    return "".join(generator.choice(SYLLABLES) for _ in range(generator.randint(2, 4))).capitalize()
+
+
+class DataGenerator:
+    """
+    Generates accounts and transactions with realistic distributions.
+
+    Attributes:
+        seed (int): Seed of the random generator.
+        today (int): Day ordinal the dates are generated back from, REFERENCE_DAY by default.
+    """
+
+    def __init__(self, seed: int = 0, today: int = None):
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.today = today if today is not None else REFERENCE_DAY
+        categories = CATEGORIES.categories()
+        self.categories = [CATEGORIES.code(category)
+                           for category in categories]
+        self.vendors = {code: [f"{category.title().replace('_', ' ')} Vendor {rank}"
+                               for rank in range(1, VENDORS_PER_CATEGORY + 1)]
+                        for code, category in zip(self.categories, categories)}
+        # Zipf weights of the vendors of a category, the vendor of rank r is chosen with weight 1 / r
+        self.vendor_weights = list(accumulate(
+            1 / rank for rank in range(1, VENDORS_PER_CATEGORY + 1)))
+
+    def account(self, index: int) -> Account:
+        generator = self.random
+        return Account.from_record(str(1_000_000_000 + index), name(generator), name(generator),
+                                   round(generator.lognormvariate(7, 1.5), 2),
+                                   round(generator.lognormvariate(8, 1.5), 2) + 10 ** 7,
+                                   self.today - generator.randrange(HISTORY_DAYS * 3))
+
+    def accounts(self, count: int) -> list[Account]:
+        return [self.account(index) for index in range(count)]
+
+    def account_manager(self, count: int) -> AccountManager:
+        return AccountManager({account.id: account for account in self.accounts(count)})
+
+    def volumes(self, users: int) -> list[float]:
+        """
+        Returns the cumulative Pareto weights of the users, the share of transactions each user gets.
+        """
+        generator = self.random
+        return list(accumulate(generator.paretovariate(PARETO_ALPHA) for _ in range(users)))
+
+    def user_ids(self, accounts: list[Account], count: int) -> list[str]:
+        """
+        Returns count user IDs drawn with the Pareto volumes of the accounts.
+        """
+        return self.random.choices([account.id for account in accounts], cum_weights=self.volumes(len(accounts)),
+                                   k=count)
+
+    def transaction(self, index: int, user_id: str) -> Transaction:
+        generator = self.random
+        category = generator.choice(self.categories)
+        vendor = self.vendors[category][bisect.bisect_left(
+            self.vendor_weights, generator.random() * self.vendor_weights[-1])]
+        return Transaction.from_record(f"B{index:019d}", user_id, round(generator.lognormvariate(3, 1.2), 2) + 0.01,
+                                       generator.choice(Transaction.PAYMENT_METHODS), generator.choice(ITEMS),
+                                       generator.randint(1, 5), category, vendor,
+                                       self.today - generator.randrange(HISTORY_DAYS))
+
+    def transactions(self, accounts: list[Account], count: int) -> list[Transaction]:
+        return [self.transaction(index, user_id) for index, user_id in enumerate(self.user_ids(accounts, count))]
+
+    def transaction_manager(self, accounts: int, transactions: int, store=None) -> TransactionManager:
+        """
+        Returns a TransactionManager holding the generated transactions of the generated accounts.
+        The transactions are added to the store directly, the balances of the accounts are left as generated.
+        """
+        account_manager = self.account_manager(accounts)
+        transaction_manager = TransactionManager(account_manager, store)
+        transaction_manager.store.add_many(self.transactions(
+            list(account_manager.accounts.values()), transactions))
+        return transaction_manager
@@ -0,0 +1,88 @@
+"""
+Measures the import time of the project modules in fresh interpreters and reports it against the import-time budget.
+
+Run from the repository root:
+
+    python -m benchmarks.import_time
+
+Modules are imported with a warm bytecode cache, kept in a temporary directory, so the numbers reflect the work
+done at import time rather than compilation. Exits with status 1 if the median import time of any module exceeds
+its budget.
+"""
+from statistics import median
+import os
+import subprocess
+import sys
+import tempfile
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# budgets in milliseconds of cumulative import time, as reported by python -X importtime
+IMPORT_BUDGET_MS = {
+    "config": 20,
+    "utils": 30,
+    "models": 40,
+}
+REPEAT = 7
+
+
+def interpreter_environment(cache_directory: str) -> dict[str, str]:
+    environment = dict(os.environ)
+    environment.pop("PYTHONDONTWRITEBYTECODE", None)
+    environment["PYTHONPYCACHEPREFIX"] = cache_directory
+    return environment
+
+
+def measure_import(module: str, environment: dict[str, str]) -> float:
+    """
+    Imports the module in a fresh interpreter and returns its cumulative import time in milliseconds.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, env=environment, capture_output=True, text=True, check=True)
+    for line in reversed(result.stderr.splitlines()):
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1000
+    raise ValueError(f"Import time of {module} was not reported.")
+
+
+def measure_first_access(environment: dict[str, str]) -> float:
+    """
+    Returns the time in milliseconds of the first access to the lazily built attribute tables of models.
+    """
+    code = ("import time, models; start = time.perf_counter(); models.account_attributes_and_types; "
+            "models.Transaction.ITEM_CATEOGIRES; print((time.perf_counter() - start) * 1000)")
+    result = subprocess.run([sys.executable, "-c", code],
+                            cwd=ROOT, env=environment, capture_output=True, text=True, check=True)
+    return float(result.stdout)
+
+
+def main() -> int:
+    over_budget = []
+
+    with tempfile.TemporaryDirectory() as cache_directory:
+        environment = interpreter_environment(cache_directory)
+        # warm-up run fills the bytecode cache
+        measure_import("models", environment)
+
+        print(f"{'module':<10} {'median ms':>10} {'budget ms':>10}")
+        for module, budget in IMPORT_BUDGET_MS.items():
+            elapsed = median(measure_import(module, environment)
+                             for _ in range(REPEAT))
+            print(f"{module:<10} {elapsed:>10.2f} {budget:>10.2f}")
+            if elapsed > budget:
+                over_budget.append(module)
+
+        first_access = median(measure_first_access(environment)
+                              for _ in range(REPEAT))
+        print(f"first access of lazy tables and categories: {first_access:.2f} ms")
+
+    if over_budget:
+        print(f"Over the import-time budget: {', '.join(over_budget)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
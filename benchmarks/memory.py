@@ -0,0 +1,106 @@
+"""
+Compares the memory taken per transaction and per account by the different representations of the models,
+and the construction time of the validating constructors against from_record.
+
+Run from the repository root:
+
+    python -m benchmarks.memory [count]
+
+The "dict layout" rows emulate the former representation of the models, an instance __dict__ holding the same
+underscore attributes, to show the difference made by the slotted models.
+"""
+from models import Account, Transaction
+from storage import ColumnarTransactionStore
+from utils import random_string_generator
+
+from datetime import date
+from time import perf_counter
+import sys
+import tracemalloc
+
+
+class DictLayout:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def measure(build, count: int) -> tuple[float, float]:
+    """
+    Builds count objects and returns the traced bytes and the construction time in microseconds per object.
+    """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    start = perf_counter()
+    objects = build(count)
+    elapsed = perf_counter() - start
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del objects
+    return allocated / count, elapsed / count * 1_000_000
+
+
+def transaction_ids(count: int) -> list[str]:
+    return [random_string_generator(length=20) for _ in range(count)]
+
+
+def benchmark_transactions(count: int) -> list[tuple[str, float, float]]:
+    # IDs are created upfront so that every representation is charged only for its own layout
+    ids = transaction_ids(count)
+    ordinal = date.today().toordinal()
+
+    def dict_layout(count):
+        return [DictLayout(testing_id=False, _transaction_id=ids[index], _user_id="1234567890", _cost=9.99,
+                           _payment_method="CARD", _item="coffee", _quantity=1, _item_category="GROCERIES",
+                           _vendor="cafe", _transaction_date=ordinal) for index in range(count)]
+
+    def validating(count):
+        return [Transaction("1234567890", 9.99, "CARD", "coffee", 1, "GROCERIES", "cafe") for _ in range(count)]
+
+    def from_record(count):
+        return [Transaction.from_record(ids[index], "1234567890", 9.99, "CARD", "coffee", 1, "GROCERIES", "cafe",
+                                        ordinal) for index in range(count)]
+
+    transactions = from_record(count)
+
+    def columnar(count):
+        store = ColumnarTransactionStore()
+        store.add_many(transactions[:count])
+        return store
+
+    return [("Transaction, dict layout", *measure(dict_layout, count)),
+            ("Transaction, slotted, __init__", *measure(validating, count)),
+            ("Transaction, slotted, from_record", *measure(from_record, count)),
+            ("ColumnarTransactionStore row", *measure(columnar, count))]
+
+
+def benchmark_accounts(count: int) -> list[tuple[str, float, float]]:
+    ordinal = date.today().toordinal()
+    ids = [str(1_000_000_000 + index) for index in range(count)]
+
+    def dict_layout(count):
+        return [DictLayout(testing_id=False, _id=ids[index], _name="Jan", _second_name="Kowalski",
+                           _balance_cash=100.0, _balance_card=250.0, _account_created_date=ordinal)
+                for index in range(count)]
+
+    def validating(count):
+        return [Account("Jan", "Kowalski", 100.0, 250.0) for _ in range(count)]
+
+    def from_record(count):
+        return [Account.from_record(ids[index], "Jan", "Kowalski", 100.0, 250.0, ordinal) for index in range(count)]
+
+    return [("Account, dict layout", *measure(dict_layout, count)),
+            ("Account, slotted, __init__", *measure(validating, count)),
+            ("Account, slotted, from_record", *measure(from_record, count))]
+
+
+def main(count: int = 100_000) -> None:
+    print(f"{count} objects per row")
+    print(f"{'representation':<36} {'bytes/object':>13} {'us/object':>10}")
+    for name, size, elapsed in benchmark_transactions(count) + benchmark_accounts(count):
+        print(f"{name:<36} {size:>13.1f} {elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,149 @@
+"""
+Measures how long OperationLog takes to recover a logged history, replaying the whole log and loading a snapshot
+followed by a log tail, and how much logging slows down registering transactions.
+
+Run from the repository root:
+
+    python -m benchmarks.oplog_recovery [operations] [tail] [directory]
+
+The log of the given number of operations, 50 million by default, is generated directly in the record format,
+the way the managers log it: every added transaction writes the transaction and the updated account and, once the
+number of live transactions reaches LIVE_TRANSACTIONS, the oldest one is reversed, which writes the reversal and the
+updated account. The generated log takes about 70 bytes per operation on disk.
+"""
+from models import Account, AccountManager, Transaction, TransactionManager
+from oplog import OperationLog, encode_account, encode_transaction, encode_transaction_reverse
+from ids import TRANSACTION_IDS
+
+from collections import deque
+from datetime import date
+from time import perf_counter
+import gc
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+
+ACCOUNTS = 10_000
+LIVE_TRANSACTIONS = 1_000_000
+RECORDS_PER_WRITE = 100_000
+REGISTERED_TRANSACTIONS = 100_000
+
+
+def generate_log(path: str, operations: int, accounts: list[Account], live: deque, seed: int = 0) -> None:
+    # the live transactions are never garbage, the collector would only scan them again and again
+    gc.disable()
+    generator = random.Random(seed)
+    ordinal = date.today().toordinal()
+    new_id = TRANSACTION_IDS.generate
+    records = []
+    written = 0
+
+    with open(path, "ab") as f:
+        while written < operations:
+            if len(live) >= LIVE_TRANSACTIONS:
+                account, transaction = live.popleft()
+                account._balance_card += transaction.cost
+                records.append(encode_transaction_reverse(
+                    account.id, transaction.transaction_id))
+            else:
+                account = accounts[generator.randrange(len(accounts))]
+                transaction = Transaction.from_record(new_id(), account.id, generator.randint(1, 100), "CARD",
+                                                      "item", 1, "GROCERIES", "vendor", ordinal)
+                account._balance_card -= transaction.cost
+                live.append((account, transaction))
+                records.append(encode_transaction(transaction))
+            records.append(encode_account(account))
+            written += 2
+
+            if len(records) >= RECORDS_PER_WRITE:
+                f.write(b"".join(records))
+                records.clear()
+        f.write(b"".join(records))
+    gc.enable()
+
+
+def timed_recovery(directory: str) -> tuple[float, AccountManager, TransactionManager]:
+    start = perf_counter()
+    account_manager, transaction_manager = OperationLog(directory).recover()
+    return perf_counter() - start, account_manager, transaction_manager
+
+
+def registration_overhead(directory: str) -> tuple[float, float]:
+    """
+    Returns microseconds per registered transaction without and with the operation log attached.
+    """
+    timings = []
+    for logged in (False, True):
+        account_manager = AccountManager()
+        account_manager.create_account("Log", "Bench", 0, 10 ** 9)
+        transaction_manager = TransactionManager(account_manager)
+        user_id = next(iter(account_manager.accounts))
+        log = OperationLog(os.path.join(directory, "overhead"),
+                           snapshot_every=None)
+        if logged:
+            log.attach(account_manager, transaction_manager)
+
+        start = perf_counter()
+        for _ in range(REGISTERED_TRANSACTIONS):
+            transaction_manager.add_transcation(
+                Transaction(user_id, 5, "CARD", "item", 1, "GROCERIES", "vendor"))
+        log.close()
+        timings.append((perf_counter() - start) /
+                       REGISTERED_TRANSACTIONS * 1_000_000)
+    return timings[0], timings[1]
+
+
+def main(operations: int = 50_000_000, tail: int = 1_000_000, directory: str = None) -> None:
+    directory = directory or tempfile.mkdtemp(prefix="oplog-benchmark-")
+    log_directory = os.path.join(directory, "log")
+    os.makedirs(log_directory, exist_ok=True)
+    try:
+        # measured first, before the generated history fills the heap
+        without_log, with_log = registration_overhead(directory)
+        print(f"add_transcation:      {without_log:8.2f} us without the log, {with_log:.2f} us with the log")
+
+        accounts = [Account.from_record(str(1_000_000_000 + index), "Log", "Bench", 0, 10 ** 12, date.today().toordinal())
+                    for index in range(ACCOUNTS)]
+        with open(os.path.join(log_directory, "oplog-00000000.log"), "wb") as f:
+            f.write(b"".join(encode_account(account) for account in accounts))
+        live = deque()
+
+        start = perf_counter()
+        generate_log(os.path.join(log_directory, "oplog-00000000.log"),
+                     operations, accounts, live)
+        size = sum(os.path.getsize(os.path.join(log_directory, name))
+                   for name in os.listdir(log_directory))
+        print(f"generated {operations:,} operations, {size / 2 ** 20:,.0f} MiB, "
+              f"in {perf_counter() - start:.1f} s")
+
+        elapsed, account_manager, transaction_manager = timed_recovery(
+            log_directory)
+        print(f"full replay:          {elapsed:8.2f} s  {operations / elapsed:>12,.0f} operations/s  "
+              f"{len(account_manager.accounts):,} accounts, {len(transaction_manager.store):,} transactions")
+
+        log = OperationLog(log_directory, snapshot_every=None)
+        log.attach(account_manager, transaction_manager)
+        start = perf_counter()
+        log.snapshot()
+        print(f"snapshot:             {perf_counter() - start:8.2f} s")
+        segment = log.segment_path(log.segment)
+        log.close()
+        del account_manager, transaction_manager
+
+        generate_log(segment, tail, accounts, live, seed=1)
+        elapsed, account_manager, transaction_manager = timed_recovery(
+            log_directory)
+        print(f"snapshot + {tail:,} tail: {elapsed:8.2f} s  "
+              f"{len(account_manager.accounts):,} accounts, {len(transaction_manager.store):,} transactions")
+        del account_manager, transaction_manager
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    main(*(int(argument) for argument in arguments[:2]),
+         *arguments[2:3])
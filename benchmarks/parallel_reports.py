@@ -0,0 +1,93 @@
+"""
+Measures how the rollups of SpendingRollups scale with the number of worker processes of parallel_rollups.
+
+Run from the repository root:
+
+    python -m benchmarks.parallel_reports [transactions] [users] [max_workers]
+
+A ColumnarTransactionStore is filled with the given number of transactions, 2 million by default, spread over the
+users and over a year of dates. The rollups are then computed by a single-process scan, SpendingRollups.rebuild,
+and by parallel_rollups with 1, 2, 4, ... workers up to max_workers, os.cpu_count() by default. Every parallel
+result is checked against the scan. Speedup and efficiency are relative to parallel_rollups with one worker.
+Writing the column file and merging the partial rollups run in the parent process and are included in the timings,
+so they bound the speedup from above (Amdahl's law). The write is a copy of the columns, the merge grows with the
+number of distinct rollup keys rather than with the number of transactions.
+"""
+from models import AccountManager, Transaction, TransactionManager
+from reports import SpendingRollups, export_columns, parallel_rollups
+from storage import ColumnarTransactionStore
+from config import CATEGORIES
+
+from datetime import date
+from math import isclose
+from time import perf_counter
+import os
+import random
+import sys
+import tempfile
+
+
+def fill(store: ColumnarTransactionStore, transactions: int, users: int, seed: int = 0) -> None:
+    generator = random.Random(seed)
+    categories = [CATEGORIES.code(category)
+                  for category in CATEGORIES.categories()]
+    today = date.today().toordinal()
+    for index in range(transactions):
+        store.add(Transaction.from_record(f"R{index:012d}", f"U{generator.randrange(users):06d}",
+                                          generator.randint(1, 500), generator.choice(Transaction.PAYMENT_METHODS),
+                                          "item", 1, generator.choice(categories), "vendor",
+                                          today - generator.randrange(365)))
+
+
+def matches(expected: SpendingRollups, rollups: dict) -> bool:
+    for name in SpendingRollups.ROLLUPS:
+        scanned, computed = getattr(expected, name), rollups[name]
+        if scanned.keys() != computed.keys():
+            return False
+        for key, (total, count) in scanned.items():
+            if computed[key][1] != count or not isclose(computed[key][0], total, rel_tol=1e-9, abs_tol=1e-6):
+                return False
+    return True
+
+
+def main(transactions: int = 2_000_000, users: int = 10_000, max_workers: int = None) -> int:
+    max_workers = max_workers or os.cpu_count() or 1
+    transaction_manager = TransactionManager(
+        AccountManager(), ColumnarTransactionStore())
+    start = perf_counter()
+    fill(transaction_manager.store, transactions, users)
+    print(f"{transactions:,} transactions of {users:,} users generated in {perf_counter() - start:.1f} s, "
+          f"{os.cpu_count()} CPUs")
+
+    start = perf_counter()
+    expected = SpendingRollups(transaction_manager)
+    elapsed = perf_counter() - start
+    print(f"single-process scan: {elapsed:8.2f} s  {transactions / elapsed:>12,.0f} transactions/s")
+
+    with tempfile.TemporaryFile() as f:
+        start = perf_counter()
+        export_columns(transaction_manager.store, f)
+        print(f"column file export:  {perf_counter() - start:8.2f} s")
+
+    failed = False
+    baseline = None
+    workers = 1
+    while True:
+        start = perf_counter()
+        rollups = parallel_rollups(transaction_manager, workers)
+        elapsed = perf_counter() - start
+        baseline = baseline or elapsed
+        correct = matches(expected, rollups)
+        failed = failed or not correct
+        print(f"{workers:3} workers:         {elapsed:8.2f} s  {transactions / elapsed:>12,.0f} transactions/s  "
+              f"speedup {baseline / elapsed:5.2f}  efficiency {baseline / elapsed / workers:6.1%}"
+              f"{'' if correct else '  ROLLUPS DIFFER'}")
+        if workers >= max_workers:
+            break
+        workers = min(workers * 2, max_workers)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    arguments = [int(argument) for argument in sys.argv[1:4]]
+    sys.exit(main(*arguments))
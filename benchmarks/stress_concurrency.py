@@ -0,0 +1,134 @@
+"""
+Posts and reverses transactions from many threads at once through ConcurrentTransactionManager and checks
+the balance invariants afterwards.
+
+Run from the repository root:
+
+    python -m benchmarks.stress_concurrency [operations] [threads] [accounts]
+
+Every thread posts transactions to random accounts, a few of them hot so that threads keep colliding on the same
+accounts, and reverses some of the transactions it posted. The thread switch interval is lowered to interleave
+the threads as often as possible. Afterwards every account must satisfy:
+
+    initial balance - cost of its stored transactions = current balance, for cash and card separately
+
+no balance may be negative and the store must hold exactly the posted and not reversed transactions.
+Exits with status 1 if any invariant is broken.
+"""
+from concurrency import ConcurrentTransactionManager
+from models import AccountManager, Transaction
+
+from math import isclose
+from time import perf_counter
+import random
+import sys
+import threading
+
+
+HOT_ACCOUNTS = 4
+HOT_SHARE = 0.2
+REVERSE_SHARE = 0.3
+
+
+def worker(manager: ConcurrentTransactionManager, account_ids: list, operations: int, seed: int,
+           counters: dict, errors: list) -> None:
+    generator = random.Random(seed)
+    posted = []
+    rejected = 0
+    try:
+        for _ in range(operations):
+            if posted and generator.random() < REVERSE_SHARE:
+                user_id, transaction_id = posted.pop(
+                    generator.randrange(len(posted)))
+                manager.reverse_transaction(user_id, transaction_id)
+                continue
+
+            if generator.random() < HOT_SHARE:
+                user_id = account_ids[generator.randrange(HOT_ACCOUNTS)]
+            else:
+                user_id = generator.choice(account_ids)
+            transaction = Transaction(user_id, generator.randint(1, 50), generator.choice(("CARD", "CASH")),
+                                      "item", 1, "GROCERIES", "vendor")
+            try:
+                manager.add_transcation(transaction)
+            except ValueError:
+                # posting more than the balance allows is rejected, which is part of what is stressed
+                rejected += 1
+            else:
+                posted.append((user_id, transaction.transaction_id))
+    except Exception as e:
+        errors.append(e)
+
+    with counters["lock"]:
+        counters["live"] += len(posted)
+        counters["rejected"] += rejected
+
+
+def check_invariants(manager: ConcurrentTransactionManager, initial: dict, live: int) -> list[str]:
+    problems = []
+    stored = 0
+    for user_id, (balance_cash, balance_card) in initial.items():
+        account = manager.account_manager.get_account(user_id)
+        spent = {"CASH": 0, "CARD": 0}
+        for transaction in manager.store.get_user_transactions(user_id) or []:
+            spent[transaction.payment_method] += transaction.cost
+            stored += 1
+
+        if account.balance_cash < 0 or account.balance_card < 0:
+            problems.append(f"Account {user_id} has a negative balance.")
+        if not isclose(balance_cash - spent["CASH"], account.balance_cash, abs_tol=1e-6):
+            problems.append(
+                f"Cash balance of account {user_id} is {account.balance_cash}, {balance_cash - spent['CASH']} was expected.")
+        if not isclose(balance_card - spent["CARD"], account.balance_card, abs_tol=1e-6):
+            problems.append(
+                f"Card balance of account {user_id} is {account.balance_card}, {balance_card - spent['CARD']} was expected.")
+
+    if stored != live or len(manager.store) != live:
+        problems.append(
+            f"Store holds {stored} transactions, {live} were posted and not reversed.")
+    return problems
+
+
+def main(operations: int = 1_000_000, threads: int = 8, accounts: int = 200) -> int:
+    random.seed(0)
+    account_manager = AccountManager()
+    for _ in range(accounts):
+        account_manager.create_account(
+            "Stress", "Test", random.randint(0, 5_000), random.randint(0, 5_000))
+    manager = ConcurrentTransactionManager(account_manager)
+
+    account_ids = list(account_manager.accounts)
+    initial = {account.id: (account.balance_cash, account.balance_card)
+               for account in account_manager.get_accounts()}
+    counters = {"lock": threading.Lock(), "live": 0, "rejected": 0}
+    errors = []
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    start = perf_counter()
+    workers = [threading.Thread(target=worker, args=(manager, account_ids, operations // threads, seed, counters, errors))
+               for seed in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = perf_counter() - start
+    sys.setswitchinterval(switch_interval)
+
+    problems = [f"Worker failed: {error!r}" for error in errors]
+    problems += check_invariants(manager, initial, counters["live"])
+
+    total = operations // threads * threads
+    print(f"{total} operations, {threads} threads, {accounts} accounts in {elapsed:.2f} s "
+          f"({total / elapsed:,.0f} operations/s)")
+    print(
+        f"{counters['live']} transactions stored, {counters['rejected']} rejected by the balance validation")
+    for problem in problems[:20]:
+        print(problem)
+    print("invariants broken" if problems else "invariants hold")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    arguments = [int(argument) for argument in sys.argv[1:4]]
+    sys.exit(main(*arguments))
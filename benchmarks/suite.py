@@ -0,0 +1,324 @@
+"""
+Benchmark suite of the hot paths of models.py, with results written as JSON and compared against a baseline.
+
+Run from the repository root:
+
+    python -m benchmarks.suite [--sizes 1000 10000 100000] [--cases ...] [--repeat 3] [--seed 0]
+                               [--output results.json] [--baseline baseline.json]
+                               [--time-tolerance 0.2] [--memory-tolerance 0.1]
+
+Every case is run at every size, 10**3 to 10**5 rows by default, sizes up to 10**7 can be given with --sizes.
+Accounts and transactions are generated by benchmarks.generator from the seed, so runs with the same arguments
+work on the same data. Each run of a case happens in a fresh interpreter, which keeps runs from affecting each other
+and lets the peak resident memory of the run be read from the operating system. The run builds the rows of its
+size, which is not timed, then times a batch of operations: 10,000 calls of point operations, reversals are limited
+to the number of transactions, and a few calls of the filters, which scan all accounts. Operations which do not
+change the rows are run once before they are timed. The median time per operation of the repeated runs is reported.
+
+Every run also times a fixed pure-Python workload right before and after its batch. With --baseline, every case and
+size found in the baseline is compared with it and the run fails, with exit status 1, if an operation got slower
+relative to that workload than the time tolerance or if the peak memory grew more than the memory tolerance.
+A baseline is simply the --output file of an earlier run.
+"""
+from benchmarks.generator import DataGenerator, name
+from utils import format_date
+
+from statistics import median
+from time import perf_counter
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = (10 ** 3, 10 ** 4, 10 ** 5)
+POINT_OPERATIONS = 10_000
+# accounts of the transaction cases, one account per TRANSACTIONS_PER_ACCOUNT transactions
+TRANSACTIONS_PER_ACCOUNT = 20
+
+
+# cases which do not change the rows, they are run once before they are timed to warm up caches
+READ_ONLY = ("get_user_transaction", "filter_account_name",
+             "filter_account_balance", "filter_account_date")
+
+
+def scan_operations(size: int) -> int:
+    return max(3, min(100, 10 ** 6 // size))
+
+
+# every case builds its rows and returns the timed function and the number of operations it performs
+
+
+def create_account(generator: DataGenerator, size: int):
+    account_manager = generator.account_manager(size)
+    names = [(name(generator.random), name(generator.random))
+             for _ in range(POINT_OPERATIONS)]
+
+    def run():
+        for first_name, second_name in names:
+            account_manager.create_account(first_name, second_name, 100, 100)
+    return run, len(names)
+
+
+def transaction_fixture(generator: DataGenerator, size: int):
+    accounts = max(size // TRANSACTIONS_PER_ACCOUNT, 10)
+    transaction_manager = generator.transaction_manager(accounts, size)
+    transactions = [transaction for user_id in transaction_manager.store.users()
+                    for transaction in transaction_manager.store.get_user_transactions(user_id)]
+    return transaction_manager, transactions
+
+
+def create_transaction(generator: DataGenerator, size: int):
+    transaction_manager, _ = transaction_fixture(generator, size)
+    user_ids = generator.user_ids(list(transaction_manager.account_manager.accounts.values()),
+                                  POINT_OPERATIONS)
+
+    def run():
+        for user_id in user_ids:
+            transaction_manager.create_transaction(
+                user_id, 12.5, "CARD", "coffee", 1, "DINING_OUT", "Dining Out Vendor 1")
+    return run, len(user_ids)
+
+
+def get_user_transaction(generator: DataGenerator, size: int):
+    transaction_manager, transactions = transaction_fixture(generator, size)
+    targets = [(transaction.user_id, transaction.transaction_id)
+               for transaction in generator.random.choices(transactions, k=POINT_OPERATIONS)]
+
+    def run():
+        for user_id, transaction_id in targets:
+            transaction_manager.get_user_transaction(user_id, transaction_id)
+    return run, len(targets)
+
+
+def reverse_transaction(generator: DataGenerator, size: int):
+    transaction_manager, transactions = transaction_fixture(generator, size)
+    targets = [(transaction.user_id, transaction.transaction_id)
+               for transaction in generator.random.sample(transactions, min(size, POINT_OPERATIONS))]
+
+    def run():
+        for user_id, transaction_id in targets:
+            transaction_manager.reverse_transaction(user_id, transaction_id)
+    return run, len(targets)
+
+
+def update_account(generator: DataGenerator, size: int):
+    account_manager = generator.account_manager(size)
+    ids = list(account_manager.accounts)
+    updates = [(generator.random.choice(ids), {"name": name(generator.random)} if index % 2
+                else {"balance_cash": round(generator.random.uniform(0, 10_000), 2)})
+               for index in range(POINT_OPERATIONS)]
+
+    def run():
+        for account_id, fields in updates:
+            account_manager.update_account(account_id, fields)
+    return run, len(updates)
+
+
+def filter_account_name(generator: DataGenerator, size: int):
+    account_manager = generator.account_manager(size)
+    accounts = list(account_manager.accounts.values())
+    searches = [generator.random.choice(accounts).name
+                for _ in range(scan_operations(size))]
+
+    def run():
+        for index, searched in enumerate(searches):
+            # exact and pattern searches alternate
+            account_manager.filter_account_name(
+                pattern_search=bool(index % 2), name=searched if index % 2 == 0 else searched[:3])
+    return run, len(searches)
+
+
+def filter_account_balance(generator: DataGenerator, size: int):
+    account_manager = generator.account_manager(size)
+    thresholds = [round(generator.random.lognormvariate(7, 1.5), 2)
+                  for _ in range(scan_operations(size))]
+
+    def run():
+        for index, threshold in enumerate(thresholds):
+            if index % 2:
+                account_manager.filter_account_balance(
+                    total=True, total_under=True, balance_cash=threshold, balance_card=10 ** 7)
+            else:
+                account_manager.filter_account_balance(
+                    cash_under=True, balance_cash=threshold)
+    return run, len(thresholds)
+
+
+def filter_account_date(generator: DataGenerator, size: int):
+    account_manager = generator.account_manager(size)
+    accounts = list(account_manager.accounts.values())
+    ranges = []
+    for index in range(scan_operations(size)):
+        start = generator.random.choice(accounts).account_created_ordinal
+        # single days and quarters alternate
+        ranges.append((format_date(start), format_date(start + 90) if index % 2 else None))
+
+    def run():
+        for start, end in ranges:
+            account_manager.filter_account_date(start, end)
+    return run, len(ranges)
+
+
+CASES = {case.__name__: case for case in (create_account, create_transaction, get_user_transaction,
+                                          reverse_transaction, update_account, filter_account_name,
+                                          filter_account_balance, filter_account_date)}
+
+
+def calibrate() -> float:
+    """
+    Times a fixed pure-Python workload. Times of the operations are compared with a baseline relative to it, so
+    a machine that is faster or slower as a whole, e.g. because of frequency scaling or other load, does not show as
+    a change of the code.
+    """
+    start = perf_counter()
+    for _ in range(5):
+        table = {}
+        for index in range(20_000):
+            table[str(index)] = [index, index * 0.5]
+        sorted(table.items(), key=lambda item: item[1][1], reverse=True)
+    return perf_counter() - start
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_case(case: str, size: int, seed: int) -> dict:
+    """
+    Builds the rows of a case and times its operations, in the current process.
+    """
+    generator = DataGenerator(seed)
+    start = perf_counter()
+    run, operations = CASES[case](generator, size)
+    setup = perf_counter() - start
+    if case in READ_ONLY:
+        run()
+
+    calibration = calibrate()
+    start = perf_counter()
+    run()
+    elapsed = perf_counter() - start
+    calibration = min(calibration, calibrate())
+    return {"case": case, "size": size, "operations": operations, "seconds": elapsed, "setup_seconds": setup,
+            "calibration_seconds": calibration, "peak_rss_bytes": peak_rss_bytes()}
+
+
+def run_isolated(case: str, size: int, seed: int) -> dict:
+    """
+    Runs a case in a fresh interpreter and returns its measurements.
+
+    Raises:
+        RuntimeError: If the run fails.
+    """
+    completed = subprocess.run([sys.executable, "-m", "benchmarks.suite", "--run-case", case, "--sizes", str(size),
+                                "--seed", str(seed)], cwd=ROOT, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(
+            f"Benchmark {case} at {size} rows failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def run_suite(cases: list[str], sizes: list[int], repeat: int, seed: int) -> dict:
+    results = []
+    for size in sizes:
+        for case in cases:
+            runs = [run_isolated(case, size, seed) for _ in range(repeat)]
+            per_operation = [run["seconds"] / run["operations"]
+                             for run in runs]
+            result = {"case": case, "size": size, "operations": runs[0]["operations"],
+                      "seconds_per_operation": median(per_operation), "runs": per_operation,
+                      "setup_seconds": median(run["setup_seconds"] for run in runs),
+                      "relative_time": median(run["seconds"] / run["operations"] / run["calibration_seconds"]
+                                              for run in runs),
+                      "peak_rss_bytes": max(run["peak_rss_bytes"] for run in runs)}
+            results.append(result)
+            print(f"{case:24} {size:>10,} rows  {result['seconds_per_operation'] * 1e6:12.2f} us/op  "
+                  f"{result['peak_rss_bytes'] / 2 ** 20:8.1f} MiB peak", flush=True)
+    return {"environment": {"python": platform.python_version(), "implementation": platform.python_implementation(),
+                            "platform": platform.platform(), "machine": platform.machine(),
+                            "cpus": os.cpu_count()},
+            "seed": seed, "repeat": repeat, "results": results}
+
+
+def compare(results: dict, baseline: dict, time_tolerance: float, memory_tolerance: float) -> list[str]:
+    """
+    Compares results with a baseline.
+
+    Returns:
+        list: Description of every regression, empty if there is none.
+    """
+    previous = {(result["case"], result["size"]): result for result in baseline["results"]}
+    regressions = []
+    print(f"\n{'case':24} {'rows':>10}  {'time':>8}  {'memory':>8}")
+    for result in results["results"]:
+        reference = previous.get((result["case"], result["size"]))
+        if reference is None:
+            continue
+        time_ratio = result["relative_time"] / reference["relative_time"]
+        memory_ratio = result["peak_rss_bytes"] / reference["peak_rss_bytes"]
+        flags = []
+        if time_ratio > 1 + time_tolerance:
+            flags.append("SLOWER")
+        if memory_ratio > 1 + memory_tolerance:
+            flags.append("MORE MEMORY")
+        print(f"{result['case']:24} {result['size']:>10,}  {time_ratio:7.2f}x  {memory_ratio:7.2f}x  "
+              f"{' '.join(flags)}")
+        if flags:
+            regressions.append(f"{result['case']} at {result['size']:,} rows: {time_ratio:.2f}x time, "
+                               f"{memory_ratio:.2f}x peak memory")
+    return regressions
+
+
+def main(arguments: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.suite", description="Benchmarks of the hot paths of models.py.")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=list(DEFAULT_SIZES))
+    parser.add_argument("--cases", nargs="+",
+                        choices=list(CASES), default=list(CASES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="path of the JSON results")
+    parser.add_argument("--baseline", help="path of the JSON results of an earlier run to compare with")
+    parser.add_argument("--time-tolerance", type=float, default=0.2,
+                        help="allowed relative slowdown per operation")
+    parser.add_argument("--memory-tolerance", type=float, default=0.1,
+                        help="allowed relative growth of the peak memory")
+    parser.add_argument("--run-case", choices=list(CASES),
+                        help=argparse.SUPPRESS)
+    options = parser.parse_args(arguments)
+
+    if options.run_case:
+        print(json.dumps(run_case(options.run_case, options.sizes[0], options.seed)))
+        return 0
+
+    baseline = None
+    if options.baseline:
+        with open(options.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = run_suite(options.cases, options.sizes,
+                        options.repeat, options.seed)
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None:
+        regressions = compare(results, baseline,
+                              options.time_tolerance, options.memory_tolerance)
+        if regressions:
+            print("\nREGRESSIONS:\n" + "\n".join(regressions))
+            return 1
+        print("\nno regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
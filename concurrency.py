@@ -0,0 +1,151 @@
+from models import Account, AccountManager, Transaction, TransactionManager, BulkResult
+from stats import AccountStats
+
+from contextlib import contextmanager, ExitStack
+from typing import Iterable, Iterator, Union
+import threading
+
+
+class StripedLocks:
+    """
+    A fixed set of reentrant locks shared by many keys, every key is guarded by the lock of its stripe.
+
+    Keys of different stripes are locked independently, so the number of stripes bounds how many keys can be
+    worked on at once while the memory taken by the locks does not grow with the number of keys.
+
+    Attributes:
+        locks (list): The locks of the stripes.
+    """
+
+    def __init__(self, stripes: int = 64):
+        if not isinstance(stripes, int) or stripes < 1:
+            raise ValueError("Number of stripes should be a positive integer.")
+        self.locks = [threading.RLock() for _ in range(stripes)]
+
+    def stripe(self, key) -> int:
+        return hash(key) % len(self.locks)
+
+    def lock(self, key) -> threading.RLock:
+        return self.locks[self.stripe(key)]
+
+    @contextmanager
+    def acquire_many(self, keys: Iterable):
+        """
+        Holds the locks of all given keys. Locks are always acquired in the order of their stripes,
+        so threads locking overlapping sets of keys cannot deadlock.
+        """
+        with ExitStack() as stack:
+            for stripe in sorted({self.stripe(key) for key in keys}):
+                stack.enter_context(self.locks[stripe])
+            yield
+
+    @contextmanager
+    def acquire_all(self):
+        with ExitStack() as stack:
+            for lock in self.locks:
+                stack.enter_context(lock)
+            yield
+
+
+class ConcurrentTransactionManager(TransactionManager):
+    """
+    TransactionManager which can be used from many threads at once, e.g. by a thread pool serving web requests.
+
+    Every account is guarded by the lock of its stripe, so the read, the validation and the write of its balances
+    happen as one step and transactions of different accounts are posted independently. Structures shared by all
+    accounts, the transaction store, the accounts storage with its indexes and the listeners, are guarded by a single
+    lock held only for the short moments they are touched. Locks are always taken in the same order, the stripes of
+    the accounts first and the shared lock last.
+
+    Listeners are called while both the account and the shared lock are held, so they are never called concurrently.
+    Bulk inserts lock all stripes.
+
+    Attributes:
+        account_locks (StripedLocks): Locks of the accounts.
+        shared_lock (threading.RLock): Lock of the structures shared by all accounts.
+    """
+
+    def __init__(self, account_manager: AccountManager, store=None, stripes: int = 64):
+        super().__init__(account_manager, store)
+        self.account_locks = StripedLocks(stripes)
+        self.shared_lock = threading.RLock()
+
+    def account_lock(self, user_id) -> threading.RLock:
+        """
+        Returns the lock of an account, to be held by code which changes the account outside of the manager.
+        """
+        return self.account_locks.lock(user_id)
+
+    def add_transcation(self, transaction: Transaction) -> None:
+        if not isinstance(transaction, Transaction):
+            raise TypeError(
+                f"Transaction object is expected, {type(transaction)} instance was given")
+
+        user_id = transaction.user_id
+        with self.account_locks.lock(user_id):
+            self.validate_account(user_id)
+            account = self.account_manager.get_account(user_id)
+
+            # the balance changes under the shared lock too, so a snapshot of the operation log never sees the
+            # balance without the transaction, and the account is saved after the listeners like in TransactionManager
+            with self.shared_lock:
+                self.update_balance(account, transaction, save=False)
+                self.store.add(transaction)
+                for listener in self.listeners:
+                    listener.transaction_added(transaction)
+                self.account_manager.save_account(account)
+
+    def update_balance(self, account: Account, transaction: Transaction, reverse=False, save=True):
+        with self.account_locks.lock(account.id):
+            cost = transaction.cost if reverse else -transaction.cost
+            # the new balance is validated by the setter before it is stored, so a rejected update changes nothing
+            if transaction.payment_method == "CARD":
+                account.balance_card = account.balance_card + cost
+            else:
+                account.balance_cash = account.balance_cash + cost
+
+            if save:
+                with self.shared_lock:
+                    self.account_manager.save_account(account)
+
+    def reverse_transaction(self, user_id, transaction_id):
+        with self.account_locks.lock(user_id):
+            account = self.account_manager.get_account(user_id)
+
+            # the store, the balance and the listeners change under one hold of the shared lock, so a snapshot of the
+            # operation log never sees one without the other
+            with self.shared_lock:
+                transaction = self.store.remove(user_id, transaction_id)
+
+                if transaction is not None:
+                    self.update_balance(account, transaction, reverse=True, save=False)
+
+                    for listener in self.listeners:
+                        listener.transaction_reversed(transaction)
+                    self.account_manager.save_account(account)
+
+    def create_transactions_bulk(self, rows) -> BulkResult:
+        with self.account_locks.acquire_all(), self.shared_lock:
+            return super().create_transactions_bulk(rows)
+
+    def get_user_transactions(self, user_id):
+        with self.account_locks.lock(user_id), self.shared_lock:
+            transactions = super().get_user_transactions(user_id)
+            # a copy is returned, the stored list keeps changing while other threads post transactions
+            return list(transactions) if transactions is not None else None
+
+    def get_user_transaction(self, user_id, transaction_id) -> Union[Transaction, None]:
+        with self.shared_lock:
+            return super().get_user_transaction(user_id, transaction_id)
+
+    def get_account_stats(self, user_id) -> Union[AccountStats, None]:
+        with self.shared_lock:
+            stats = super().get_account_stats(user_id)
+            # a copy is returned, the aggregates keep changing while other threads post transactions
+            return stats.copy() if stats is not None else None
+
+    def query(self, predicate=None, fields: Iterable[str] = None, order_by=None, limit: int = None, offset: int = 0,
+              **filters) -> Iterator:
+        with self.shared_lock:
+            # results are collected under the lock, a lazy iterator would read the store while other threads change it
+            return iter(list(super().query(predicate, fields, order_by, limit, offset, **filters)))
@@ -1,7 +1,16 @@
 import json
+import os
+import time
 
 
-def load_item_categories(path="./categories.json"):
+CATEGORIES_PATH = "./categories.json"
+# how often, in seconds, categories.json is checked for changes
+CATEGORIES_CHECK_INTERVAL = 1.0
+
+_categories_cache = {}
+
+
+def load_item_categories(path=CATEGORIES_PATH):
     try:
         with open(path, "r") as f:
             read_json = json.loads(f.read())
@@ -21,4 +30,130 @@ def load_item_categories(path="./categories.json"):
     return categories
 
 
-ITEM_CATEGORIES = load_item_categories()
+def categories_signature(path=CATEGORIES_PATH) -> tuple[int, int]:
+    """
+    Returns modification time and size of the categories file, which change whenever the file is edited.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError as e:
+        raise FileNotFoundError(
+            "There was problem fetching the categories from categories.json.") from e
+    return stat.st_mtime_ns, stat.st_size
+
+
+def get_item_categories(path=CATEGORIES_PATH) -> list[str]:
+    """
+    Returns the item categories, categories.json is read on first use and read again only after it changed.
+    The file is checked for changes at most once every CATEGORIES_CHECK_INTERVAL seconds.
+    """
+    cached = _categories_cache.get(path)
+    now = time.monotonic()
+    if cached is not None and now - cached["checked"] < CATEGORIES_CHECK_INTERVAL:
+        return cached["categories"]
+
+    signature = categories_signature(path)
+    if cached is None or cached["signature"] != signature:
+        cached = {"signature": signature,
+                  "categories": load_item_categories(path)}
+        _categories_cache[path] = cached
+    cached["checked"] = now
+    return cached["categories"]
+
+
+class CategoryRegistry:
+    """
+    Interns item categories to small integer codes.
+
+    Codes are assigned in the order in which categories appear in categories.json and stay the same while the process
+    runs. The registry follows changes of the file without a restart: added categories get new codes, removed ones
+    keep their codes so already stored transactions still decode, but they are no longer accepted.
+
+    Attributes:
+        path (str): Path of the categories file.
+        names (list): Names of all interned categories, the position in the list is the category's code.
+        codes (dict): Codes of all interned categories, keyed by name.
+        accepted (dict): Codes of the categories currently listed in the categories file, keyed by name.
+
+    Methods:
+        code: Returns the code of an accepted category.
+        name: Returns the name of a code.
+        intern: Returns the code of any category, assigning a new code if needed.
+        categories: Returns the accepted categories.
+        reload: Reads the categories file again right away.
+    """
+
+    def __init__(self, path: str = CATEGORIES_PATH):
+        self.path = path
+        self.names = []
+        self.codes = {}
+        self.accepted = {}
+        self._loaded = None
+
+    def refresh(self) -> None:
+        # get_item_categories returns the same list object until the file changes
+        categories = get_item_categories(self.path)
+        if categories is not self._loaded:
+            self.accepted = {name: self.intern(name) for name in categories}
+            self._loaded = categories
+
+    def reload(self) -> None:
+        _categories_cache.pop(self.path, None)
+        self.refresh()
+
+    def intern(self, name: str) -> int:
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def code(self, name: str) -> int:
+        """
+        Returns the code of an accepted category.
+
+        Raises:
+            ValueError: If the category is not listed in the categories file.
+        """
+        self.refresh()
+        try:
+            return self.accepted[name]
+        except (KeyError, TypeError):
+            raise ValueError(f"Category {name} is not supported category.")
+
+    def name(self, code: int) -> str:
+        return self.names[code]
+
+    def categories(self) -> list[str]:
+        self.refresh()
+        return self._loaded
+
+    def __contains__(self, name) -> bool:
+        self.refresh()
+        try:
+            return name in self.accepted
+        except TypeError:
+            return False
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self.accepted)
+
+
+CATEGORIES = CategoryRegistry()
+
+
+class ItemCategories:
+    """
+    Descriptor exposing the currently accepted item categories as a class attribute, they are loaded on first access.
+    """
+
+    def __get__(self, instance, owner=None) -> list[str]:
+        return CATEGORIES.categories()
+
+
+def __getattr__(name):
+    # ITEM_CATEGORIES used to be loaded when the module was imported, now it is loaded on first access
+    if name == "ITEM_CATEGORIES":
+        return get_item_categories()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,265 @@
+from models import Account, Transaction
+
+from collections.abc import MutableMapping
+from typing import Iterable, Union
+import sqlite3
+import weakref
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    id PRIMARY KEY,
+    name TEXT NOT NULL,
+    second_name TEXT NOT NULL,
+    balance_cash REAL NOT NULL,
+    balance_card REAL NOT NULL,
+    account_created_date TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    transaction_id UNIQUE NOT NULL,
+    user_id NOT NULL,
+    cost REAL NOT NULL,
+    payment_method TEXT NOT NULL,
+    item TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    item_category TEXT NOT NULL,
+    vendor TEXT NOT NULL,
+    transaction_date TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS transactions_user_id ON transactions (user_id);
+CREATE INDEX IF NOT EXISTS transactions_transaction_date ON transactions (transaction_date);
+CREATE INDEX IF NOT EXISTS transactions_item_category ON transactions (item_category);
+"""
+
+# statements are kept as module constants so that sqlite3 reuses its prepared statement cache for them
+UPSERT_ACCOUNT = """
+INSERT INTO accounts (id, name, second_name, balance_cash, balance_card, account_created_date)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    name = excluded.name,
+    second_name = excluded.second_name,
+    balance_cash = excluded.balance_cash,
+    balance_card = excluded.balance_card,
+    account_created_date = excluded.account_created_date
+"""
+SELECT_ACCOUNT = "SELECT id, name, second_name, balance_cash, balance_card, account_created_date FROM accounts WHERE id = ?"
+SELECT_ACCOUNTS = "SELECT id, name, second_name, balance_cash, balance_card, account_created_date FROM accounts"
+SELECT_ACCOUNT_IDS = "SELECT id FROM accounts"
+COUNT_ACCOUNTS = "SELECT COUNT(*) FROM accounts"
+DELETE_ACCOUNT = "DELETE FROM accounts WHERE id = ?"
+
+TRANSACTION_COLUMNS = "transaction_id, user_id, cost, payment_method, item, quantity, item_category, vendor, transaction_date"
+INSERT_TRANSACTION = f"INSERT INTO transactions ({TRANSACTION_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+SELECT_USER_TRANSACTIONS = f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE user_id = ? ORDER BY rowid"
+SELECT_TRANSACTION = f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE transaction_id = ? AND user_id = ?"
+SELECT_TRANSACTION_ID = "SELECT 1 FROM transactions WHERE transaction_id = ?"
+SELECT_TRANSACTION_USERS = "SELECT DISTINCT user_id FROM transactions"
+COUNT_TRANSACTIONS = "SELECT COUNT(*) FROM transactions"
+DELETE_TRANSACTION = "DELETE FROM transactions WHERE transaction_id = ? AND user_id = ?"
+
+
+class Database:
+    """
+    Local SQLite database file shared by the account and transaction repositories.
+
+    The connection runs in WAL mode, writes are buffered by the repositories and sent with executemany
+    once batch_size rows are pending or when commit is called.
+
+    Attributes:
+        path (str): Path of the SQLite file, ":memory:" can be used for a throwaway database.
+        batch_size (int): Number of buffered rows after which repositories flush their writes.
+        connection (sqlite3.Connection): The underlying connection.
+
+    Methods:
+        commit: Flushes all buffered writes of the registered repositories and commits them.
+        close: Commits and closes the connection.
+    """
+
+    def __init__(self, path: str = "./finance_manager.db", batch_size: int = 1000):
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError("Batch size should be a positive integer.")
+
+        self.path = path
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(path, cached_statements=128)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.repositories = []
+
+    def register(self, repository) -> None:
+        self.repositories.append(repository)
+
+    def commit(self) -> None:
+        for repository in self.repositories:
+            repository.flush()
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class AccountRepository(MutableMapping):
+    """
+    Accounts kept in the SQLite database, usable in place of the AccountManager.accounts dictionary:
+
+        account_manager = AccountManager(accounts=AccountRepository(database))
+
+    Loaded accounts are kept in an identity map, so the same Account object is returned while it is in use.
+    Modified accounts are written back through AccountManager.save_account and buffered until the next flush.
+    """
+
+    def __init__(self, database: Database):
+        self.database = database
+        self._loaded = weakref.WeakValueDictionary()
+        self._dirty = {}
+        database.register(self)
+
+    def __getitem__(self, id) -> Account:
+        account = self._dirty.get(id)
+        if account is None:
+            account = self._loaded.get(id)
+        if account is None:
+            row = self.database.connection.execute(
+                SELECT_ACCOUNT, (id,)).fetchone()
+            if row is None:
+                raise KeyError(id)
+            account = Account.from_record(*row)
+            self._loaded[id] = account
+        return account
+
+    def __setitem__(self, id, account: Account) -> None:
+        self._loaded[id] = account
+        self._dirty[id] = account
+        if len(self._dirty) >= self.database.batch_size:
+            self.flush()
+
+    def __delitem__(self, id) -> None:
+        self._dirty.pop(id, None)
+        cursor = self.database.connection.execute(DELETE_ACCOUNT, (id,))
+        if id not in self._loaded and cursor.rowcount == 0:
+            raise KeyError(id)
+        self._loaded.pop(id, None)
+
+    def __contains__(self, id) -> bool:
+        if id in self._dirty or id in self._loaded:
+            return True
+        return self.database.connection.execute(SELECT_ACCOUNT, (id,)).fetchone() is not None
+
+    def __iter__(self):
+        self.flush()
+        for (id,) in self.database.connection.execute(SELECT_ACCOUNT_IDS):
+            yield id
+
+    def __len__(self) -> int:
+        self.flush()
+        return self.database.connection.execute(COUNT_ACCOUNTS).fetchone()[0]
+
+    def values(self) -> list[Account]:
+        self.flush()
+        accounts = []
+        for row in self.database.connection.execute(SELECT_ACCOUNTS):
+            account = self._loaded.get(row[0])
+            if account is None:
+                account = Account.from_record(*row)
+                self._loaded[row[0]] = account
+            accounts.append(account)
+        return accounts
+
+    def flush(self) -> None:
+        if self._dirty:
+            self.database.connection.executemany(UPSERT_ACCOUNT, [
+                (account.id, account.name, account.second_name, account.balance_cash,
+                 account.balance_card, account.account_created_date)
+                for account in self._dirty.values()])
+            self._dirty.clear()
+
+
+class SQLiteTransactionStore:
+    """
+    Storage engine for TransactionManager that keeps transactions in the SQLite database:
+
+        transaction_manager = TransactionManager(account_manager, store=SQLiteTransactionStore(database))
+
+    New transactions are buffered and inserted with executemany, any read flushes the buffer first.
+    """
+
+    def __init__(self, database: Database):
+        self.database = database
+        self._pending = []
+        self._pending_ids = set()
+        database.register(self)
+
+    @property
+    def transactions(self) -> dict:
+        return {user_id: self.get_user_transactions(user_id) for user_id in self.users()}
+
+    def add(self, transaction: Transaction) -> None:
+        self._pending.append(self.to_record(transaction))
+        self._pending_ids.add(transaction.transaction_id)
+        if len(self._pending) >= self.database.batch_size:
+            self.flush()
+
+    def add_many(self, transactions: Iterable[Transaction]) -> None:
+        start = len(self._pending)
+        self._pending.extend(self.to_record(transaction)
+                             for transaction in transactions)
+        self._pending_ids.update(record[0] for record in self._pending[start:])
+        if len(self._pending) >= self.database.batch_size:
+            self.flush()
+
+    def get_user_transactions(self, user_id) -> Union[list[Transaction], None]:
+        self.flush()
+        transactions = [Transaction.from_record(*row) for row in self.database.connection.execute(
+            SELECT_USER_TRANSACTIONS, (user_id,))]
+        return transactions if transactions else None
+
+    def get_transaction(self, user_id, transaction_id) -> Union[Transaction, None]:
+        self.flush()
+        row = self.database.connection.execute(
+            SELECT_TRANSACTION, (transaction_id, user_id)).fetchone()
+        if row is not None:
+            return Transaction.from_record(*row)
+
+    def remove(self, user_id, transaction_id) -> Union[Transaction, None]:
+        transaction = self.get_transaction(user_id, transaction_id)
+        if transaction is not None:
+            self.database.connection.execute(
+                DELETE_TRANSACTION, (transaction_id, user_id))
+        return transaction
+
+    def users(self) -> list:
+        self.flush()
+        return [user_id for (user_id,) in self.database.connection.execute(SELECT_TRANSACTION_USERS)]
+
+    def flush(self) -> None:
+        if self._pending:
+            self.database.connection.executemany(
+                INSERT_TRANSACTION, self._pending)
+            self._pending.clear()
+            self._pending_ids.clear()
+
+    def __contains__(self, transaction_id) -> bool:
+        # buffered transactions are checked without flushing them, so generating IDs does not break the batching
+        if transaction_id in self._pending_ids:
+            return True
+        return self.database.connection.execute(SELECT_TRANSACTION_ID, (transaction_id,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        self.flush()
+        return self.database.connection.execute(COUNT_TRANSACTIONS).fetchone()[0]
+
+    @staticmethod
+    def to_record(transaction: Transaction) -> tuple:
+        return (transaction.transaction_id, transaction.user_id, transaction.cost, transaction.payment_method,
+                transaction.item, transaction.quantity, transaction.item_category, transaction.vendor,
+                transaction.transaction_date)
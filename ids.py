@@ -0,0 +1,221 @@
+from bisect import bisect_left, bisect_right
+from string import ascii_letters, digits
+from typing import Iterable
+import os
+import threading
+import time
+import weakref
+
+
+# sorted in ASCII order, so IDs built from it compare like the numbers they encode
+BASE62 = digits + ascii_letters[26:] + ascii_letters[:26]
+# the characters of random strings, digits are repeated to pick them about as often as letters
+WEIGHTED_ALPHABET = ascii_letters + \
+    int(len(ascii_letters) / len(digits)) * digits
+# every two character string of BASE62, so numbers are encoded two characters at a time
+BASE62_PAIRS = [first + second for first in BASE62 for second in BASE62]
+
+
+class IdGenerator:
+    """
+    Generates random string IDs from a fixed alphabet.
+
+    Random bytes are read from os.urandom in batches and mapped to the alphabet through a precomputed translation
+    table. Bytes that would make some characters more likely than others are dropped, so every position of the
+    alphabet is equally likely, a character repeated in the alphabet is picked proportionally more often. Generated IDs are checked against the registered sources, the live stores of the
+    IDs, and are never equal to an ID they already hold.
+
+    Attributes:
+        alphabet (str): Characters the IDs are made of, repeated characters are weighted by their count.
+        length (int): Length of the generated IDs.
+        batch_size (int): Number of random bytes read at once.
+        sources (WeakSet): Registered containers of IDs in use, an ID is in use if `id in source` is true.
+
+    Methods:
+        generate: Returns a new ID which is not in use.
+        random_string: Returns a random string of the alphabet, without the uniqueness check.
+        register: Registers a container of IDs in use.
+    """
+
+    def __init__(self, alphabet: str, length: int, batch_size: int = 4096):
+        if not 1 < len(alphabet) <= 256:
+            raise ValueError(
+                "Alphabet should be made of 2 to 256 characters.")
+        if not alphabet.isascii():
+            raise ValueError("Alphabet should contain only ASCII characters.")
+
+        self.alphabet = alphabet
+        self.length = length
+        self.batch_size = batch_size
+        self.sources = weakref.WeakSet()
+
+        limit = 256 - 256 % len(alphabet)
+        self._table = bytes(
+            ord(alphabet[byte % len(alphabet)]) for byte in range(256))
+        self._rejected = bytes(range(limit, 256))
+        self._buffer = ""
+        self._position = 0
+        self._lock = threading.Lock()
+
+    def register(self, source) -> None:
+        """
+        Registers a container of IDs in use, it is held by a weak reference and dropped once it is garbage collected.
+        """
+        self.sources.add(source)
+
+    def unregister(self, source) -> None:
+        self.sources.discard(source)
+
+    def in_use(self, id: str) -> bool:
+        return any(id in source for source in self.sources)
+
+    def random_string(self, length: int = None) -> str:
+        length = self.length if length is None else length
+        with self._lock:
+            end = self._position + length
+            if end > len(self._buffer):
+                self._refill(length)
+                end = length
+            string = self._buffer[self._position:end]
+            self._position = end
+        return string
+
+    def generate(self) -> str:
+        id = self.random_string()
+        while self.sources and self.in_use(id):
+            id = self.random_string()
+        return id
+
+    def generate_many(self, count: int) -> list[str]:
+        return [self.generate() for _ in range(count)]
+
+    def _refill(self, length: int) -> None:
+        buffer = [self._buffer[self._position:]]
+        size = len(buffer[0])
+        while size < max(length, self.batch_size):
+            chunk = os.urandom(self.batch_size).translate(
+                self._table, self._rejected).decode("ascii")
+            buffer.append(chunk)
+            size += len(chunk)
+        self._buffer = "".join(buffer)
+        self._position = 0
+
+
+class MonotonicIdGenerator:
+    """
+    Generates sortable string IDs, every ID compares greater than all IDs generated before it by the generator.
+
+    An ID is the number of milliseconds since the Unix epoch followed by a counter, both written in the BASE62
+    alphabet. The counter starts at a random value every millisecond and is incremented for IDs generated within
+    the same millisecond. IDs of different processes are therefore unlikely to collide and sorting IDs sorts them by
+    their creation time, which makes time ranges scannable with bisect, see bounds. An ID never repeats within a
+    generator, so unlike IdGenerator it is not looked up in the stores holding the IDs.
+
+    Attributes:
+        timestamp_length (int): Number of characters of the timestamp.
+        counter_length (int): Number of characters of the counter.
+
+    Methods:
+        generate: Returns a new ID.
+        timestamp: Returns the creation time of an ID in milliseconds.
+        bounds: Returns the smallest and the greatest ID of a time range.
+    """
+
+    def __init__(self, timestamp_length: int = 8, counter_length: int = 12, clock=time.time_ns):
+        if counter_length < 2:
+            raise ValueError("Counter should be at least 2 characters long.")
+        self.timestamp_length = timestamp_length
+        self.counter_length = counter_length
+        self.length = timestamp_length + counter_length
+        self._clock = clock
+        self._counter_limit = len(BASE62) ** counter_length
+        # the counter starts in the lower half of its range, leaving the upper half for the increments
+        self._counter_start_bytes = (self._counter_limit.bit_length() - 2) // 8
+        self._millisecond = -1
+        self._prefix = ""
+        self._counter = 0
+        self._high = -1
+        self._high_prefix = ""
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def encode(number: int, length: int) -> str:
+        characters = []
+        for _ in range(length // 2):
+            number, remainder = divmod(number, 3844)
+            characters.append(BASE62_PAIRS[remainder])
+        if length % 2:
+            number, remainder = divmod(number, 62)
+            characters.append(BASE62[remainder])
+        if number:
+            raise ValueError(
+                f"Number does not fit into {length} characters.")
+        return "".join(reversed(characters))
+
+    @staticmethod
+    def decode(string: str) -> int:
+        number = 0
+        for character in string:
+            number = number * 62 + BASE62.index(character)
+        return number
+
+    def _next(self) -> str:
+        with self._lock:
+            millisecond = self._clock() // 1_000_000
+            if millisecond > self._millisecond:
+                self._start(millisecond)
+            else:
+                # the clock did not move or went back, the last millisecond is kept to stay monotonic
+                self._counter += 1
+                if self._counter >= self._counter_limit:
+                    self._start(self._millisecond + 1)
+            # only the last two characters change between most consecutive IDs, the rest is cached
+            high, low = divmod(self._counter, 3844)
+            if high != self._high:
+                self._high = high
+                self._high_prefix = self._prefix + \
+                    self.encode(high, self.counter_length - 2)
+            return self._high_prefix + BASE62_PAIRS[low]
+
+    def _start(self, millisecond: int) -> None:
+        self._millisecond = millisecond
+        self._prefix = self.encode(millisecond, self.timestamp_length)
+        self._high = -1
+        self._counter = int.from_bytes(
+            os.urandom(self._counter_start_bytes), "big")
+
+    def generate(self) -> str:
+        return self._next()
+
+    def generate_many(self, count: int) -> list[str]:
+        return [self._next() for _ in range(count)]
+
+    def timestamp(self, id: str) -> int:
+        """
+        Returns the creation time of an ID, in milliseconds since the Unix epoch.
+        """
+        return self.decode(id[:self.timestamp_length])
+
+    def bounds(self, start: float, end: float) -> tuple[str, str]:
+        """
+        Returns the smallest and the greatest ID which can be generated between two points in time.
+
+        Args:
+            start (float): Beginning of the range, as a Unix timestamp in seconds.
+            end (float): End of the range, as a Unix timestamp in seconds.
+        """
+        return (self.encode(int(start * 1000), self.timestamp_length) + BASE62[0] * self.counter_length,
+                self.encode(int(end * 1000), self.timestamp_length) + BASE62[-1] * self.counter_length)
+
+    def between(self, ids: Iterable[str], start: float, end: float) -> list[str]:
+        """
+        Returns the IDs of a sorted sequence which were generated between two points in time, found with bisect.
+        """
+        ids = ids if isinstance(ids, list) else list(ids)
+        lower, upper = self.bounds(start, end)
+        return ids[bisect_left(ids, lower):bisect_right(ids, upper)]
+
+
+ACCOUNT_IDS = IdGenerator(digits, 10)
+TRANSACTION_IDS = MonotonicIdGenerator()
+RANDOM_STRINGS = IdGenerator(WEIGHTED_ALPHABET, 10)
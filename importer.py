@@ -0,0 +1,254 @@
+from models import TransactionManager
+
+from typing import Callable, Iterator, Union
+import csv
+import json
+import os
+
+
+class ImportReport:
+    """
+    Summary of a statement import.
+
+    Attributes:
+        imported (int): Number of registered transactions.
+        rejected (int): Number of rejected records.
+        offset (int): Byte offset in the file right after the last committed record.
+    """
+
+    def __init__(self, imported: int = 0, rejected: int = 0, offset: int = 0):
+        self.imported = imported
+        self.rejected = rejected
+        self.offset = offset
+
+    def __repr__(self):
+        return f"ImportReport(imported={self.imported}, rejected={self.rejected}, offset={self.offset})"
+
+
+class StatementImporter:
+    """
+    Streams bank statement exports in CSV or JSONL format into a TransactionManager.
+
+    The file is processed as a generator pipeline read -> parse -> batch -> commit, so only one chunk of records is
+    held in memory at once. Every chunk is registered with TransactionManager.create_transactions_bulk, which runs the
+    Transaction field validators. Rejected records are appended to a JSONL side file and, after every committed chunk,
+    the byte offset reached is written to a checkpoint file so an interrupted import can be resumed.
+
+    Attributes:
+        transaction_manager (TransactionManager): Manager the transactions are registered with.
+        chunk_size (int): Number of records committed at once.
+        rejected_path (str, optional): Path of the side file for rejected records.
+        checkpoint_path (str, optional): Path of the checkpoint file.
+        commit (callable, optional): Called after every chunk before the checkpoint is written, e.g. Database.commit.
+        field_names (dict, optional): Maps names of fields in the file to Transaction field names.
+        encoding (str): Encoding of the imported files.
+        classifier (ai_assistant.CategoryClassifier, optional): Suggests the item_category of records without one,
+            a whole chunk at once.
+        min_probability (float): Suggestions less probable than this are not used and the records are rejected
+            for the missing category.
+
+    Methods:
+        import_file: Imports a whole file, optionally resuming from the checkpoint.
+    """
+
+    FORMATS = ("csv", "jsonl")
+
+    def __init__(self, transaction_manager: TransactionManager, chunk_size: int = 10_000, rejected_path: str = None,
+                 checkpoint_path: str = None, commit: Callable[[], None] = None, field_names: dict[str, str] = None,
+                 encoding: str = "utf-8", classifier=None, min_probability: float = 0.0):
+        if not isinstance(transaction_manager, TransactionManager):
+            raise TypeError(
+                f"TransactionManager instance is expected, {type(transaction_manager)} type was given")
+        if not isinstance(chunk_size, int) or chunk_size < 1:
+            raise ValueError("Chunk size should be a positive integer.")
+
+        self.transaction_manager = transaction_manager
+        self.chunk_size = chunk_size
+        self.rejected_path = rejected_path
+        self.checkpoint_path = checkpoint_path
+        self.commit = commit
+        self.field_names = field_names or {}
+        self.encoding = encoding
+        self.classifier = classifier
+        self.min_probability = min_probability
+
+    def import_file(self, path: str, file_format: str = None, resume: bool = False) -> ImportReport:
+        """
+        Imports all records of a statement file.
+
+        Args:
+            path (str): Path of the CSV or JSONL file.
+            file_format (str, optional): Either "csv" or "jsonl", guessed from the file extension if not given.
+            resume (bool, optional): If True, the import continues from the offset stored in the checkpoint file.
+
+        Returns:
+            ImportReport: Number of imported and rejected records and the offset reached.
+        """
+        file_format = file_format or os.path.splitext(path)[1].lstrip(".").lower()
+        if file_format not in self.FORMATS:
+            raise ValueError(
+                f"Supported formats are {', '.join(self.FORMATS)}, {file_format} was given.")
+
+        report = self.load_checkpoint(path) if resume else ImportReport()
+
+        with open(path, "rb") as file:
+            records = self.read_csv(
+                file, report.offset) if file_format == "csv" else self.read_jsonl(file, report.offset)
+            for chunk in self.batch(self.parse(records)):
+                self.commit_chunk(path, chunk, report)
+
+        return report
+
+    def read_csv(self, file, offset: int) -> Iterator[tuple[int, int, dict[str, str]]]:
+        """
+        Yields (start offset, end offset, record) of every CSV record after the given offset, the header is always
+        read from the start of the file. Bytes which cannot be decoded are escaped, parse rejects their records.
+        """
+        header = next(csv.reader([file.readline().decode(self.encoding, "surrogateescape")]), None)
+        if header is None:
+            return
+        offset = max(offset, file.tell())
+        position = offset
+
+        def lines():
+            nonlocal position
+            file.seek(offset)
+            for line in iter(file.readline, b""):
+                position += len(line)
+                yield line.decode(self.encoding, "surrogateescape")
+
+        # csv.reader pulls lines one by one, so position is the end of the record it has just returned
+        start = offset
+        for values in csv.reader(lines()):
+            if values:
+                yield start, position, dict(zip(header, values))
+            start = position
+
+    def read_jsonl(self, file, offset: int) -> Iterator[tuple[int, int, str]]:
+        """
+        Yields (start offset, end offset, line) of every non-empty line after the given offset. Bytes which cannot be
+        decoded are escaped, parse rejects their lines.
+        """
+        file.seek(offset)
+        start = offset
+        for line in iter(file.readline, b""):
+            end = start + len(line)
+            if line.strip():
+                yield start, end, line.decode(self.encoding, "surrogateescape")
+            start = end
+
+    def parse(self, records) -> Iterator[tuple[int, int, Union[dict, str], Union[dict, Exception]]]:
+        """
+        Converts raw records to rows accepted by TransactionManager.create_transactions_bulk.
+        Yields (start offset, end offset, raw record, row), the row is the exception if the record could not be parsed.
+        """
+        for start, end, raw in records:
+            try:
+                self.check_encoding(raw)
+                record = json.loads(raw) if isinstance(raw, str) else raw
+                if not isinstance(record, dict):
+                    raise ValueError("JSONL record should be an object.")
+                row = {self.field_names.get(key, key): value for key, value in record.items()}
+                if not isinstance(raw, str):
+                    row = self.convert_csv_row(row)
+            except ValueError as e:
+                yield start, end, raw, e
+            else:
+                yield start, end, raw, row
+
+    def check_encoding(self, raw: Union[dict, str]) -> None:
+        # bytes escaped by the readers become lone surrogates, which cannot be encoded again
+        try:
+            for value in (raw,) if isinstance(raw, str) else raw.values():
+                value.encode(self.encoding)
+        except UnicodeEncodeError:
+            raise ValueError(f"Record is not valid {self.encoding} text.") from None
+
+    @staticmethod
+    def convert_csv_row(row: dict[str, str]) -> dict:
+        # CSV values are all strings, only numbers and empty dates need converting, validation is left to Transaction
+        if "cost" in row:
+            cost = row["cost"].strip()
+            row["cost"] = float(cost) if any(
+                char in cost for char in ".eE") else int(cost)
+        if "quantity" in row:
+            row["quantity"] = int(row["quantity"])
+        if not row.get("transaction_date"):
+            row["transaction_date"] = None
+        return row
+
+    def batch(self, rows) -> Iterator[list]:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def commit_chunk(self, path: str, chunk: list, report: ImportReport) -> None:
+        rejected = [(start, raw, row)
+                    for start, _, raw, row in chunk if isinstance(row, Exception)]
+        parsed = [(start, raw, row)
+                  for start, _, raw, row in chunk if not isinstance(row, Exception)]
+
+        if self.classifier is not None:
+            self.suggest_categories([row for _, _, row in parsed])
+
+        result = self.transaction_manager.create_transactions_bulk(
+            [row for _, _, row in parsed])
+        for index, error in result.errors:
+            start, raw, _ = parsed[index]
+            rejected.append((start, raw, error))
+
+        if self.commit is not None:
+            self.commit()
+
+        report.imported += result.inserted
+        report.rejected += len(rejected)
+        report.offset = chunk[-1][1]
+
+        self.write_rejected(sorted(rejected, key=lambda record: record[0]))
+        self.save_checkpoint(path, report)
+
+    def suggest_categories(self, rows: list[dict]) -> None:
+        missing = [row for row in rows if not row.get("item_category")]
+        if not missing:
+            return
+        # the values are not validated yet, text that is not a string is left to the Transaction validators
+        suggestions = self.classifier.classify_many(
+            [(row.get("vendor") if isinstance(row.get("vendor"), str) else "",
+              row.get("item") if isinstance(row.get("item"), str) else "") for row in missing],
+            self.min_probability)
+        for row, category in zip(missing, suggestions):
+            if category is not None:
+                row["item_category"] = category
+
+    def write_rejected(self, rejected: list) -> None:
+        if self.rejected_path is None or not rejected:
+            return
+        with open(self.rejected_path, "a", encoding="utf-8") as file:
+            for start, raw, error in rejected:
+                file.write(json.dumps({"offset": start, "error": str(error), "record": raw}) + "\n")
+
+    def save_checkpoint(self, path: str, report: ImportReport) -> None:
+        if self.checkpoint_path is None:
+            return
+        temporary_path = self.checkpoint_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump({"path": os.path.abspath(path), "offset": report.offset,
+                       "imported": report.imported, "rejected": report.rejected}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def load_checkpoint(self, path: str) -> ImportReport:
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return ImportReport()
+        with open(self.checkpoint_path, "r", encoding="utf-8") as file:
+            checkpoint = json.load(file)
+        if checkpoint.get("path") != os.path.abspath(path):
+            raise ValueError(
+                f"Checkpoint belongs to {checkpoint.get('path')}, not to {os.path.abspath(path)}.")
+        return ImportReport(checkpoint["imported"], checkpoint["rejected"], checkpoint["offset"])
@@ -0,0 +1,164 @@
+from bisect import bisect_left, bisect_right
+from typing import Callable, Union
+
+
+class AccountIndex:
+    """
+    Base class of the secondary indexes of AccountManager.
+
+    Indexes are registered as AccountManager listeners and keep a reverse map from account ID to the indexed value,
+    so an account can be removed from the index after its value already changed.
+
+    Attributes:
+        attribute (str): Name of the indexed value.
+        key (callable): Returns the indexed value of an account.
+        values (dict): Indexed value of every account, keyed by the account ID.
+    """
+
+    def __init__(self, attribute: str, key: Callable = None):
+        self.attribute = attribute
+        self.key = key if key is not None else (
+            lambda account: getattr(account, attribute))
+        self.values = {}
+
+    def account_added(self, account) -> None:
+        value = self.key(account)
+        self.values[account.id] = value
+        self.insert(account.id, value)
+
+    def account_updated(self, account, previous_id) -> None:
+        value = self.key(account)
+        if previous_id == account.id and self.values.get(account.id) == value:
+            return
+        self.account_deleted_id(previous_id)
+        self.account_added(account)
+
+    def account_deleted(self, account) -> None:
+        self.account_deleted_id(account.id)
+
+    def account_deleted_id(self, id) -> None:
+        if id in self.values:
+            self.delete(id, self.values.pop(id))
+
+    def build(self, accounts) -> None:
+        for account in accounts:
+            self.account_added(account)
+
+    def insert(self, id, value) -> None:
+        raise NotImplementedError
+
+    def delete(self, id, value) -> None:
+        raise NotImplementedError
+
+
+class HashIndex(AccountIndex):
+    """
+    Index for exact match lookups, maps every value to the set of IDs of accounts having it.
+    """
+
+    def __init__(self, attribute: str, key: Callable = None):
+        super().__init__(attribute, key)
+        self.ids = {}
+
+    def insert(self, id, value) -> None:
+        if value in self.ids:
+            self.ids[value].add(id)
+        else:
+            self.ids[value] = {id}
+
+    def delete(self, id, value) -> None:
+        ids = self.ids[value]
+        ids.discard(id)
+        if not ids:
+            del self.ids[value]
+
+    def search(self, value) -> set:
+        return set(self.ids.get(value, ()))
+
+
+class TrigramIndex(AccountIndex):
+    """
+    Index for substring lookups, maps every three character sequence to the set of IDs of accounts whose value
+    contains it. Candidates found through the trigrams are verified against the indexed values.
+    """
+
+    def __init__(self, attribute: str, key: Callable = None):
+        super().__init__(attribute, key)
+        self.ids = {}
+
+    @staticmethod
+    def trigrams(value: str) -> set[str]:
+        return {value[index:index + 3] for index in range(len(value) - 2)}
+
+    def insert(self, id, value) -> None:
+        for trigram in self.trigrams(value):
+            if trigram in self.ids:
+                self.ids[trigram].add(id)
+            else:
+                self.ids[trigram] = {id}
+
+    def delete(self, id, value) -> None:
+        for trigram in self.trigrams(value):
+            ids = self.ids[trigram]
+            ids.discard(id)
+            if not ids:
+                del self.ids[trigram]
+
+    def search(self, substring: str) -> set:
+        trigrams = self.trigrams(substring)
+        if trigrams:
+            # the rarest trigrams go first so the intersection shrinks as fast as possible
+            candidates = None
+            for trigram in sorted(trigrams, key=lambda trigram: len(self.ids.get(trigram, ()))):
+                ids = self.ids.get(trigram)
+                if not ids:
+                    return set()
+                candidates = set(ids) if candidates is None else candidates & ids
+                if not candidates:
+                    return set()
+        else:
+            candidates = self.values.keys()
+        return {id for id in candidates if substring in self.values[id]}
+
+
+class SortedIndex(AccountIndex):
+    """
+    Index for range lookups, keeps the values sorted together with the IDs of their accounts.
+    """
+
+    def __init__(self, attribute: str, key: Callable = None):
+        super().__init__(attribute, key)
+        self.keys = []
+        self.ids = []
+
+    def insert(self, id, value) -> None:
+        position = bisect_right(self.keys, value)
+        self.keys.insert(position, value)
+        self.ids.insert(position, id)
+
+    def delete(self, id, value) -> None:
+        start, end = bisect_left(self.keys, value), bisect_right(self.keys, value)
+        position = self.ids.index(id, start, end)
+        del self.keys[position]
+        del self.ids[position]
+
+    def search(self, lower=None, upper=None, lower_inclusive: bool = True, upper_inclusive: bool = True) -> list:
+        """
+        Returns IDs of accounts whose value lies between lower and upper, ordered by the value.
+        A missing bound leaves the range open on that side.
+        """
+        start = 0
+        if lower is not None:
+            start = bisect_left(self.keys, lower) if lower_inclusive else bisect_right(
+                self.keys, lower)
+        end = len(self.keys)
+        if upper is not None:
+            end = bisect_right(self.keys, upper) if upper_inclusive else bisect_left(
+                self.keys, upper)
+        return self.ids[start:end]
+
+    def above(self, value: Union[int, float, str]) -> list:
+        return self.search(lower=value, lower_inclusive=False)
+
+    def below(self, value: Union[int, float, str]) -> list:
+        return self.search(upper=value, upper_inclusive=False)
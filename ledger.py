@@ -0,0 +1,286 @@
+from models import Account, Transaction, TransactionManager
+from utils import parse_date
+
+from array import array
+from bisect import bisect_right
+from datetime import date, datetime
+from functools import lru_cache
+from math import isclose
+from typing import Union
+import time
+
+
+@lru_cache(maxsize=4096)
+def day_start(ordinal: int) -> float:
+    """
+    Returns the Unix time of the start of a day in local time.
+    """
+    day = date.fromordinal(ordinal)
+    return datetime(day.year, day.month, day.day).timestamp()
+
+
+class AccountLedger:
+    """
+    Balance history of one account, kept as parallel arrays of entry times and balance deltas.
+
+    The first entry opens the ledger with the balances the account had before every other entry, every other entry is
+    the change made by a transaction. Entries are kept in time order, an entry older than the last one is inserted at
+    its place and an entry older than the opening moves the opening back to its time. After every checkpoint_interval
+    entries the running balances are stored as a checkpoint, so the balance at any point in time is the nearest
+    checkpoint plus fewer than checkpoint_interval deltas. Checkpoints after an inserted entry are dropped and
+    computed again when a query needs them.
+
+    Attributes:
+        times (array): Unix times of the entries, never decreasing.
+        cash (array): Changes of the cash balance.
+        card (array): Changes of the card balance.
+        checkpoints (list): Balances (cash, card) after every checkpoint_interval entries.
+        checkpoint_interval (int): Number of entries between two checkpoints.
+    """
+
+    __slots__ = ("times", "cash", "card", "checkpoints",
+                 "checkpoint_interval", "_balance_cash", "_balance_card")
+
+    def __init__(self, opened: float, balance_cash: Union[int, float], balance_card: Union[int, float],
+                 checkpoint_interval: int = 64):
+        self.times = array("d")
+        self.cash = array("d")
+        self.card = array("d")
+        self.checkpoints = []
+        self.checkpoint_interval = checkpoint_interval
+        self._balance_cash = 0.0
+        self._balance_card = 0.0
+        self.record(opened, balance_cash, balance_card)
+
+    def record(self, when: float, delta_cash: Union[int, float], delta_card: Union[int, float]) -> None:
+        times = self.times
+        self._balance_cash += delta_cash
+        self._balance_card += delta_card
+
+        if not times or when >= times[-1]:
+            times.append(when)
+            self.cash.append(delta_cash)
+            self.card.append(delta_card)
+            # the checkpoint is taken only if the earlier ones are valid, missing ones are computed by checkpoint
+            checkpoint, remainder = divmod(len(times), self.checkpoint_interval)
+            if not remainder and len(self.checkpoints) == checkpoint - 1:
+                self.checkpoints.append((self._balance_cash, self._balance_card))
+            return
+
+        # an entry dated before the last one, e.g. an imported historical transaction, never goes before the opening
+        if when < times[0]:
+            times[0] = when
+        position = max(bisect_right(times, when), 1)
+        times.insert(position, when)
+        self.cash.insert(position, delta_cash)
+        self.card.insert(position, delta_card)
+        del self.checkpoints[position // self.checkpoint_interval:]
+
+    def checkpoint(self, index: int) -> tuple[float, float]:
+        """
+        Returns the balances after the first (index + 1) * checkpoint_interval entries, computing missing checkpoints.
+        """
+        checkpoints, interval = self.checkpoints, self.checkpoint_interval
+        while len(checkpoints) <= index:
+            start = len(checkpoints) * interval
+            balance_cash, balance_card = checkpoints[-1] if checkpoints else (0.0, 0.0)
+            checkpoints.append((balance_cash + sum(self.cash[start:start + interval]),
+                                balance_card + sum(self.card[start:start + interval])))
+        return checkpoints[index]
+
+    @property
+    def opened(self) -> float:
+        return self.times[0]
+
+    @property
+    def balance(self) -> tuple[float, float]:
+        return self._balance_cash, self._balance_card
+
+    def balance_at(self, when: float) -> Union[tuple[float, float], None]:
+        """
+        Returns the (cash, card) balances at a point in time, None if the ledger was opened later.
+        """
+        entries = bisect_right(self.times, when)
+        if entries == 0:
+            return None
+
+        checkpoint = entries // self.checkpoint_interval
+        if checkpoint:
+            balance_cash, balance_card = self.checkpoint(checkpoint - 1)
+        else:
+            balance_cash = balance_card = 0.0
+        start = checkpoint * self.checkpoint_interval
+        balance_cash += sum(self.cash[start:entries])
+        balance_card += sum(self.card[start:entries])
+        return balance_cash, balance_card
+
+    def __len__(self):
+        return len(self.times)
+
+
+class BalanceLedger:
+    """
+    Event-sourced history of the balances of the accounts, for point-in-time balance queries and reconciliation.
+
+    The ledger is registered as a listener of an AccountManager and a TransactionManager. Every account gets an
+    opening entry with its balances when it is added, or when the ledger is created for the accounts that already
+    exist, and every registered and reversed transaction is recorded as a delta of the balance it was paid from.
+    Transactions are timed by their transaction_date, at the start of the day, so historical transactions, e.g. from
+    importer.StatementImporter, change the balances from their date on. A reversal is timed by the date of the
+    reversed transaction, so past balances are the ones of the transactions on record. Point-in-time queries bisect
+    the entry times and add the deltas since the nearest checkpoint, which costs O(log n + checkpoint_interval).
+
+    Balances changed in another way than by a transaction, e.g. by update_account, are not recorded and are reported
+    by reconcile.
+
+    Attributes:
+        account_manager (AccountManager): Manager of the accounts.
+        transaction_manager (TransactionManager): Manager of the transactions.
+        ledgers (dict): AccountLedger of every account, keyed by the account ID. Ledgers of deleted accounts are kept.
+        checkpoint_interval (int): Number of entries between two checkpoints of an account.
+        clock (callable): Returns the current Unix time the opening entries are timed by, time.time by default.
+
+    Methods:
+        balance_at: Returns the balances of an account at a point in time.
+        balances_at: Returns the balances of all accounts at a point in time.
+        reconcile: Compares the current balances of the accounts with the ledger.
+    """
+
+    def __init__(self, transaction_manager: TransactionManager, checkpoint_interval: int = 64, clock=time.time):
+        if not isinstance(transaction_manager, TransactionManager):
+            raise TypeError(
+                f"TransactionManager instance is expected, {type(transaction_manager)} type was given")
+        if not isinstance(checkpoint_interval, int) or checkpoint_interval < 1:
+            raise ValueError("Checkpoint interval should be a positive integer.")
+
+        self.transaction_manager = transaction_manager
+        self.account_manager = transaction_manager.account_manager
+        self.checkpoint_interval = checkpoint_interval
+        self.clock = clock
+        self.ledgers = {}
+
+        for account in self.account_manager.get_accounts():
+            self.account_added(account)
+        self.account_manager.add_listener(self)
+        transaction_manager.add_listener(self)
+
+    # listeners
+
+    def account_added(self, account: Account) -> None:
+        self.ledgers[account.id] = AccountLedger(
+            self.clock(), account.balance_cash, account.balance_card, self.checkpoint_interval)
+
+    def account_updated(self, account: Account, previous_id) -> None:
+        if previous_id != account.id and previous_id in self.ledgers:
+            self.ledgers[account.id] = self.ledgers.pop(previous_id)
+
+    def account_deleted(self, account: Account) -> None:
+        pass
+
+    def transaction_added(self, transaction: Transaction) -> None:
+        self.record(transaction, -transaction.cost)
+
+    def transaction_reversed(self, transaction: Transaction) -> None:
+        self.record(transaction, transaction.cost)
+
+    def record(self, transaction: Transaction, delta: Union[int, float]) -> None:
+        ledger = self.ledgers.get(transaction.user_id)
+        if ledger is None:
+            # the account was added before the ledger listened, its opening balance is derived from the current one
+            account = self.account_manager.get_account(transaction.user_id)
+            cash, card = account.balance_cash, account.balance_card
+            if transaction.payment_method == "CARD":
+                card -= delta
+            else:
+                cash -= delta
+            ledger = self.ledgers[transaction.user_id] = AccountLedger(
+                self.clock(), cash, card, self.checkpoint_interval)
+
+        when = day_start(transaction.transaction_ordinal)
+        if transaction.payment_method == "CARD":
+            ledger.record(when, 0, delta)
+        else:
+            ledger.record(when, delta, 0)
+
+    # queries
+
+    @staticmethod
+    def to_timestamp(when: Union[str, date, datetime, int, float]) -> float:
+        """
+        Converts a point in time to Unix time. A date, or a date string in the format 'YYYY-mm-dd', means the end of
+        that day in local time.
+
+        Raises:
+            TypeError: If the point in time is of an unsupported type.
+        """
+        if isinstance(when, (int, float)):
+            return float(when)
+        if isinstance(when, datetime):
+            return when.timestamp()
+        if isinstance(when, str):
+            when = date.fromordinal(parse_date(when))
+        if isinstance(when, date):
+            return datetime(when.year, when.month, when.day, 23, 59, 59, 999999).timestamp()
+        raise TypeError(
+            f"Point in time should be a date string, date, datetime or Unix time, input of type {type(when)} was given.")
+
+    def balance_at(self, account_id, when: Union[str, date, datetime, int, float]) -> tuple[float, float]:
+        """
+        Returns the balances of an account at a point in time.
+
+        Args:
+            account_id: The ID of the account.
+            when: The point in time, a date string in the format 'YYYY-mm-dd', date, datetime or Unix time.
+
+        Returns:
+            tuple: Cash and card balance.
+
+        Raises:
+            KeyError: If the ledger has no history of the account.
+            ValueError: If the point in time precedes the history of the account.
+        """
+        ledger = self.ledgers.get(account_id)
+        if ledger is None:
+            raise KeyError(f"Ledger has no history of account with ID {account_id}.")
+
+        balance = ledger.balance_at(self.to_timestamp(when))
+        if balance is None:
+            raise ValueError(
+                f"History of account with ID {account_id} starts after the requested point in time.")
+        return balance
+
+    def balances_at(self, when: Union[str, date, datetime, int, float]) -> dict:
+        """
+        Returns the (cash, card) balances of every account with history at a point in time, keyed by the account ID.
+        """
+        timestamp = self.to_timestamp(when)
+        balances = {}
+        for account_id, ledger in self.ledgers.items():
+            balance = ledger.balance_at(timestamp)
+            if balance is not None:
+                balances[account_id] = balance
+        return balances
+
+    def reconcile(self, abs_tol: float = 1e-6) -> list[tuple]:
+        """
+        Compares the current balances of the accounts with the balances the ledger arrives at.
+
+        Returns:
+            list: (account ID, balance name, ledger balance, account balance) of every balance that does not match,
+                the ledger balance is None for accounts the ledger has no history of. Empty if everything matches.
+        """
+        mismatches = []
+        for account in self.account_manager.get_accounts():
+            ledger = self.ledgers.get(account.id)
+            if ledger is None:
+                mismatches.append(
+                    (account.id, "balance_cash", None, account.balance_cash))
+                mismatches.append(
+                    (account.id, "balance_card", None, account.balance_card))
+                continue
+
+            for name, expected, actual in (("balance_cash", ledger.balance[0], account.balance_cash),
+                                           ("balance_card", ledger.balance[1], account.balance_card)):
+                if not isclose(expected, actual, rel_tol=1e-9, abs_tol=abs_tol):
+                    mismatches.append((account.id, name, expected, actual))
+        return mismatches
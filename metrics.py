@@ -0,0 +1,346 @@
+from models import Account, AccountManager, Transaction, TransactionManager
+from concurrency import ConcurrentTransactionManager
+from ids import IdGenerator, MonotonicIdGenerator
+
+from bisect import bisect_left
+from functools import wraps
+from time import perf_counter
+from typing import Callable
+import json
+import sys
+import threading
+
+
+# upper bounds of the latency histogram buckets in seconds, the last bucket is unbounded
+DEFAULT_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2,
+                   5e-2, 0.1, 0.25, 0.5, 1.0)
+# methods timed when the metrics are enabled
+OPERATIONS = {
+    AccountManager: ("create_account", "add_account", "update_account", "delete_account", "save_account",
+                     "get_account", "filter_account_name", "filter_account_balance", "filter_account_date"),
+    TransactionManager: ("create_transaction", "add_transcation", "create_transactions_bulk", "update_balance",
+                         "get_user_transactions", "get_user_transaction", "reverse_transaction", "query",
+                         "get_account_stats"),
+    # the overrides are timed on their own, wrapping the base class does not reach them
+    ConcurrentTransactionManager: ("add_transcation", "create_transactions_bulk", "update_balance",
+                                   "get_user_transactions", "get_user_transaction", "reverse_transaction", "query",
+                                   "get_account_stats"),
+    IdGenerator: ("generate", "generate_many"),
+    MonotonicIdGenerator: ("generate", "generate_many"),
+}
+# validators whose failures are counted, by reason
+VALIDATORS = {
+    Account: ("validate_name", "validate_balance"),
+    Transaction: ("validate_cost", "validate_payment_method", "validate_item", "validate_quantity",
+                  "validate_item_category", "validate_vendor"),
+    TransactionManager: ("validate_account",),
+}
+# failure reasons kept per source, further reasons are counted as "other" so bad input cannot grow the metrics
+MAX_REASONS = 20
+
+
+def setters(cls: type) -> dict[str, property]:
+    return {name: attribute for name, attribute in vars(cls).items()
+            if isinstance(attribute, property) and attribute.fset is not None}
+
+
+class SamplingProfiler:
+    """
+    Attributes wall time to functions by sampling the stacks of all threads at a fixed interval.
+
+    At every sample the innermost frame running one of the target code objects gets the time elapsed since the
+    previous sample. The profiler costs nothing to the profiled threads but the GIL it takes while sampling.
+
+    Attributes:
+        targets (dict): Names of the profiled functions, keyed by their code objects.
+        interval (float): Seconds between two samples.
+        seconds (dict): Attributed time, keyed by the function name.
+        samples (int): Number of samples taken.
+    """
+
+    def __init__(self, targets: dict, interval: float = 0.001):
+        if interval <= 0:
+            raise ValueError("Sampling interval should be positive.")
+        self.targets = targets
+        self.interval = interval
+        self.seconds = dict.fromkeys(targets.values(), 0.0)
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        targets = self.targets
+        previous = perf_counter()
+        while not self._stop.wait(self.interval):
+            now = perf_counter()
+            elapsed, previous = now - previous, now
+            for thread, frame in sys._current_frames().items():
+                if thread == own:
+                    continue
+                while frame is not None:
+                    name = targets.get(frame.f_code)
+                    if name is not None:
+                        self.seconds[name] += elapsed
+                        break
+                    frame = frame.f_back
+            self.samples += 1
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+
+class Metrics:
+    """
+    Instrumentation of the hot paths of the managers and the models, switched on and off at runtime.
+
+    enable wraps the methods listed in OPERATIONS, the validators listed in VALIDATORS and the property setters of
+    Account and Transaction in place, disable puts the original functions back, so instrumentation costs nothing
+    while it is off. While it is on:
+
+    - every operation counts its calls and failures and records its latency in a histogram with fixed buckets,
+      times include the nested operations, e.g. add_transcation includes update_balance and save_account, and an
+      override of ConcurrentTransactionManager includes the TransactionManager method it locks around;
+    - every validation failure is counted by its source, a validator or a setter, and its reason, the exception type
+      and message;
+    - the optional sampling profiler attributes time to each setter of the models.
+
+    The collected data is exported as a Prometheus text snapshot with to_prometheus or as JSON with to_json.
+
+    Attributes:
+        buckets (tuple): Upper bounds of the latency histogram buckets in seconds.
+        namespace (str): Prefix of the exported metric names.
+        operations (dict): [calls, failures, total seconds, bucket counts] of every operation, keyed by its name.
+        validation_failures (dict): Failure counts keyed by (source, reason).
+        profiler (SamplingProfiler): Profiler of the setters while it runs, None otherwise.
+
+    Methods:
+        enable: Switches the instrumentation on.
+        disable: Switches the instrumentation off.
+        reset: Drops all collected data.
+        start_profiler: Starts sampling the setters.
+        stop_profiler: Stops sampling the setters.
+        snapshot: Returns the collected data as a dictionary.
+        to_prometheus: Returns the collected data in the Prometheus text format.
+        to_json: Returns the collected data as JSON.
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS, namespace: str = "finance"):
+        if list(buckets) != sorted(set(buckets)) or not buckets:
+            raise ValueError("Buckets should be distinct upper bounds in increasing order.")
+        self.buckets = tuple(buckets)
+        self.namespace = namespace
+        self.operations = {}
+        self.validation_failures = {}
+        self.profiler = None
+        self._originals = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._originals)
+
+    # instrumentation
+
+    def enable(self) -> None:
+        if self.enabled:
+            return
+        for cls, names in OPERATIONS.items():
+            for name in names:
+                self._wrap(cls, name, self.timed(
+                    f"{cls.__name__}.{name}", vars(cls)[name]))
+        for cls, names in VALIDATORS.items():
+            for name in names:
+                original = vars(cls)[name]
+                if isinstance(original, staticmethod):
+                    wrapped = staticmethod(self.counted(
+                        f"{cls.__name__}.{name}", original.__func__))
+                else:
+                    wrapped = self.counted(f"{cls.__name__}.{name}", original)
+                self._wrap(cls, name, wrapped)
+        for cls in (Account, Transaction):
+            for name, attribute in setters(cls).items():
+                self._wrap(cls, name, property(attribute.fget, self.counted(f"{cls.__name__}.{name}", attribute.fset),
+                                               attribute.fdel, attribute.__doc__))
+
+    def disable(self) -> None:
+        for (cls, name), original in self._originals.items():
+            setattr(cls, name, original)
+        self._originals = {}
+
+    def _wrap(self, cls: type, name: str, wrapped) -> None:
+        self._originals[(cls, name)] = vars(cls)[name]
+        setattr(cls, name, wrapped)
+
+    def timed(self, operation: str, function: Callable) -> Callable:
+        record = self.record
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                record(operation, perf_counter() - start, True)
+                raise
+            record(operation, perf_counter() - start, False)
+            return result
+        return wrapper
+
+    def counted(self, source: str, function: Callable) -> Callable:
+        failed = self.validation_failed
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            try:
+                return function(*args, **kwargs)
+            except (TypeError, ValueError) as e:
+                failed(source, e)
+                raise
+        return wrapper
+
+    # recording
+
+    def record(self, operation: str, seconds: float, failed: bool = False) -> None:
+        bucket = bisect_left(self.buckets, seconds)
+        with self._lock:
+            totals = self.operations.get(operation)
+            if totals is None:
+                totals = self.operations[operation] = [
+                    0, 0, 0.0, [0] * (len(self.buckets) + 1)]
+            totals[0] += 1
+            totals[1] += failed
+            totals[2] += seconds
+            totals[3][bucket] += 1
+
+    def validation_failed(self, source: str, error: Exception) -> None:
+        # a failure raised by a validator passes through the setter that called it, it is counted only once
+        if getattr(error, "counted_by_metrics", False):
+            return
+        try:
+            error.counted_by_metrics = True
+        except AttributeError:
+            pass
+
+        reason = f"{type(error).__name__}: {error}"
+        with self._lock:
+            key = (source, reason)
+            if key not in self.validation_failures and \
+                    sum(counted_source == source for counted_source, _ in self.validation_failures) >= MAX_REASONS:
+                key = (source, "other")
+            self.validation_failures[key] = self.validation_failures.get(
+                key, 0) + 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self.operations = {}
+            self.validation_failures = {}
+        if self.profiler is not None:
+            self.profiler.seconds = dict.fromkeys(
+                self.profiler.targets.values(), 0.0)
+            self.profiler.samples = 0
+
+    # profiling
+
+    def start_profiler(self, interval: float = 0.001) -> SamplingProfiler:
+        """
+        Starts sampling the stacks of all threads and attributing time to the setters of Account and Transaction.
+        The profiler works whether the instrumentation is enabled or not.
+        """
+        if self.profiler is not None and self.profiler.running:
+            return self.profiler
+        targets = {}
+        for cls in (Account, Transaction):
+            for name, attribute in setters(cls).items():
+                # the original setters, the wrappers installed by enable call them
+                original = self._originals.get((cls, name), attribute)
+                targets[original.fset.__code__] = f"{cls.__name__}.{name}"
+        self.profiler = SamplingProfiler(targets, interval)
+        self.profiler.start()
+        return self.profiler
+
+    def stop_profiler(self) -> None:
+        if self.profiler is not None:
+            self.profiler.stop()
+
+    # export
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            operations = {operation: {"calls": calls, "failures": failures, "seconds": seconds,
+                                      "buckets": dict(zip([*map(str, self.buckets), "+Inf"], counts))}
+                          for operation, (calls, failures, seconds, counts) in self.operations.items()}
+            failures = [{"source": source, "reason": reason, "count": count}
+                        for (source, reason), count in self.validation_failures.items()]
+        snapshot = {"enabled": self.enabled,
+                    "operations": operations, "validation_failures": failures}
+        if self.profiler is not None:
+            snapshot["setter_profile"] = {"interval": self.profiler.interval, "samples": self.profiler.samples,
+                                          "seconds": dict(self.profiler.seconds)}
+        return snapshot
+
+    def to_json(self, indent: int = None) -> str:
+        return json.dumps(self.snapshot(), indent=indent)
+
+    @staticmethod
+    def escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+    def to_prometheus(self) -> str:
+        """
+        Returns the collected data in the Prometheus text exposition format.
+        """
+        snapshot = self.snapshot()
+        prefix = self.namespace
+        lines = [f"# HELP {prefix}_operation_duration_seconds Latency of the operations of the managers.",
+                 f"# TYPE {prefix}_operation_duration_seconds histogram"]
+        for operation, data in sorted(snapshot["operations"].items()):
+            label = f'operation="{self.escape(operation)}"'
+            cumulative = 0
+            for bound, count in data["buckets"].items():
+                cumulative += count
+                lines.append(
+                    f'{prefix}_operation_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(
+                f"{prefix}_operation_duration_seconds_sum{{{label}}} {data['seconds']!r}")
+            lines.append(
+                f"{prefix}_operation_duration_seconds_count{{{label}}} {data['calls']}")
+
+        lines += [f"# HELP {prefix}_operation_failures_total Operations that raised an exception.",
+                  f"# TYPE {prefix}_operation_failures_total counter"]
+        for operation, data in sorted(snapshot["operations"].items()):
+            lines.append(
+                f'{prefix}_operation_failures_total{{operation="{self.escape(operation)}"}} {data["failures"]}')
+
+        lines += [f"# HELP {prefix}_validation_failures_total Rejected values by validator or setter and reason.",
+                  f"# TYPE {prefix}_validation_failures_total counter"]
+        for failure in snapshot["validation_failures"]:
+            lines.append(f'{prefix}_validation_failures_total{{source="{self.escape(failure["source"])}",'
+                         f'reason="{self.escape(failure["reason"])}"}} {failure["count"]}')
+
+        if "setter_profile" in snapshot:
+            lines += [f"# HELP {prefix}_setter_seconds_total Time attributed to the setters by the sampling profiler.",
+                      f"# TYPE {prefix}_setter_seconds_total counter"]
+            for setter, seconds in sorted(snapshot["setter_profile"]["seconds"].items()):
+                lines.append(
+                    f'{prefix}_setter_seconds_total{{setter="{self.escape(setter)}"}} {seconds!r}')
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
@@ -1,13 +1,63 @@
-from utils import string_has_numbers, string_has_special_characters, get_attributes_and_values, validate_date, random_string_generator
-from config import ITEM_CATEGORIES
-
-from random import randint
-from datetime import datetime
-from typing import Union
+from utils import string_has_numbers, string_has_special_characters, validate_optional_date, parse_date, format_date
+from config import CATEGORIES, ItemCategories
+from indexes import HashIndex, TrigramIndex, SortedIndex
+from ids import ACCOUNT_IDS, TRANSACTION_IDS
+from query import Predicate, from_filters, scan_rows
+from stats import AccountStatistics, AccountStats
+
+from contextlib import contextmanager
+from functools import lru_cache
+from operator import attrgetter
+from datetime import date
+from collections.abc import Mapping
+from typing import Iterable, Iterator, Union
 import warnings
 
 
-class Account:
+class Model:
+    """
+    Base class of the models with a declared field schema.
+
+    FIELDS maps every public field of the model to the types it accepts, the value of a field is stored in the
+    attribute of the same name prefixed with "_". The schema lets a model be copied and restored field by field
+    without introspection and without running the setters again. The models are slotted, subclasses declare
+    __slots__ for the stored fields, so instances carry no __dict__.
+
+    Methods:
+        snapshot: Returns the stored values of all fields.
+        restore: Puts back the values returned by snapshot.
+    """
+
+    __slots__ = ()
+
+    FIELDS = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._STORED_FIELDS = tuple("_" + field for field in cls.FIELDS)
+        cls._snapshot = attrgetter(*cls._STORED_FIELDS)
+
+    def snapshot(self) -> tuple:
+        return self._snapshot(self)
+
+    def restore(self, snapshot: tuple) -> None:
+        for attribute, value in zip(self._STORED_FIELDS, snapshot):
+            setattr(self, attribute, value)
+
+
+class Account(Model):
+    FIELDS = {
+        "id": [int, str],
+        "name": str,
+        "second_name": str,
+        "balance_cash": [int, float],
+        "balance_card": [int, float],
+        "account_created_date": str,
+    }
+    # weak references are used by the identity map of database.AccountRepository
+    __slots__ = ("testing_id", "__weakref__") + \
+        tuple("_" + field for field in FIELDS)
+
     id_index = 1
 
     def __init__(self, name, second_name, balance_cash, balance_card, testing_id=False) -> None:
@@ -18,7 +68,24 @@ class Account:
         self.balance_cash = balance_cash
         self.balance_card = balance_card
         self.id = self.id_generator()
-        self.account_created_date = datetime.today().strftime("%Y-%m-%d")
+        self.account_created_date = date.today().isoformat()
+
+    @classmethod
+    def from_record(cls, id, name, second_name, balance_cash, balance_card, account_created_date) -> "Account":
+        """
+        Rebuilds an account from an already validated record, e.g. a row loaded back from the database.
+        Setters and their validators are skipped.
+        """
+        account = cls.__new__(cls)
+        account.testing_id = False
+        account._id = id
+        account._name = name
+        account._second_name = second_name
+        account._balance_cash = balance_cash
+        account._balance_card = balance_card
+        account._account_created_date = account_created_date if isinstance(
+            account_created_date, int) else parse_date(account_created_date)
+        return account
 
     @property
     def name(self):
@@ -80,12 +147,18 @@ class Account:
 
     @property
     def account_created_date(self):
-        return self._account_created_date
+        return format_date(self._account_created_date)
 
     @account_created_date.setter
     def account_created_date(self, date):
-        validate_date(date)
-        self._account_created_date = date
+        self._account_created_date = parse_date(date)
+
+    @property
+    def account_created_ordinal(self) -> int:
+        """
+        Creation date of the account as a day ordinal, the form the date is stored in.
+        """
+        return self._account_created_date
 
     def validate_name(self, name_input):
         if isinstance(name_input, str):
@@ -111,7 +184,8 @@ class Account:
             raise ValueError("Balance cannot be less than 0")
 
     def id_generator(self):
-        return str(randint(0, 9))+str(randint(100_000_000, 999_999_999))
+        # unique among the accounts of every live AccountManager
+        return ACCOUNT_IDS.generate()
 
     def account_info(self):
         return f"Name: {self.name}, Second name: {self.second_name}, Cash balance: {self.balance_cash}, Card balance: {self.balance_card}, Account created: {self.account_created_date}"
@@ -123,19 +197,99 @@ class AccountManager:
 
     Attributes:
         accounts (dict): A dictionary that stores the accounts, where the key is the account ID and the value is the Account object.
+            Any mutable mapping can be used instead, e.g. database.AccountRepository to keep accounts in SQLite.
+        listeners (list): Objects notified about every added, updated and deleted account through their
+            account_added(account), account_updated(account, previous_id) and account_deleted(account) methods.
+        indexes (dict): Secondary indexes used by the filter methods, keyed by (attribute, kind).
 
     Methods:
         create_account: Creates a new account and adds it to the manager.
         add_account: Adds an account to the finance manager.
         update_account: Updates the attributes of an account.
+        transaction: Context in which updates of many accounts are kept or rolled back together.
         delete_account: Deletes an account from the finance manager.
         get_account: Retrieves an account by its ID.
         filter_account_name: Filters accounts based on the provided attributes and values.
         filter_account_balance: Filters accounts based on the specified balance criteria.
+        filter_account_date: Filters accounts based on their creation date.
+        create_index: Creates a secondary index used by the filter methods.
     """
 
-    def __init__(self):
-        self.accounts = {}
+    INDEX_KINDS = {"hash": HashIndex,
+                   "trigram": TrigramIndex, "sorted": SortedIndex}
+    INDEXABLE_ATTRIBUTES = {
+        "hash": ("name", "second_name"),
+        "trigram": ("name", "second_name"),
+        "sorted": ("balance_cash", "balance_card", "total_balance", "account_created_date"),
+    }
+
+    def __init__(self, accounts=None):
+        self.accounts = accounts if accounts is not None else {}
+        self.listeners = []
+        self.indexes = {}
+        self._transaction = None
+        ACCOUNT_IDS.register(self)
+
+    def __contains__(self, id) -> bool:
+        return id in self.accounts
+
+    def add_listener(self, listener) -> None:
+        """
+        Registers a listener notified about every added, updated and deleted account.
+
+        Raises:
+            TypeError: If the listener does not provide account_added, account_updated and account_deleted methods.
+        """
+        if all(callable(getattr(listener, method, None)) for method in ("account_added", "account_updated", "account_deleted")):
+            self.listeners.append(listener)
+        else:
+            raise TypeError(
+                "Listener should provide account_added, account_updated and account_deleted methods.")
+
+    def remove_listener(self, listener) -> None:
+        self.listeners.remove(listener)
+
+    def create_index(self, attribute: str, kind: str = "hash"):
+        """
+        Creates a secondary index kept up to date on every account change and used by the filter methods.
+
+        Args:
+            attribute (str): The indexed attribute, see INDEXABLE_ATTRIBUTES for the attributes supported by every kind.
+                "total_balance" indexes the sum of cash and card balances.
+            kind (str, optional): "hash" for exact name matches, "trigram" for name pattern search or "sorted"
+                for balance and creation date ranges. Defaults to "hash".
+
+        Returns:
+            The created index.
+
+        Raises:
+            ValueError: If the kind is unknown or the attribute cannot be indexed with it.
+        """
+        if kind not in self.INDEX_KINDS:
+            raise ValueError(
+                f"Index kind should be one of {', '.join(self.INDEX_KINDS)}, {kind} was given.")
+        if attribute not in self.INDEXABLE_ATTRIBUTES[kind]:
+            raise ValueError(
+                f"Attribute {attribute} cannot be indexed with {kind} index.")
+        if (attribute, kind) in self.indexes:
+            return self.indexes[(attribute, kind)]
+
+        if attribute == "total_balance":
+            def key(account): return account.balance_cash + account.balance_card
+        elif attribute == "account_created_date":
+            def key(account): return account.account_created_ordinal
+        else:
+            key = None
+
+        index = self.INDEX_KINDS[kind](attribute, key)
+        index.build(self.get_accounts())
+        self.indexes[(attribute, kind)] = index
+        self.add_listener(index)
+        return index
+
+    def drop_index(self, attribute: str, kind: str = "hash") -> None:
+        index = self.indexes.pop((attribute, kind))
+        self.remove_listener(index)
 
     # create_account is basically constructor for Account class plus adds that created accound to the manager
     def create_account(self, name: str, second_name: str, balance_cash: Union[int, float], balance_card: Union[int, float], testing_id=False) -> None:
@@ -168,7 +322,15 @@ class AccountManager:
 
         """
         if isinstance(account, Account):
+            if self.listeners and account.id in self.accounts:
+                replaced = self.accounts[account.id]
+                for listener in self.listeners:
+                    listener.account_deleted(replaced)
+
             self.accounts[account.id] = account
+
+            for listener in self.listeners:
+                listener.account_added(account)
         else:
             raise TypeError(
                 f"Account class object is expected, {type(account)} type was given.")
@@ -182,50 +344,81 @@ class AccountManager:
             **kwargs: Keyword arguments representing the attributes to update and their new values.
 
         Raises:
-            KeyError: If any of the provided attributes are not valid attributes of the Account model.
+            KeyError: If any of the provided attributes are not fields of the Account model.
+            ValueError: If the new ID already belongs to another account.
             Exception: If an unexpected error occurs while updating the account.
 
         Returns:
             None
         """
         account = self.get_account(id)
-        backup = get_attributes_and_values(account)
 
+        for key in fields:
+            if key not in Account.FIELDS:
+                raise KeyError(
+                    f"Failed to update account: {key} is not a valid attribute of Account.")
+
+        snapshot = account.snapshot()
+        if self._transaction is not None and account not in self._transaction:
+            self._transaction[account] = (id, snapshot)
+
+        renamed = False
         try:
             for key, value in fields.items():
-                if hasattr(account, key):
-                    if key == "id":
-                        original_id = getattr(account, "id")
-                        setattr(account, "id", value)
-                        self.accounts[value] = account
-                        del self.accounts[original_id]
-                    else:
-                        setattr(account, key, value)
+                if key == "id":
+                    if value != id and value in self.accounts:
+                        raise ValueError(
+                            f"Account with ID {value} already exists.")
+                    account.id = value
+                    self.accounts[account.id] = account
+                    del self.accounts[id]
+                    renamed = True
                 else:
-                    raise KeyError(
-                        f"{key} is not a valid attribute of Account.")
-        except KeyError as e:
-            for key, value in backup.items():
-                account.testing_id = True
-                setattr(account, key, value)
-            raise KeyError(f"Failed to update account: {e}") from e
-        except TypeError as e:
-            for key, value in backup.items():
-                account.testing_id = True
-                setattr(account, key, value)
-            raise e
-        except ValueError as e:
-            for key, value in backup.items():
-                account.testing_id = True
-                setattr(account, key, value)
-            raise e
+                    setattr(account, key, value)
+            self.save_account(account, previous_id=id)
         except Exception as e:
-            for key, value in backup.items():
-                account.testing_id = True
-                setattr(account, key, value)
+            current_id = account.id
+            account.restore(snapshot)
+            if renamed:
+                del self.accounts[current_id]
+                self.accounts[id] = account
+            if isinstance(e, (TypeError, ValueError)):
+                raise e
             raise Exception(
                 "Failed to update account due to an unexpected error.") from e
 
+    @contextmanager
+    def transaction(self):
+        """
+        Context in which account updates are kept or rolled back together.
+
+        Every account updated in the context is snapshotted the first time it is touched. If the context exits with an
+        exception, all touched accounts are restored from their snapshots, saved back and the exception is re-raised.
+        Nested contexts join the outermost one.
+
+        Example:
+            with account_manager.transaction():
+                account_manager.update_account(first_id, {"balance_cash": 10})
+                account_manager.update_account(second_id, {"balance_card": 20})
+        """
+        if self._transaction is not None:
+            yield
+            return
+
+        self._transaction = {}
+        try:
+            yield
+        except BaseException:
+            for account, (original_id, snapshot) in reversed(list(self._transaction.items())):
+                current_id = account.id
+                account.restore(snapshot)
+                if current_id != original_id:
+                    del self.accounts[current_id]
+                self.save_account(account, previous_id=current_id)
+            raise
+        finally:
+            self._transaction = None
+
     def delete_account(self, id: str, account_created_date: str, name: str, second_name: str) -> None:
         """
         Deletes an account from the finance manager.
@@ -240,11 +433,28 @@ class AccountManager:
             ValueError: If the account details do not match, the account cannot be deleted.
         """
         account = self.get_account(id)
-        if account.account_created_date == account_created_date and account.name == name and account.second_name == second_name:
+        if account.account_created_ordinal == parse_date(account_created_date) and account.name == name and account.second_name == second_name:
             del self.accounts[id]
+
+            for listener in self.listeners:
+                listener.account_deleted(account)
         else:
             raise ValueError("Account details do not match; cannot delete.")
 
+    def save_account(self, account: Account, previous_id=None) -> None:
+        """
+        Writes an already registered account back to the accounts storage after it was modified in place.
+
+        Args:
+            account (Account): The modified account.
+            previous_id (optional): ID of the account before the modification, if it was changed.
+        """
+        self.accounts[account.id] = account
+
+        for listener in self.listeners:
+            listener.account_updated(
+                account, account.id if previous_id is None else previous_id)
+
     def get_account(self, id: str) -> Account:
         """
         Retrieve an account by its ID.
@@ -296,11 +506,17 @@ class AccountManager:
                 raise TypeError(
                     f"String values are expected for the search, {type(value)} was given for {attribute} attribute")
 
+        kind = "trigram" if pattern_search else "hash"
+        indexed = {attribute: value for attribute,
+                   value in kwargs.items() if (attribute, kind) in self.indexes}
+        unindexed = {attribute: value for attribute,
+                     value in kwargs.items() if attribute not in indexed}
+
         accounts_found = []
 
-        for account in self.get_accounts():
+        for account in self._candidate_accounts([self.indexes[(attribute, kind)].search(value) for attribute, value in indexed.items()]):
             match = True
-            for attribute, value in kwargs.items():
+            for attribute, value in unindexed.items():
                 account_value = getattr(account, attribute)
                 if pattern_search:
                     if value not in account_value:
@@ -360,6 +576,11 @@ class AccountManager:
             if "balance_card" in kwargs and "balance_cash" in kwargs:
                 total_value = sum(
                     (kwargs["balance_card"], kwargs["balance_cash"]))
+                index = self.indexes.get(("total_balance", "sorted"))
+                if index is not None:
+                    ids = index.below(
+                        total_value) if total_under else index.above(total_value)
+                    return [self.accounts[id] for id in ids]
                 for account in self.get_accounts():
                     account_sum = account.balance_card + account.balance_cash
                     match = account_sum < total_value if total_under else account_sum > total_value
@@ -369,12 +590,23 @@ class AccountManager:
                 raise AttributeError(
                     "Both 'balance_card' and 'balance_cash' are required for total balance filtering.")
         else:
-            for account in self.get_accounts():
+            under = {"balance_card": card_under, "balance_cash": cash_under}
+            lookups = []
+            unindexed = {}
+            for attribute, value in kwargs.items():
+                index = self.indexes.get((attribute, "sorted"))
+                if index is None:
+                    unindexed[attribute] = value
+                else:
+                    lookups.append(index.below(value)
+                                   if under[attribute] else index.above(value))
+
+            for account in self._candidate_accounts(lookups):
                 match = True
-                if "balance_card" in kwargs:
+                if "balance_card" in unindexed:
                     match = match and check_balance(
                         account, "balance_card", kwargs["balance_card"], card_under)
-                if "balance_cash" in kwargs:
+                if "balance_cash" in unindexed:
                     match = match and check_balance(
                         account, "balance_cash", kwargs["balance_cash"], cash_under)
                 if match:
@@ -393,14 +625,9 @@ class AccountManager:
         Returns:
             list: A list of accounts that fall within the specified date range.
         """
-        def parse_date(date_str):
-            return datetime.strptime(date_str, "%Y-%m-%d")
-
         if start_date:
-            validate_date(start_date)
             start_date = parse_date(start_date)
             if end_date:
-                validate_date(end_date)
                 end_date = parse_date(end_date)
         else:
             raise ValueError(
@@ -410,10 +637,14 @@ class AccountManager:
             raise ValueError(
                 "Wrong arguments: either both start_date and end_date or start_date only should be provided, only end_date was provided")
 
+        index = self.indexes.get(("account_created_date", "sorted"))
+        if index is not None:
+            return [self.accounts[id] for id in index.search(start_date, end_date or start_date)]
+
         accounts_found = []
 
         for account in self.get_accounts():
-            account_created_date = parse_date(account.account_created_date)
+            account_created_date = account.account_created_ordinal
             if start_date and end_date:
                 if (start_date <= account_created_date <= end_date):
                     accounts_found.append(account)
@@ -423,13 +654,33 @@ class AccountManager:
 
         return accounts_found
 
+    def _candidate_accounts(self, lookups: list) -> list[Account]:
+        # accounts matching all index lookups, in the order of the first lookup, or all accounts if nothing was looked up
+        if not lookups:
+            return self.get_accounts()
+        first, others = lookups[0], [set(ids) for ids in lookups[1:]]
+        return [self.accounts[id] for id in first if all(id in ids for ids in others)]
+
     def get_accounts(self) -> list[Account]:
         return list(self.accounts.values())
 
 
-class Transaction:
+class Transaction(Model):
+    FIELDS = {
+        "transaction_id": [int, str],
+        "user_id": [int, str],
+        "cost": [int, float],
+        "payment_method": str,
+        "item": str,
+        "quantity": int,
+        "item_category": str,
+        "vendor": str,
+        "transaction_date": str,
+    }
+    __slots__ = ("testing_id",) + tuple("_" + field for field in FIELDS)
+
     PAYMENT_METHODS = ["CARD", "CASH"]
-    ITEM_CATEOGIRES = ITEM_CATEGORIES
+    ITEM_CATEOGIRES = ItemCategories()
 
     transaction_id_index = 1
 
@@ -437,19 +688,48 @@ class Transaction:
         self.testing_id = testing_id
 
         self.user_id = user_id
-        self.transaction_id = random_string_generator(length=20)
+        self.transaction_id = TRANSACTION_IDS.generate()
         self.cost = cost
         self.payment_method = payment_method
         self.item = item
         self.quantity = quantity
         self.item_category = item_category
         self.vendor = vendor
-        self.transaction_date = datetime.today().strftime("%Y-%m-%d")
+        self.transaction_date = date.today().isoformat()
+
+    @classmethod
+    def from_record(cls, transaction_id, user_id, cost, payment_method, item, quantity, item_category, vendor, transaction_date) -> "Transaction":
+        """
+        Rebuilds a transaction from an already validated record, e.g. a row loaded back from the database.
+        Setters and their validators are skipped.
+        """
+        transaction = cls.__new__(cls)
+        transaction.testing_id = False
+        transaction._transaction_id = transaction_id
+        transaction.user_id = user_id
+        transaction._cost = cost
+        transaction._payment_method = payment_method
+        transaction._item = item
+        transaction._quantity = quantity
+        transaction._item_category = item_category if isinstance(
+            item_category, int) else CATEGORIES.intern(item_category)
+        transaction._vendor = vendor
+        transaction._transaction_date = transaction_date if isinstance(
+            transaction_date, int) else parse_date(transaction_date)
+        return transaction
 
     @property
     def transaction_id(self):
         return self._transaction_id
 
+    @property
+    def user_id(self):
+        return self._user_id
+
+    @user_id.setter
+    def user_id(self, _user_id):
+        self._user_id = _user_id
+
     @transaction_id.setter
     def transaction_id(self, _transaction_id):
         if self.testing_id:
@@ -471,14 +751,8 @@ class Transaction:
 
     @cost.setter
     def cost(self, _cost):
-        if isinstance(_cost, (int, float)):
-            if _cost > 0:
-                self._cost = _cost
-            else:
-                raise ValueError("Cost of transaction cannot be less than 0.")
-        else:
-            raise TypeError(
-                "Value of cost should be either integer or float number.")
+        self.validate_cost(_cost)
+        self._cost = _cost
 
     @property
     def payment_method(self):
@@ -486,10 +760,8 @@ class Transaction:
 
     @payment_method.setter
     def payment_method(self, _payment_method):
-        if _payment_method in Transaction.PAYMENT_METHODS:
-            self._payment_method = _payment_method
-        else:
-            raise ValueError("Avaible payment methods are either card or cash")
+        self.validate_payment_method(_payment_method)
+        self._payment_method = _payment_method
 
     @property
     def item(self):
@@ -497,10 +769,8 @@ class Transaction:
 
     @item.setter
     def item(self, _item):
-        if isinstance(_item, str):
-            self._item = _item
-        else:
-            raise TypeError("Value for item field should be a string")
+        self.validate_item(_item)
+        self._item = _item
 
     @property
     def quantity(self):
@@ -508,25 +778,23 @@ class Transaction:
 
     @quantity.setter
     def quantity(self, _quantity):
-        if isinstance(_quantity, int):
-            if _quantity > 0:
-                self._quantity = _quantity
-            else:
-                raise ValueError("Quantity cannot be less than 0.")
-        else:
-            raise TypeError("Quantity value must be an integer.")
+        self.validate_quantity(_quantity)
+        self._quantity = _quantity
 
     @property
     def item_category(self):
-        return self._item_category
+        return CATEGORIES.name(self._item_category)
 
     @item_category.setter
     def item_category(self, _item_category):
-        if _item_category in Transaction.ITEM_CATEOGIRES:
-            self._item_category = _item_category
-        else:
-            raise ValueError(
-                f"Category {_item_category} is not supported category.")
+        self._item_category = CATEGORIES.code(_item_category)
+
+    @property
+    def item_category_code(self) -> int:
+        """
+        Code of the category interned in config.CATEGORIES, the form the category is stored in.
+        """
+        return self._item_category
 
     @property
     def vendor(self):
@@ -534,28 +802,227 @@ class Transaction:
 
     @vendor.setter
     def vendor(self, _vendor):
-        if isinstance(_vendor, str):
-            self._vendor = _vendor
-        else:
-            TypeError("Value for vendor should be of type string.")
+        self.validate_vendor(_vendor)
+        self._vendor = _vendor
 
     @property
     def transaction_date(self):
-        return self._transaction_date
+        return format_date(self._transaction_date)
 
     @transaction_date.setter
     def transaction_date(self, _transaction_date):
-        validate_date(_transaction_date)
-        self._transaction_date = _transaction_date
+        self._transaction_date = parse_date(_transaction_date)
+
+    @property
+    def transaction_ordinal(self) -> int:
+        """
+        Date of the transaction as a day ordinal, the form the date is stored in.
+        """
+        return self._transaction_date
+
+    @staticmethod
+    def validate_cost(cost_input):
+        if isinstance(cost_input, (int, float)):
+            if not cost_input > 0:
+                raise ValueError("Cost of transaction cannot be less than 0.")
+        else:
+            raise TypeError(
+                "Value of cost should be either integer or float number.")
+
+    @staticmethod
+    def validate_payment_method(payment_method_input):
+        if payment_method_input not in Transaction.PAYMENT_METHODS:
+            raise ValueError("Avaible payment methods are either card or cash")
+
+    @staticmethod
+    def validate_item(item_input):
+        if not isinstance(item_input, str):
+            raise TypeError("Value for item field should be a string")
+
+    @staticmethod
+    def validate_quantity(quantity_input):
+        if isinstance(quantity_input, int):
+            if not quantity_input > 0:
+                raise ValueError("Quantity cannot be less than 0.")
+        else:
+            raise TypeError("Quantity value must be an integer.")
+
+    @staticmethod
+    def validate_item_category(item_category_input):
+        if item_category_input not in CATEGORIES:
+            raise ValueError(
+                f"Category {item_category_input} is not supported category.")
+
+    @staticmethod
+    def validate_vendor(vendor_input):
+        if not isinstance(vendor_input, str):
+            raise TypeError("Value for vendor should be of type string.")
 
     def transaction_info(self):
         return f"Transaction ID: {self.transaction_id} \n item/service: {self.item} | category: {self.item_category} | quantity: {self.quantity} | cost: {self.cost} |  method of payment: {self.payment_method.lower()} | bought from: {self.vendor}"
 
 
+class InMemoryTransactionStore:
+    """
+    Default storage engine for TransactionManager, keeps one Transaction object per row in per-user lists.
+
+    Transactions are looked up through an index from transaction ID to its slot in the user's list. Removed transactions
+    leave a tombstone in their slot, so removal does not shift the rest of the list, and the user's list is compacted
+    once tombstones make up compaction_ratio of it or when the list is read.
+
+    Attributes:
+        transactions (dict): A dictionary where the key is the user ID and the value is the list of user's transactions.
+        compaction_ratio (float): Share of tombstones in a user's list that triggers its compaction.
+
+    Methods:
+        add: Stores a transaction.
+        add_many: Stores a batch of transactions.
+        get_user_transactions: Returns the list of transactions of a user.
+        get_transaction: Finds a single transaction of a user.
+        remove: Removes a single transaction of a user.
+        compact: Drops the tombstones of one or all users.
+        users: Returns IDs of users that have any transactions stored.
+    """
+
+    def __init__(self, compaction_ratio: float = 0.25):
+        if not (0 < compaction_ratio <= 1):
+            raise ValueError("Compaction ratio should be between 0 and 1.")
+
+        self.compaction_ratio = compaction_ratio
+        self._transactions = {}
+        self._slots = {}
+        self._tombstones = {}
+
+    @property
+    def transactions(self) -> dict:
+        self.compact()
+        return self._transactions
+
+    def add(self, transaction: Transaction) -> None:
+        user_id = transaction.user_id
+        if user_id in self._transactions.keys():
+            transactions = self._transactions[user_id]
+        else:
+            transactions = self._transactions[user_id] = []
+        self._slots[transaction.transaction_id] = len(transactions)
+        transactions.append(transaction)
+
+    def add_many(self, transactions: Iterable[Transaction]) -> None:
+        for transaction in transactions:
+            self.add(transaction)
+
+    def get_user_transactions(self, user_id) -> Union[list[Transaction], None]:
+        if self._tombstones.get(user_id):
+            self.compact(user_id)
+        return self._transactions.get(user_id)
+
+    def get_transaction(self, user_id, transaction_id) -> Union[Transaction, None]:
+        slot = self._slots.get(transaction_id)
+        transactions = self._transactions.get(user_id)
+        # the slot may belong to a list of another user, so the found transaction is checked before returning it
+        if slot is not None and transactions is not None and slot < len(transactions):
+            transaction = transactions[slot]
+            if transaction is not None and transaction.transaction_id == transaction_id:
+                return transaction
+
+    def remove(self, user_id, transaction_id) -> Union[Transaction, None]:
+        transaction = self.get_transaction(user_id, transaction_id)
+        if transaction is None:
+            return None
+
+        transactions = self._transactions[user_id]
+        transactions[self._slots.pop(transaction_id)] = None
+        tombstones = self._tombstones.get(user_id, 0) + 1
+        self._tombstones[user_id] = tombstones
+
+        if tombstones >= len(transactions) * self.compaction_ratio:
+            self.compact(user_id)
+        return transaction
+
+    def compact(self, user_id=None) -> None:
+        """
+        Drops tombstones left by removed transactions and reindexes the remaining ones.
+
+        Args:
+            user_id (optional): The user whose transactions should be compacted, all users are compacted if not given.
+        """
+        user_ids = [user_id] if user_id is not None else list(self._tombstones)
+        for user_id in user_ids:
+            if not self._tombstones.pop(user_id, 0):
+                continue
+            transactions = [
+                transaction for transaction in self._transactions[user_id] if transaction is not None]
+            self._transactions[user_id] = transactions
+            for slot, transaction in enumerate(transactions):
+                self._slots[transaction.transaction_id] = slot
+
+    def users(self) -> list:
+        self.compact()
+        return list(self._transactions.keys())
+
+    def __contains__(self, transaction_id) -> bool:
+        return transaction_id in self._slots
+
+    def __len__(self):
+        return len(self._slots)
+
+
+class BulkResult:
+    """
+    Outcome of TransactionManager.create_transactions_bulk.
+
+    Attributes:
+        transactions (list): Registered transactions, in the order of their rows.
+        errors (list): Tuples of the index of a rejected row and the exception that rejected it.
+    """
+
+    def __init__(self, transactions: list[Transaction], errors: list[tuple[int, Exception]]):
+        self.transactions = transactions
+        self.errors = errors
+
+    @property
+    def inserted(self) -> int:
+        return len(self.transactions)
+
+    @property
+    def rejected(self) -> int:
+        return len(self.errors)
+
+
 class TransactionManager:
-    def __init__(self, account_manager: AccountManager):
-        self.transacations = {}
+    """
+    The TransactionManager class registers transactions of accounts managed by AccountManager and keeps their balances up to date.
+
+    Attributes:
+        account_manager (AccountManager): Manager of the accounts the transactions belong to.
+        store: Storage engine holding the transactions, InMemoryTransactionStore by default.
+            Any object providing add, add_many, get_user_transactions, get_transaction, remove, users, transactions and
+            membership test of transaction IDs can be used,
+            e.g. storage.ColumnarTransactionStore for large volumes or archive.TieredTransactionStore to keep old
+            transactions in memory-mapped files.
+        listeners (list): Objects notified about every registered and reversed transaction through their
+            transaction_added(transaction) and transaction_reversed(transaction) methods, e.g. reports.SpendingRollups or
+            anomaly.AnomalyDetector.
+        statistics (AccountStatistics): Running count, sum and sum of squares of the costs of every account, per
+            payment method too, and its first and last transaction dates. It is the first listener, built from the
+            store in one pass when the manager is created.
+
+    The manager is not thread-safe, concurrency.ConcurrentTransactionManager can be used from many threads at once.
+    """
+
+    BULK_FIELDS = ("user_id", "cost", "payment_method", "item",
+                   "quantity", "item_category", "vendor")
+
+    def __init__(self, account_manager: AccountManager, store=None):
+        self.store = store if store is not None else InMemoryTransactionStore()
         self.account_manager = account_manager
+        self.statistics = AccountStatistics()
+        self.statistics.rebuild(self.store)
+        self.listeners = [self.statistics]
+
+    @property
+    def transacations(self) -> dict:
+        return self.store.transactions
 
     @property
     def account_manager(self):
@@ -569,11 +1036,179 @@ class TransactionManager:
             raise TypeError(
                 f"AccountManager instance is expected, {type(_account_manager)} type was given")
 
+    def add_listener(self, listener) -> None:
+        """
+        Registers a listener notified about every registered and reversed transaction.
+
+        Raises:
+            TypeError: If the listener does not provide transaction_added and transaction_reversed methods.
+        """
+        if callable(getattr(listener, "transaction_added", None)) and callable(getattr(listener, "transaction_reversed", None)):
+            self.listeners.append(listener)
+        else:
+            raise TypeError(
+                "Listener should provide transaction_added and transaction_reversed methods.")
+
+    def remove_listener(self, listener) -> None:
+        self.listeners.remove(listener)
+
     def create_transaction(self, user_id, cost, payment_method, item, quantity, item_category, vendor, testing_id=False):
         self.validate_account(user_id)
         self.add_transcation(Transaction(
             user_id, cost, payment_method, item, quantity, item_category, vendor, testing_id=testing_id))
 
+    def create_transactions_bulk(self, rows) -> BulkResult:
+        """
+        Registers a whole batch of transactions at once.
+
+        The batch is validated column by column: costs and quantities are range checked in one pass, every distinct
+        payment method, item, category, vendor, date and account is validated only once, and the balance of every
+        account is written once per batch. Invalid rows are reported and skipped, the rest of the batch is registered.
+
+        Args:
+            rows: Either an iterable of rows, where a row is a dict with BULK_FIELDS keys or a tuple of values in
+                BULK_FIELDS order, or a column batch, a dict mapping every field of BULK_FIELDS to a sequence of values.
+                Optional "transaction_date" key, column or eighth tuple value sets the date of a transaction,
+                today's date is used otherwise.
+
+        Returns:
+            BulkResult: Registered transactions and errors of the rejected rows.
+        """
+        columns, errors = self._to_columns(rows)
+
+        self._validate_numbers(
+            columns["cost"], (int, float), Transaction.validate_cost, errors)
+        self._validate_numbers(
+            columns["quantity"], (int,), Transaction.validate_quantity, errors)
+        for field, validator in (("payment_method", Transaction.validate_payment_method),
+                                 ("item", Transaction.validate_item),
+                                 ("item_category", Transaction.validate_item_category),
+                                 ("vendor", Transaction.validate_vendor),
+                                 ("transaction_date", validate_optional_date),
+                                 ("user_id", self.validate_account)):
+            self._validate_distinct(columns[field], validator, errors)
+
+        today = date.today().toordinal()
+        new_id = TRANSACTION_IDS.generate
+        user_ids, costs, payment_methods = columns["user_id"], columns["cost"], columns["payment_method"]
+        items, quantities, categories = columns["item"], columns["quantity"], columns["item_category"]
+        vendors, dates = columns["vendor"], columns["transaction_date"]
+
+        # running [account, cash, card] balances, rows that would take a balance below 0 are rejected like in update_balance
+        balances = {}
+        transactions = []
+
+        for index in range(len(user_ids)):
+            if index in errors:
+                continue
+
+            user_id = user_ids[index]
+            balance = balances.get(user_id)
+            if balance is None:
+                account = self.account_manager.get_account(user_id)
+                balance = balances[user_id] = [
+                    account, account.balance_cash, account.balance_card]
+
+            cost = costs[index]
+            column = 2 if payment_methods[index] == "CARD" else 1
+            if balance[column] - cost < 0:
+                errors[index] = ValueError("Balance cannot be less than 0")
+                continue
+            balance[column] -= cost
+
+            transactions.append(Transaction.from_record(new_id(), user_id, cost,
+                                                        payment_methods[index], items[index], quantities[index],
+                                                        categories[index], vendors[index], dates[index] or today))
+
+        for account, balance_cash, balance_card in balances.values():
+            account.balance_cash = balance_cash
+            account.balance_card = balance_card
+        self.store.add_many(transactions)
+
+        # every listener sees a transaction before the next one, like with add_transcation, so e.g. the statistics
+        # read by anomaly.AnomalyDetector count only the transactions up to the one it checks
+        listeners = self.listeners
+        for transaction in transactions:
+            for listener in listeners:
+                listener.transaction_added(transaction)
+
+        # accounts are saved after the listeners, so oplog.OperationLog writes the transactions before the balances
+        for account, _, _ in balances.values():
+            self.account_manager.save_account(account)
+
+        return BulkResult(transactions, sorted(errors.items(), key=lambda error: error[0]))
+
+    def _to_columns(self, rows) -> tuple[dict[str, list], dict[int, Exception]]:
+        fields = self.BULK_FIELDS + ("transaction_date",)
+        errors = {}
+
+        if isinstance(rows, Mapping):
+            missing = [field for field in self.BULK_FIELDS if field not in rows]
+            if missing:
+                raise KeyError(
+                    f"Column batch is missing {', '.join(missing)} column(s).")
+            columns = {field: list(rows[field]) for field in self.BULK_FIELDS}
+            size = len(columns["user_id"])
+            columns["transaction_date"] = list(
+                rows.get("transaction_date", [None] * size))
+            lengths = {field: len(column) for field, column in columns.items() if len(column) != size}
+            if lengths:
+                raise ValueError(
+                    f"All columns of the batch should have {size} values like user_id, "
+                    f"{', '.join(f'{field} has {length}' for field, length in lengths.items())}.")
+            return columns, errors
+
+        columns = {field: [] for field in fields}
+        for index, row in enumerate(rows):
+            if isinstance(row, Mapping):
+                values = [row.get(field) for field in fields]
+            elif isinstance(row, (str, bytes)) or not hasattr(row, "__len__"):
+                errors[index] = TypeError(
+                    f"Row should be a sequence or a mapping of values, {type(row)} was given.")
+                values = [None] * len(fields)
+            elif len(row) in (len(fields) - 1, len(fields)):
+                values = list(row) + [None] * (len(fields) - len(row))
+            else:
+                errors[index] = ValueError(
+                    f"Row should have {len(fields) - 1} or {len(fields)} values, {len(row)} were given.")
+                values = [None] * len(fields)
+            for field, value in zip(fields, values):
+                columns[field].append(value)
+        return columns, errors
+
+    @staticmethod
+    def _validate_numbers(values: list, types: tuple, validator, errors: dict[int, Exception]) -> None:
+        # single pass range check, the validator only runs for the suspicious rows to confirm them and build the error
+        candidates = [index for index, value in enumerate(values)
+                      if type(value) not in types or not value > 0]
+        for index in candidates:
+            try:
+                validator(values[index])
+            except (TypeError, ValueError) as e:
+                errors.setdefault(index, e)
+
+    @staticmethod
+    def _validate_distinct(values: list, validator, errors: dict[int, Exception]) -> None:
+        outcomes = {}
+
+        def check(value):
+            try:
+                validator(value)
+            except (TypeError, ValueError) as e:
+                return e
+
+        for index, value in enumerate(values):
+            try:
+                key = (type(value), value)
+                if key not in outcomes:
+                    outcomes[key] = check(value)
+                error = outcomes[key]
+            except TypeError:
+                # unhashable values cannot be cached
+                error = check(value)
+            if error is not None:
+                errors.setdefault(index, error)
+
     def add_transcation(self, transaction: Transaction) -> None:
         """
         Adds a transaction to the transaction manager.
@@ -590,14 +1225,17 @@ class TransactionManager:
         if isinstance(transaction, Transaction):
             user_id = transaction.user_id
             self.validate_account(user_id)
-            if user_id in self.transacations.keys():
-                self.transacations[user_id].append(transaction)
-            else:
-                self.transacations[user_id] = [transaction]
 
             account = self.account_manager.get_account(user_id)
 
-            self.update_balance(account, transaction)
+            # balance is updated first, so a transaction rejected by the balance validation is not stored, and the
+            # account is saved last, so oplog.OperationLog writes the transaction before the balance it changed
+            self.update_balance(account, transaction, save=False)
+            self.store.add(transaction)
+
+            for listener in self.listeners:
+                listener.transaction_added(transaction)
+            self.account_manager.save_account(account)
         else:
             raise TypeError(
                 f"Transaction object is expected, {type(transaction)} instance was given")
@@ -609,7 +1247,7 @@ class TransactionManager:
             raise ValueError(
                 f"Transaction was not registered, account with ID {user_id} does not exist.") from e
 
-    def update_balance(self, account: Account, transaction: Transaction, reverse=False):
+    def update_balance(self, account: Account, transaction: Transaction, reverse=False, save=True):
         if not reverse:
             if transaction.payment_method == "CARD":
                 account.balance_card -= transaction.cost
@@ -621,10 +1259,13 @@ class TransactionManager:
             else:
                 account.balance_cash += transaction.cost
 
+        if save:
+            self.account_manager.save_account(account)
+
     def get_user_transactions(self, user_id):
         self.validate_account(user_id)
 
-        user_transactions = self.transacations.get(user_id)
+        user_transactions = self.store.get_user_transactions(user_id)
 
         if user_transactions is None:
             warnings.warn("There are no transactions for this user!")
@@ -634,72 +1275,97 @@ class TransactionManager:
     def get_user_transaction(self, user_id, transaction_id) -> Transaction:
         self.validate_account(user_id)
 
-        transactions = self.get_user_transactions(user_id)
-
-        for transaction in transactions:
-            if transaction.transaction_id == transaction_id:
-                return transaction
-
-    def reverse_transaction(self, user_id, transaction_id):
-        transactions = self.get_user_transactions(user_id)
+        return self.store.get_transaction(user_id, transaction_id)
 
-        account = self.account_manager.get_account(user_id)
+    def get_account_stats(self, user_id) -> Union[AccountStats, None]:
+        """
+        Returns the running aggregates of the transactions of an account without scanning them.
 
-        for index, transaction in enumerate(transactions):
-            if transaction.transaction_id == transaction_id:
-                self.update_balance(account, transaction, reverse=True)
-                del self.transacations[user_id][index]
+        Raises:
+            ValueError: If the account with the given ID does not exist.
 
+        Returns:
+            AccountStats: Aggregates of the account, None if it has no transactions.
+        """
+        self.validate_account(user_id)
 
-def get_input_attributes():
-    dummy_account = Account("dummyName", "dummySName", 1, 1, testing_id=True)
+        return self.statistics.get(user_id)
 
-    account_attributes_values = get_attributes_and_values(
-        dummy_account)
+    def query(self, predicate: Predicate = None, fields: Iterable[str] = None, order_by=None, limit: int = None,
+              offset: int = 0, **filters) -> Iterator:
+        """
+        Finds the transactions matching a predicate and keyword filters.
 
-    account_attributes_all = list(account_attributes_values.keys())
+        Predicates are built with query.where and combined with &, | and ~, e.g.
+        where("cost").between(10, 50) & where("item_category").isin(["PETS", "TRAVEL"]).
+        Stores providing a query method, e.g. storage.ColumnarTransactionStore, evaluate the query over their columns,
+        other stores are scanned transaction by transaction. Both look only at the transactions of the users
+        the query is limited to, if any.
 
-    account_mutable_attributes = [
-        attr for attr in account_attributes_all if attr not in ["testing_id", "id_index"]]
+        Args:
+            predicate (Predicate): Condition the transactions have to match, all transactions match if None.
+            fields (Iterable[str]): Fields to project the transactions to, transactions are returned if None.
+            order_by: Field or list of fields to sort by, prefixed with "-" for descending order. Transactions are
+                returned in the order of the store if None.
+            limit (int): Maximum number of returned transactions.
+            offset (int): Number of matching transactions to skip.
+            **filters: Keyword filters, see query.FILTERS, e.g. user_id, start_date, end_date, item_category or
+                min_cost.
 
-    dummy_transcation = Transaction(
-        1, 1, "CARD", "d", 1, "CLOTHING", "d", testing_id=True)
+        Returns:
+            Iterator: Matching transactions, or tuples of the projected fields, produced lazily.
 
-    transaction_attributes_values = get_attributes_and_values(
-        dummy_transcation)
+        Raises:
+            KeyError: If a keyword filter is unknown.
+            ValueError: If a field cannot be queried, or limit or offset is negative.
+        """
+        filtered = from_filters(**filters)
+        if filtered is not None:
+            predicate = filtered if predicate is None else predicate & filtered
 
-    transaction__attributes_all = list(transaction_attributes_values.keys())
+        run = getattr(self.store, "query", None)
+        if run is None:
+            return scan_rows(self.store, predicate, fields, order_by, limit, offset)
+        return run(predicate, fields, order_by, limit, offset)
 
-    transaction_mutable_attributes = [attr for attr in transaction__attributes_all if attr.islower()
-                                      and attr not in ["transaction_id_index", "testing_id"]]
+    def reverse_transaction(self, user_id, transaction_id):
+        account = self.account_manager.get_account(user_id)
 
-    account_mutable_attributes_and_types = {k: type(
-        v) for k, v in account_attributes_values.items() if k in account_mutable_attributes}
-    transaction_mutable_attributes_and_types = {k: type(
-        v) for k, v in transaction_attributes_values.items() if k in transaction_mutable_attributes}
+        transaction = self.store.remove(user_id, transaction_id)
 
-    for attr, type_ in account_mutable_attributes_and_types.items():
-        if type_ == int:
-            account_mutable_attributes_and_types[attr] = [
-                int, float]
+        if transaction is not None:
+            self.update_balance(account, transaction, reverse=True, save=False)
 
-    account_mutable_attributes_and_types["id"] = [int, str]
+            for listener in self.listeners:
+                listener.transaction_reversed(transaction)
+            self.account_manager.save_account(account)
 
-    transaction_mutable_attributes_and_types["transaction_id"] = [
-        int, str]
 
-    transaction_mutable_attributes_and_types["user_id"] = [
-        int, str]
+@lru_cache(maxsize=None)
+def get_input_attributes():
+    """
+    Builds the tables of the fields users can fill in and the types they accept from the field schemas of the models.
+    The tables do not depend on categories.json, they are built on first use and cached for good.
+    """
+    account_mutable_attributes_and_types = {
+        field: Account.FIELDS[field] for field in sorted(Account.FIELDS)}
+    transaction_mutable_attributes_and_types = {
+        field: Transaction.FIELDS[field] for field in sorted(Transaction.FIELDS)}
 
     return {"account": account_mutable_attributes_and_types, "transaction": transaction_mutable_attributes_and_types}
 
 
-input_attributes = get_input_attributes()
-
-account_attributes_and_types = input_attributes.get("account")
-transaction_attributes_and_types = input_attributes.get("transaction")
+def __getattr__(name):
+    # the attribute tables used to be built when the module was imported, now they are built on first access
+    if name == "input_attributes":
+        return get_input_attributes()
+    if name == "account_attributes_and_types":
+        return get_input_attributes().get("account")
+    if name == "transaction_attributes_and_types":
+        return get_input_attributes().get("transaction")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == "__main__":
 
-    print(account_attributes_and_types)
+    print(get_input_attributes().get("account"))
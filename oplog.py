@@ -0,0 +1,534 @@
+from models import Account, AccountManager, Transaction, TransactionManager
+
+from functools import lru_cache
+from typing import Iterator, Union
+import gc
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+
+
+# operation codes of the log records
+ACCOUNT_PUT = 1
+ACCOUNT_DELETE = 2
+TRANSACTION_ADD = 3
+TRANSACTION_REVERSE = 4
+SNAPSHOT_END = 5
+
+# every record starts with the length and the CRC32 of its payload, the first payload byte is the operation code
+RECORD_HEADER = struct.Struct("<II")
+# operation code, flags and the lengths of the string fields of the record, lengths are 32-bit since items and
+# vendors have no length limit
+ACCOUNT_HEAD = struct.Struct("<BB4I")
+ACCOUNT_DELETE_HEAD = struct.Struct("<BI")
+TRANSACTION_HEAD = struct.Struct("<BB6I")
+TRANSACTION_REVERSE_HEAD = struct.Struct("<B2I")
+SNAPSHOT_END_RECORD = struct.Struct("<BQ")
+
+SEGMENT_NAME = re.compile(r"^oplog-(\d{8})\.log$")
+SNAPSHOT_NAME = re.compile(r"^snapshot-(\d{8})\.bin$")
+
+
+def encode_key(key: Union[str, int]) -> bytes:
+    # IDs given out in testing mode are integers, they are prefixed so they are restored as integers
+    return f"#{key}".encode() if isinstance(key, int) else key.encode()
+
+
+def decode_key(raw: bytes) -> Union[str, int]:
+    return int(raw[1:]) if raw[:1] == b"#" else raw.decode()
+
+
+def frame(payload: bytes) -> bytes:
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def encode_account(account: Account, previous_id=None) -> bytes:
+    strings = (encode_key(account.id if previous_id is None else previous_id), encode_key(account.id),
+               account.name.encode(), account.second_name.encode())
+    lengths = tuple(map(len, strings))
+    # integers and floats are kept apart, so a balance of 100 is restored as 100 and not 100.0
+    flags = isinstance(account.balance_cash, int) | isinstance(
+        account.balance_card, int) << 1
+    return frame(ACCOUNT_HEAD.pack(ACCOUNT_PUT, flags, *lengths) + account_layout(flags, lengths).pack(
+        *strings, account.balance_cash, account.balance_card, account.account_created_ordinal))
+
+
+def encode_account_delete(id) -> bytes:
+    key = encode_key(id)
+    return frame(ACCOUNT_DELETE_HEAD.pack(ACCOUNT_DELETE, len(key)) + key)
+
+
+def encode_transaction(transaction: Transaction) -> bytes:
+    strings = (encode_key(transaction.transaction_id), encode_key(transaction.user_id),
+               transaction.payment_method.encode(), transaction.item.encode(), transaction.item_category.encode(),
+               transaction.vendor.encode())
+    lengths = tuple(map(len, strings))
+    flags = int(isinstance(transaction.cost, int))
+    return frame(TRANSACTION_HEAD.pack(TRANSACTION_ADD, flags, *lengths) + transaction_layout(flags, lengths).pack(
+        *strings, transaction.cost, transaction.quantity, transaction.transaction_ordinal))
+
+
+def encode_transaction_reverse(user_id, transaction_id) -> bytes:
+    strings = (encode_key(user_id), encode_key(transaction_id))
+    lengths = tuple(map(len, strings))
+    return frame(TRANSACTION_REVERSE_HEAD.pack(TRANSACTION_REVERSE, *lengths) + strings_layout(lengths).pack(*strings))
+
+
+# the string fields of most records have the same lengths, so the struct reading a whole record at once is cached
+@lru_cache(maxsize=4096)
+def strings_layout(lengths: tuple) -> struct.Struct:
+    return struct.Struct("<" + "".join(f"{length}s" for length in lengths))
+
+
+@lru_cache(maxsize=4096)
+def account_layout(flags: int, lengths: tuple) -> struct.Struct:
+    return struct.Struct(strings_layout(lengths).format + ("q" if flags & 1 else "d") + ("q" if flags & 2 else "d") + "i")
+
+
+@lru_cache(maxsize=4096)
+def transaction_layout(flags: int, lengths: tuple) -> struct.Struct:
+    return struct.Struct(strings_layout(lengths).format + ("q" if flags & 1 else "d") + "qi")
+
+
+class RecordReader:
+    """
+    Reads the record payloads of a log file in chunks, so files of any size are read in bounded memory.
+
+    Iterating the reader yields lists of payloads. Reading stops at the first incomplete or corrupted record, which is
+    what a crash in the middle of a write leaves behind, end is the offset right after the last complete record.
+
+    Attributes:
+        path (str): Path of the log file.
+        end (int): Offset in the file right after the last record read.
+        size (int): Size of the file.
+    """
+
+    def __init__(self, path: str, chunk_size: int = 1 << 24):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.end = 0
+        self.size = os.path.getsize(path)
+
+    def __iter__(self) -> Iterator[list[bytes]]:
+        header_size, unpack_header = RECORD_HEADER.size, RECORD_HEADER.unpack_from
+        crc32 = zlib.crc32
+        with open(self.path, "rb") as f:
+            data = b""
+            while True:
+                chunk = f.read(self.chunk_size)
+                data = data + chunk if data else chunk
+                payloads = []
+                offset, size = 0, len(data)
+                while offset + header_size <= size:
+                    length, checksum = unpack_header(data, offset)
+                    start = offset + header_size
+                    if start + length > size:
+                        break
+                    payload = data[start:start + length]
+                    if crc32(payload) != checksum:
+                        yield payloads
+                        self.end += offset
+                        return
+                    payloads.append(payload)
+                    offset = start + length
+                self.end += offset
+                data = data[offset:]
+                yield payloads
+                if not chunk:
+                    return
+
+    @property
+    def complete(self) -> bool:
+        return self.end == self.size
+
+
+class OperationLog:
+    """
+    Append-only binary log of the changes of an AccountManager and a TransactionManager, for recovery after a crash.
+
+    The log is registered as a listener of both managers and writes one record per created, updated or deleted
+    account and per added or reversed transaction. Records of accounts hold the whole account. The managers save an
+    account after the transaction listeners, so the record of a transaction comes before the record of the balance
+    it changed, and replaying a transaction changes the balance of its account as well, so a crash between the two
+    records cannot restore a balance without its transaction. Records are collected in memory and written with a single
+    write and fsync per group: once group_size records are waiting, once the oldest of them waited sync_interval
+    seconds, or when sync is called. A crash loses at most the records of the last group.
+
+    The log is kept in numbered segments in its directory. A snapshot writes the whole state of the managers in the
+    record format and starts a new segment, segments and snapshots older than the newest snapshot are removed.
+    Recovery loads the newest snapshot and replays only the segments written after it:
+
+        log = OperationLog("./oplog")
+        account_manager, transaction_manager = log.recover()
+        log.attach(account_manager, transaction_manager)
+
+    Attributes:
+        directory (str): Directory of the segments and snapshots.
+        group_size (int): Number of records written and synced at once.
+        sync_interval (float): Maximal number of seconds a record waits before it is synced.
+        snapshot_every (int, optional): Number of records after which a snapshot is taken, never if None.
+        segment (int): Number of the segment records are appended to.
+    """
+
+    def __init__(self, directory: str, group_size: int = 1000, sync_interval: float = 0.01,
+                 snapshot_every: int = 1_000_000):
+        if group_size < 1 or sync_interval <= 0:
+            raise ValueError(
+                "Group size and sync interval should be positive.")
+
+        self.directory = directory
+        self.group_size = group_size
+        self.sync_interval = sync_interval
+        self.snapshot_every = snapshot_every
+        self.account_manager = None
+        self.transaction_manager = None
+        self.segment = None
+
+        self._file = None
+        self._buffer = []
+        self._buffered_since = None
+        self._records_since_snapshot = 0
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._syncer = None
+        os.makedirs(directory, exist_ok=True)
+
+    # files
+
+    def files(self, pattern: re.Pattern) -> list[tuple[int, str]]:
+        numbered = []
+        for name in os.listdir(self.directory):
+            match = pattern.match(name)
+            if match:
+                numbered.append(
+                    (int(match.group(1)), os.path.join(self.directory, name)))
+        return sorted(numbered)
+
+    def segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"oplog-{number:08d}.log")
+
+    def snapshot_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"snapshot-{number:08d}.bin")
+
+    def sync_directory(self) -> None:
+        if hasattr(os, "O_DIRECTORY"):
+            descriptor = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(descriptor)
+            finally:
+                os.close(descriptor)
+
+    # writing
+
+    def attach(self, account_manager: AccountManager, transaction_manager: TransactionManager) -> None:
+        """
+        Starts logging the changes of the managers into a new segment.
+
+        Raises:
+            TypeError: If the managers are not AccountManager and TransactionManager instances.
+        """
+        if not isinstance(account_manager, AccountManager):
+            raise TypeError(
+                f"AccountManager instance is expected, {type(account_manager)} type was given")
+        if not isinstance(transaction_manager, TransactionManager):
+            raise TypeError(
+                f"TransactionManager instance is expected, {type(transaction_manager)} type was given")
+
+        numbers = [number for number, _ in self.files(SEGMENT_NAME) + self.files(SNAPSHOT_NAME)]
+        self.open_segment(max(numbers) + 1 if numbers else 0)
+
+        self.account_manager = account_manager
+        self.transaction_manager = transaction_manager
+        account_manager.add_listener(self)
+        transaction_manager.add_listener(self)
+
+        self._stop.clear()
+        self._syncer = threading.Thread(
+            target=self._sync_periodically, name="oplog-sync", daemon=True)
+        self._syncer.start()
+
+    def close(self) -> None:
+        """
+        Syncs the waiting records, stops logging and closes the segment.
+        """
+        if self._syncer is not None:
+            self._stop.set()
+            self._syncer.join()
+            self._syncer = None
+        if self.account_manager is not None:
+            self.account_manager.remove_listener(self)
+            self.transaction_manager.remove_listener(self)
+            self.account_manager = self.transaction_manager = None
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "OperationLog":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def open_segment(self, number: int) -> None:
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+        self.segment = number
+        self._file = open(self.segment_path(number), "ab")
+        self.sync_directory()
+
+    def append(self, record: bytes) -> None:
+        with self._lock:
+            self._buffer.append(record)
+            if self._buffered_since is None:
+                self._buffered_since = time.monotonic()
+            full = len(self._buffer) >= self.group_size
+        if full:
+            self.sync()
+
+        self._records_since_snapshot += 1
+        if self.snapshot_every is not None and self._records_since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def sync(self) -> None:
+        """
+        Writes the waiting records with a single write and makes them durable with a single fsync.
+        """
+        with self._io_lock:
+            with self._lock:
+                records, self._buffer = self._buffer, []
+                self._buffered_since = None
+            if records and self._file is not None:
+                self._file.write(b"".join(records))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def _sync_periodically(self) -> None:
+        while not self._stop.wait(self.sync_interval / 2):
+            buffered_since = self._buffered_since
+            if buffered_since is not None and time.monotonic() - buffered_since >= self.sync_interval:
+                self.sync()
+
+    # listeners
+
+    def account_added(self, account: Account) -> None:
+        self.append(encode_account(account))
+
+    def account_updated(self, account: Account, previous_id) -> None:
+        self.append(encode_account(account, previous_id))
+
+    def account_deleted(self, account: Account) -> None:
+        self.append(encode_account_delete(account.id))
+
+    def transaction_added(self, transaction: Transaction) -> None:
+        self.append(encode_transaction(transaction))
+
+    def transaction_reversed(self, transaction: Transaction) -> None:
+        self.append(encode_transaction_reverse(
+            transaction.user_id, transaction.transaction_id))
+
+    # snapshots
+
+    def snapshot(self) -> str:
+        """
+        Writes the whole state of the attached managers to a snapshot and continues logging into a new segment.
+        Segments and snapshots made redundant by the new snapshot are removed.
+
+        Returns:
+            str: Path of the snapshot.
+        """
+        if self.account_manager is None:
+            raise ValueError(
+                "Snapshot requires the log to be attached to the managers.")
+
+        number = self.segment + 1
+        self.open_segment(number)
+        self._records_since_snapshot = 0
+
+        path = self.snapshot_path(number)
+        temporary = path + ".tmp"
+        count = 0
+        with open(temporary, "wb") as f:
+            records = []
+            for account in self.account_manager.get_accounts():
+                records.append(encode_account(account))
+            store = self.transaction_manager.store
+            for user_id in store.users():
+                for transaction in store.get_user_transactions(user_id) or []:
+                    records.append(encode_transaction(transaction))
+                    if len(records) >= 65536:
+                        count += len(records)
+                        f.write(b"".join(records))
+                        records.clear()
+            count += len(records)
+            records.append(
+                frame(SNAPSHOT_END_RECORD.pack(SNAPSHOT_END, count)))
+            f.write(b"".join(records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+        self.sync_directory()
+
+        for older, older_path in self.files(SEGMENT_NAME) + self.files(SNAPSHOT_NAME):
+            if older < number:
+                os.remove(older_path)
+        return path
+
+    # recovery
+
+    def recover(self, account_manager: AccountManager = None, transaction_manager: TransactionManager = None) -> tuple[AccountManager, TransactionManager]:
+        """
+        Rebuilds the state of the managers from the newest snapshot and the segments written after it.
+
+        Recovered changes are applied directly to the accounts and the transaction store, listeners are not notified,
+        so indexes and other listeners should be created after recovery. The running statistics of the transaction
+        manager are rebuilt from the store. A torn record at the end of the last segment,
+        left by a crash during a write, is cut off.
+
+        Args:
+            account_manager (AccountManager, optional): Empty manager to recover into, a new one is created if not given.
+            transaction_manager (TransactionManager, optional): Empty manager to recover into, a new one is created
+                if not given.
+
+        Returns:
+            tuple: The recovered AccountManager and TransactionManager.
+
+        Raises:
+            ValueError: If a snapshot or a segment other than the last one is damaged.
+        """
+        account_manager = account_manager if account_manager is not None else AccountManager()
+        transaction_manager = transaction_manager if transaction_manager is not None \
+            else TransactionManager(account_manager)
+
+        # recovery creates millions of objects which are never garbage, scanning them again and again would dominate
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self._recover(account_manager, transaction_manager)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        return account_manager, transaction_manager
+
+    def _recover(self, account_manager: AccountManager, transaction_manager: TransactionManager) -> None:
+        start = -1
+        snapshots = self.files(SNAPSHOT_NAME)
+        if snapshots:
+            start, path = snapshots[-1]
+            self.check_snapshot(path)
+            reader = RecordReader(path)
+            for payloads in reader:
+                if payloads and payloads[-1][0] == SNAPSHOT_END:
+                    payloads.pop()
+                self.replay(payloads, account_manager, transaction_manager)
+            if not reader.complete:
+                raise ValueError(f"Snapshot {path} is damaged.")
+
+        segments = [(number, path) for number, path in self.files(SEGMENT_NAME) if number >= start]
+        for position, (number, path) in enumerate(segments):
+            reader = RecordReader(path)
+            # the segment started by the snapshot gets the records of the operation the snapshot was taken in, e.g.
+            # the rest of a bulk insert whose transactions were all stored before the listeners were called
+            skip_present = number == start
+            for payloads in reader:
+                self.replay(payloads, account_manager, transaction_manager, skip_present, apply_balances=True)
+            if not reader.complete:
+                if position != len(segments) - 1:
+                    raise ValueError(f"Segment {path} is damaged.")
+                with open(path, "r+b") as f:
+                    f.truncate(reader.end)
+
+        # the running statistics of the manager did not see the replayed transactions
+        transaction_manager.statistics.rebuild(transaction_manager.store)
+
+    @staticmethod
+    def check_snapshot(path: str) -> None:
+        """
+        Checks that a snapshot was written completely, it has to end with the record holding the number of its records.
+
+        Raises:
+            ValueError: If the snapshot is damaged.
+        """
+        size = RECORD_HEADER.size + SNAPSHOT_END_RECORD.size
+        with open(path, "rb") as f:
+            f.seek(max(os.path.getsize(path) - size, 0))
+            data = f.read()
+        if len(data) == size:
+            length, checksum = RECORD_HEADER.unpack_from(data)
+            payload = data[RECORD_HEADER.size:]
+            if length == SNAPSHOT_END_RECORD.size and zlib.crc32(payload) == checksum and payload[0] == SNAPSHOT_END:
+                return
+        raise ValueError(f"Snapshot {path} is damaged.")
+
+    @staticmethod
+    def replay(payloads: Iterator[bytes], account_manager: AccountManager, transaction_manager: TransactionManager,
+               skip_present: bool = False, apply_balances: bool = False) -> None:
+        """
+        Applies record payloads to the managers. With skip_present, added transactions already in the store are
+        skipped. With apply_balances, added and reversed transactions change the balance of their account, as the
+        record of the account written after them may be lost, records of snapshots hold the balances already.
+        """
+        accounts = account_manager.accounts
+        store = transaction_manager.store
+        from_account = Account.from_record
+        from_transaction = Transaction.from_record
+        transaction_head, account_head = TRANSACTION_HEAD, ACCOUNT_HEAD
+        transaction_offset, account_offset = TRANSACTION_HEAD.size, ACCOUNT_HEAD.size
+
+        for payload in payloads:
+            operation = payload[0]
+            if operation == TRANSACTION_ADD:
+                _, flags, *lengths = transaction_head.unpack_from(payload)
+                transaction_id, user_id, payment_method, item, item_category, vendor, cost, quantity, ordinal = \
+                    transaction_layout(flags, tuple(lengths)).unpack_from(payload, transaction_offset)
+                transaction_id = decode_key(transaction_id)
+                if skip_present and transaction_id in store:
+                    continue
+                user_id = decode_key(user_id)
+                store.add(from_transaction(transaction_id, user_id, cost, payment_method.decode(),
+                                           item.decode(), quantity, item_category.decode(), vendor.decode(), ordinal))
+                if apply_balances:
+                    account = accounts.get(user_id)
+                    if account is not None:
+                        if payment_method == b"CARD":
+                            account._balance_card -= cost
+                        else:
+                            account._balance_cash -= cost
+            elif operation == ACCOUNT_PUT:
+                _, flags, *lengths = account_head.unpack_from(payload)
+                previous_id, raw_id, name, second_name, cash, card, ordinal = \
+                    account_layout(flags, tuple(lengths)).unpack_from(payload, account_offset)
+                id = decode_key(raw_id)
+                # both IDs are compared encoded, the ID changed only if the encodings differ
+                account = accounts.get(id) if previous_id == raw_id else None
+                if account is not None:
+                    # most records of accounts only change their balances, the loaded account is updated in place
+                    account._name, account._second_name = name.decode(), second_name.decode()
+                    account._balance_cash, account._balance_card = cash, card
+                    account._account_created_date = ordinal
+                else:
+                    accounts.pop(decode_key(previous_id), None)
+                    account = from_account(id, name.decode(), second_name.decode(), cash, card, ordinal)
+                accounts[id] = account
+            elif operation == TRANSACTION_REVERSE:
+                _, *lengths = TRANSACTION_REVERSE_HEAD.unpack_from(payload)
+                user_id, transaction_id = strings_layout(tuple(lengths)).unpack_from(
+                    payload, TRANSACTION_REVERSE_HEAD.size)
+                transaction = store.remove(decode_key(user_id), decode_key(transaction_id))
+                account = accounts.get(transaction.user_id) if apply_balances and transaction is not None else None
+                if account is not None:
+                    if transaction.payment_method == "CARD":
+                        account._balance_card += transaction.cost
+                    else:
+                        account._balance_cash += transaction.cost
+            elif operation == ACCOUNT_DELETE:
+                _, length = ACCOUNT_DELETE_HEAD.unpack_from(payload)
+                accounts.pop(decode_key(
+                    payload[ACCOUNT_DELETE_HEAD.size:ACCOUNT_DELETE_HEAD.size + length]), None)
+            else:
+                raise ValueError(f"Unknown operation {operation} in the log.")
@@ -0,0 +1,572 @@
+from utils import format_date, parse_date
+from config import CATEGORIES
+
+from bisect import bisect_left, bisect_right
+from datetime import date
+from heapq import nlargest, nsmallest
+from itertools import chain, islice
+from typing import Callable, Iterable, Iterator, Union
+
+
+QUERY_FIELDS = ("transaction_id", "user_id", "cost", "payment_method", "item", "quantity", "item_category",
+                "vendor", "transaction_date")
+NUMERIC_FIELDS = {"cost": "costs",
+                  "quantity": "quantities", "transaction_date": "dates"}
+# column of the codes and the encoder of the values of every dictionary-encoded field of the columnar stores
+CODED_FIELDS = {"user_id": ("user_column", "user_ids"), "item": ("item_column", "items"),
+                "vendor": ("vendor_column", "vendors"), "item_category": ("category_column", None),
+                "payment_method": ("payment_methods", None)}
+OPERATORS = ("eq", "in", "lt", "le", "gt", "ge", "between", "contains")
+# masks keep one byte per row, 1 for a matching row, and are combined as integers so & | ~ run over all rows at once
+MATCH = 1
+
+
+def ones(size: int) -> int:
+    return int.from_bytes(b"\x01" * size, "little")
+
+
+def to_ordinal(value) -> int:
+    if isinstance(value, str):
+        return parse_date(value)
+    if isinstance(value, date):
+        return value.toordinal()
+    return value
+
+
+class Predicate:
+    """
+    Base class of the query predicates. Predicates are combined with & (and), | (or) and ~ (not).
+
+    Every predicate can be evaluated row by row with matches, for any transaction store, and as a mask over the
+    columns of a columnar store with mask.
+    """
+
+    def __and__(self, other: "Predicate") -> "Predicate":
+        return And(self, other)
+
+    def __or__(self, other: "Predicate") -> "Predicate":
+        return Or(self, other)
+
+    def __invert__(self) -> "Predicate":
+        return Not(self)
+
+    def matches(self, transaction) -> bool:
+        raise NotImplementedError
+
+    def mask(self, source, rows: Union[list, None]) -> int:
+        raise NotImplementedError
+
+    def users(self) -> Union[set, None]:
+        """
+        Returns the user IDs the predicate is limited to, None if it matches transactions of any user.
+        """
+        return None
+
+    def date_range(self) -> Union[tuple, None]:
+        """
+        Returns the (first, last) date ordinals the predicate is limited to, None if it is not limited by date.
+        A missing bound is None.
+        """
+        return None
+
+
+class Condition(Predicate):
+    """
+    Compares a single field of the transactions with a value.
+
+    Attributes:
+        field (str): One of QUERY_FIELDS.
+        operator (str): One of OPERATORS. "between" takes a (lower, upper) pair with both bounds included,
+            "in" takes a collection of values and "contains" a substring of item or vendor.
+        value: The compared value. Dates are given as 'YYYY-mm-dd' strings, date objects or day ordinals.
+    """
+
+    def __init__(self, field: str, operator: str, value):
+        if field not in QUERY_FIELDS:
+            raise ValueError(f"Field {field} cannot be queried.")
+        if operator not in OPERATORS:
+            raise ValueError(
+                f"Operator should be one of {', '.join(OPERATORS)}, {operator} was given.")
+        if operator in ("lt", "le", "gt", "ge", "between") and field not in NUMERIC_FIELDS:
+            raise ValueError(
+                f"Field {field} can be compared only with eq, in and contains.")
+        if operator == "contains" and field not in ("item", "vendor"):
+            raise ValueError(
+                "Only item and vendor can be searched for a substring.")
+
+        if field == "transaction_date":
+            if operator == "between":
+                value = tuple(to_ordinal(bound) for bound in value)
+            elif operator == "in":
+                value = {to_ordinal(day) for day in value}
+            else:
+                value = to_ordinal(value)
+        elif operator == "in":
+            value = set(value)
+
+        self.field = field
+        self.operator = operator
+        self.value = value
+
+    def __repr__(self):
+        return f"Condition({self.field!r}, {self.operator!r}, {self.value!r})"
+
+    # row by row
+
+    def matches(self, transaction) -> bool:
+        value = transaction.transaction_ordinal if self.field == "transaction_date" else getattr(
+            transaction, self.field)
+        operator, expected = self.operator, self.value
+        if operator == "eq":
+            return value == expected
+        if operator == "in":
+            return value in expected
+        if operator == "between":
+            return expected[0] <= value <= expected[1]
+        if operator == "contains":
+            return expected in value
+        if operator == "lt":
+            return value < expected
+        if operator == "le":
+            return value <= expected
+        if operator == "gt":
+            return value > expected
+        return value >= expected
+
+    # columns
+
+    def mask(self, source, rows: Union[list, None]) -> int:
+        if self.field == "transaction_id":
+            values = source.transaction_ids if rows is None else list(
+                map(source.transaction_ids.__getitem__, rows))
+            expected = {self.value} if self.operator == "eq" else self.value
+            return int.from_bytes(bytes(map(expected.__contains__, values)), "little")
+        if self.field in NUMERIC_FIELDS:
+            return self.numeric_mask(self.column(source, NUMERIC_FIELDS[self.field], rows))
+        return self.coded_mask(source, rows)
+
+    @staticmethod
+    def column(source, name: str, rows: Union[list, None]):
+        column = getattr(source, name)
+        return column if rows is None else list(map(column.__getitem__, rows))
+
+    def numeric_mask(self, values) -> int:
+        # bound methods of the compared value run the comparisons in C, the value is a float so it compares
+        # correctly with integer columns as well
+        operator, expected = self.operator, self.value
+        if operator == "between":
+            lower, upper = float(expected[0]), float(expected[1])
+            return int.from_bytes(bytes(map(lower.__le__, values)), "little") \
+                & int.from_bytes(bytes(map(upper.__ge__, values)), "little")
+        if operator == "in":
+            return int.from_bytes(bytes(map({float(value) for value in expected}.__contains__, values)), "little")
+
+        expected = float(expected)
+        compare = {"eq": expected.__eq__, "lt": expected.__gt__, "le": expected.__ge__,
+                   "gt": expected.__lt__, "ge": expected.__le__}[operator]
+        return int.from_bytes(bytes(map(compare, values)), "little")
+
+    def codes(self, source) -> set:
+        """
+        Translates the compared value to the set of codes it matches in the column of the field.
+        """
+        values = [self.value] if self.operator == "eq" else self.value
+        if self.field == "item_category":
+            return {CATEGORIES.codes[value] for value in values if value in CATEGORIES.codes}
+        if self.field == "payment_method":
+            methods = source.PAYMENT_METHODS
+            return {methods.index(value) for value in values if value in methods}
+
+        encoder = getattr(source, CODED_FIELDS[self.field][1])
+        if self.operator == "contains":
+            return {code for value, code in encoder.codes.items() if self.value in value}
+        return {encoder.codes[value] for value in values if value in encoder.codes}
+
+    def coded_mask(self, source, rows: Union[list, None]) -> int:
+        codes = self.codes(source)
+        if not codes:
+            return 0
+
+        column_name = CODED_FIELDS[self.field][0]
+        if rows is None and self.field == "payment_method":
+            # one byte per row already, translate maps every byte to its match flag at once
+            table = bytes(MATCH if code in codes else 0 for code in range(256))
+            return int.from_bytes(source.payment_methods.tobytes().translate(table), "little")
+
+        values = self.column(source, column_name, rows)
+        if len(codes) == 1:
+            return int.from_bytes(bytes(map(next(iter(codes)).__eq__, values)), "little")
+        return int.from_bytes(bytes(map(codes.__contains__, values)), "little")
+
+    # pruning
+
+    def users(self) -> Union[set, None]:
+        if self.field == "user_id" and self.operator in ("eq", "in"):
+            return {self.value} if self.operator == "eq" else set(self.value)
+        return None
+
+    def date_range(self) -> Union[tuple, None]:
+        if self.field != "transaction_date":
+            return None
+        operator, value = self.operator, self.value
+        if operator == "between":
+            return value
+        if operator == "eq":
+            return value, value
+        if operator == "in":
+            return (min(value), max(value)) if value else (1, 0)
+        if operator in ("ge", "gt"):
+            return value + (operator == "gt"), None
+        return None, value - (operator == "lt")
+
+
+class And(Predicate):
+    def __init__(self, *predicates: Predicate):
+        self.predicates = predicates
+
+    def __repr__(self):
+        return f"And{self.predicates!r}"
+
+    def matches(self, transaction) -> bool:
+        return all(predicate.matches(transaction) for predicate in self.predicates)
+
+    def mask(self, source, rows: Union[list, None]) -> int:
+        mask = None
+        for predicate in self.predicates:
+            mask = predicate.mask(
+                source, rows) if mask is None else mask & predicate.mask(source, rows)
+            if not mask:
+                return 0
+        return mask
+
+    def users(self) -> Union[set, None]:
+        users = None
+        for predicate in self.predicates:
+            limited = predicate.users()
+            if limited is not None:
+                users = limited if users is None else users & limited
+        return users
+
+    def date_range(self) -> Union[tuple, None]:
+        first = last = None
+        limited = False
+        for predicate in self.predicates:
+            bounds = predicate.date_range()
+            if bounds is None:
+                continue
+            limited = True
+            if bounds[0] is not None:
+                first = bounds[0] if first is None else max(first, bounds[0])
+            if bounds[1] is not None:
+                last = bounds[1] if last is None else min(last, bounds[1])
+        return (first, last) if limited else None
+
+
+class Or(Predicate):
+    def __init__(self, *predicates: Predicate):
+        self.predicates = predicates
+
+    def __repr__(self):
+        return f"Or{self.predicates!r}"
+
+    def matches(self, transaction) -> bool:
+        return any(predicate.matches(transaction) for predicate in self.predicates)
+
+    def mask(self, source, rows: Union[list, None]) -> int:
+        mask = 0
+        for predicate in self.predicates:
+            mask |= predicate.mask(source, rows)
+        return mask
+
+    def users(self) -> Union[set, None]:
+        users = set()
+        for predicate in self.predicates:
+            limited = predicate.users()
+            if limited is None:
+                return None
+            users |= limited
+        return users
+
+
+class Not(Predicate):
+    def __init__(self, predicate: Predicate):
+        self.predicate = predicate
+
+    def __repr__(self):
+        return f"Not({self.predicate!r})"
+
+    def matches(self, transaction) -> bool:
+        return not self.predicate.matches(transaction)
+
+    def mask(self, source, rows: Union[list, None]) -> int:
+        size = len(source.transaction_ids) if rows is None else len(rows)
+        return self.predicate.mask(source, rows) ^ ones(size)
+
+
+class Field:
+    """
+    Builds conditions on a field, e.g. where("cost").between(10, 50) & where("item_category").isin(["PETS"]).
+    """
+
+    def __init__(self, name: str):
+        if name not in QUERY_FIELDS:
+            raise ValueError(f"Field {name} cannot be queried.")
+        self.name = name
+
+    def eq(self, value) -> Condition:
+        return Condition(self.name, "eq", value)
+
+    def ne(self, value) -> Predicate:
+        return Not(Condition(self.name, "eq", value))
+
+    def isin(self, values: Iterable) -> Condition:
+        return Condition(self.name, "in", values)
+
+    def lt(self, value) -> Condition:
+        return Condition(self.name, "lt", value)
+
+    def le(self, value) -> Condition:
+        return Condition(self.name, "le", value)
+
+    def gt(self, value) -> Condition:
+        return Condition(self.name, "gt", value)
+
+    def ge(self, value) -> Condition:
+        return Condition(self.name, "ge", value)
+
+    def between(self, lower, upper) -> Condition:
+        return Condition(self.name, "between", (lower, upper))
+
+    def contains(self, substring: str) -> Condition:
+        return Condition(self.name, "contains", substring)
+
+
+def where(field: str) -> Field:
+    return Field(field)
+
+
+FILTERS = ("user_id", "start_date", "end_date", "item_category", "payment_method", "vendor", "item",
+           "min_cost", "max_cost")
+
+
+def from_filters(**filters) -> Union[Predicate, None]:
+    """
+    Builds a predicate from keyword filters, every given filter has to match. Filters taking a collection of values,
+    user_id, item_category, payment_method, vendor and item, also accept a single value.
+
+    Raises:
+        KeyError: If a filter is unknown.
+    """
+    conditions = []
+    for name, value in filters.items():
+        if name not in FILTERS:
+            raise KeyError(f"{name} is not a valid query filter.")
+        if value is None:
+            continue
+        if name == "start_date":
+            conditions.append(Condition("transaction_date", "ge", value))
+        elif name == "end_date":
+            conditions.append(Condition("transaction_date", "le", value))
+        elif name == "min_cost":
+            conditions.append(Condition("cost", "ge", value))
+        elif name == "max_cost":
+            conditions.append(Condition("cost", "le", value))
+        elif isinstance(value, (str, int, float)):
+            conditions.append(Condition(name, "eq", value))
+        else:
+            conditions.append(Condition(name, "in", value))
+
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else And(*conditions)
+
+
+def sort_keys(order_by: Union[str, Iterable[str], None]) -> list[tuple[str, bool]]:
+    if order_by is None:
+        return []
+    keys = []
+    for key in [order_by] if isinstance(order_by, str) else order_by:
+        descending = key.startswith("-")
+        field = key.lstrip("-")
+        if field not in QUERY_FIELDS:
+            raise ValueError(f"Field {field} cannot be sorted by.")
+        keys.append((field, descending))
+    return keys
+
+
+def order(items: Iterable, keys: list[tuple[str, bool]], key_of: Callable, limit: Union[int, None]) -> Iterable:
+    """
+    Sorts items by the sort keys, only the first limit items are fully sorted if a limit is given for a single key.
+    """
+    if not keys:
+        return items
+    if len(keys) == 1 and limit is not None:
+        field, descending = keys[0]
+        select = nlargest if descending else nsmallest
+        return select(limit, items, key=key_of(field))
+
+    items = list(items)
+    # stable sorts from the last key to the first one give the order of all keys
+    for field, descending in reversed(keys):
+        items.sort(key=key_of(field), reverse=descending)
+    return items
+
+
+def paginate(items: Iterable, limit: Union[int, None], offset: int) -> Iterator:
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError("Limit and offset cannot be negative.")
+    return islice(items, offset, None if limit is None else offset + limit)
+
+
+def scan_rows(store, predicate: Predicate = None, fields: Iterable[str] = None, order_by=None,
+              limit: int = None, offset: int = 0) -> Iterator:
+    """
+    Runs a query row by row over any transaction store, pruned to the users the predicate is limited to.
+    """
+    keys = sort_keys(order_by)
+    fields = tuple(fields) if fields is not None else None
+    if fields is not None:
+        for field in fields:
+            if field not in QUERY_FIELDS:
+                raise ValueError(f"Field {field} cannot be queried.")
+
+    users = predicate.users() if predicate is not None else None
+    users = store.users() if users is None else users
+
+    def matching():
+        for user_id in users:
+            for transaction in store.get_user_transactions(user_id) or ():
+                if predicate is None or predicate.matches(transaction):
+                    yield transaction
+
+    def key_of(field):
+        if field == "transaction_date":
+            return lambda transaction: transaction.transaction_ordinal
+        return lambda transaction: getattr(transaction, field)
+
+    results = paginate(order(matching(), keys, key_of, None if limit is None else offset + limit),
+                       limit, offset)
+    if fields is None:
+        return results
+    return (tuple(getattr(transaction, field) for field in fields) for transaction in results)
+
+
+def candidate_rows(source, predicate: Union[Predicate, None]) -> Union[list, None]:
+    """
+    Returns the rows of a columnar store a query has to look at, taken from the partitions of the users or the dates
+    the predicate is limited to, whichever holds fewer rows. None means all rows.
+    """
+    if predicate is None:
+        return None
+
+    total = len(source.transaction_ids)
+    partitions = None
+    size = total
+
+    users = predicate.users()
+    if users is not None:
+        user_partitions = [source.user_rows[user_id]
+                           for user_id in users if user_id in source.user_rows]
+        user_size = sum(map(len, user_partitions))
+        if user_size < size:
+            partitions, size = user_partitions, user_size
+
+    bounds = predicate.date_range()
+    if bounds is not None:
+        days = source.date_keys()
+        start = 0 if bounds[0] is None else bisect_left(days, bounds[0])
+        end = len(days) if bounds[1] is None else bisect_right(days, bounds[1])
+        date_partitions = [source.date_rows[day] for day in days[start:end]]
+        date_size = sum(map(len, date_partitions))
+        if date_size < size:
+            partitions, size = date_partitions, date_size
+
+    # pruning pays off only when it drops a good share of the rows, the full columns are scanned faster otherwise
+    if partitions is None or size > total // 2:
+        return None
+    if len(partitions) == 1:
+        return list(partitions[0])
+    return sorted(chain.from_iterable(partitions))
+
+
+def scan_columns(source, predicate: Predicate = None, fields: Iterable[str] = None, order_by=None,
+                 limit: int = None, offset: int = 0) -> Iterator:
+    """
+    Runs a query over a columnar store, see storage.ColumnarTransactionStore for the columns it relies on.
+
+    The predicate is evaluated as masks over whole columns, or over the rows of the pruned partitions, the matching
+    rows are then found with bytes.find. Results are produced lazily, as views of the source or as tuples of the
+    projected fields which are decoded straight from the columns.
+
+    Raises:
+        RuntimeError: If the store is compacted while the results are iterated.
+    """
+    keys = sort_keys(order_by)
+    fields = tuple(fields) if fields is not None else None
+    if fields is not None:
+        for field in fields:
+            if field not in QUERY_FIELDS:
+                raise ValueError(f"Field {field} cannot be queried.")
+    paginate((), limit, offset)
+
+    generation = source.generation
+    rows = candidate_rows(source, predicate)
+    size = len(source.transaction_ids) if rows is None else len(rows)
+
+    # deleted rows are masked out as well
+    deleted = source.deleted if rows is None else bytes(
+        map(source.deleted.__getitem__, rows))
+    mask = int.from_bytes(deleted, "little") ^ ones(size)
+    if predicate is not None and mask:
+        mask &= predicate.mask(source, rows)
+    flags = mask.to_bytes(size, "little")
+
+    def matching():
+        position = flags.find(MATCH)
+        while position != -1:
+            yield position if rows is None else rows[position]
+            position = flags.find(MATCH, position + 1)
+
+    getters = {field: column_getter(source, field) for field in QUERY_FIELDS}
+
+    def key_of(field):
+        return getters[field] if field != "transaction_date" else source.dates.__getitem__
+
+    selected = paginate(order(matching(), keys, key_of, None if limit is None else offset + limit),
+                        limit, offset)
+
+    def results():
+        for row in selected:
+            if source.generation != generation:
+                raise RuntimeError(
+                    "Transaction store was compacted while it was queried.")
+            if fields is None:
+                yield source.view(row)
+            else:
+                yield tuple(getters[field](row) for field in fields)
+
+    return results()
+
+
+def column_getter(source, field: str) -> Callable[[int], object]:
+    """
+    Returns a function decoding the value of a field of a row straight from the columns of a columnar store.
+    """
+    if field == "transaction_id":
+        return source.transaction_ids.__getitem__
+    if field in ("cost", "quantity"):
+        return getattr(source, NUMERIC_FIELDS[field]).__getitem__
+    if field == "transaction_date":
+        dates = source.dates
+        return lambda row: format_date(dates[row])
+    if field == "item_category":
+        categories = source.category_column
+        return lambda row: CATEGORIES.name(categories[row])
+    if field == "payment_method":
+        methods, column = source.PAYMENT_METHODS, source.payment_methods
+        return lambda row: methods[column[row]]
+
+    column_name, encoder_name = CODED_FIELDS[field]
+    column, values = getattr(source, column_name), getattr(
+        source, encoder_name).values
+    return lambda row: values[column[row]]
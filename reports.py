@@ -0,0 +1,402 @@
+from models import Transaction, TransactionManager
+from config import CATEGORIES
+from utils import format_date
+
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import accumulate, compress
+from math import isclose
+from typing import Iterable, Union
+import gc
+import mmap
+import os
+import tempfile
+
+
+class SpendingRollups:
+    """
+    Incrementally updated spending totals of a TransactionManager.
+
+    The rollups are registered as a listener of the manager, so every registered and reversed transaction updates
+    them and reports read totals in O(1) instead of walking the transaction history. Every rollup maps its key to
+    a [total cost, number of transactions] pair. Categories are keyed by their integer codes in config.CATEGORIES,
+    the methods taking a category accept its name.
+
+    Attributes:
+        transaction_manager (TransactionManager): Manager whose transactions are rolled up.
+        by_day (dict): Totals keyed by (user_id, category code, "YYYY-MM-DD").
+        by_month (dict): Totals keyed by (user_id, category code, "YYYY-MM").
+        by_category (dict): Totals keyed by (user_id, category code).
+        by_user_month (dict): Totals keyed by (user_id, "YYYY-MM").
+        by_payment_method (dict): Totals keyed by (user_id, payment method).
+
+    Methods:
+        spend: Total spend of a user, optionally narrowed to a category and a month or a day.
+        spend_by_category: Total spend of a user per category, optionally within a month.
+        spend_by_payment_method: Total spend of a user per payment method.
+        rebuild: Recomputes all rollups from the stored transactions, optionally in worker processes.
+        verify: Compares the rollups with a full scan of the stored transactions.
+    """
+
+    ROLLUPS = ("by_day", "by_month", "by_category",
+               "by_user_month", "by_payment_method")
+
+    def __init__(self, transaction_manager: TransactionManager):
+        if not isinstance(transaction_manager, TransactionManager):
+            raise TypeError(
+                f"TransactionManager instance is expected, {type(transaction_manager)} type was given")
+
+        self.transaction_manager = transaction_manager
+        self.rebuild()
+        transaction_manager.add_listener(self)
+
+    def transaction_added(self, transaction: Transaction) -> None:
+        self.apply(transaction, 1)
+
+    def transaction_reversed(self, transaction: Transaction) -> None:
+        self.apply(transaction, -1)
+
+    def apply(self, transaction: Transaction, sign: int) -> None:
+        user_id, category, day = transaction.user_id, transaction.item_category_code, transaction.transaction_date
+        month = day[:7]
+        cost = sign * transaction.cost
+
+        for rollup, key in ((self.by_day, (user_id, category, day)),
+                            (self.by_month, (user_id, category, month)),
+                            (self.by_category, (user_id, category)),
+                            (self.by_user_month, (user_id, month)),
+                            (self.by_payment_method, (user_id, transaction.payment_method))):
+            totals = rollup.get(key)
+            if totals is None:
+                rollup[key] = [cost, sign]
+            elif totals[1] + sign == 0:
+                del rollup[key]
+            else:
+                totals[0] += cost
+                totals[1] += sign
+
+    def spend(self, user_id, category: str = None, month: str = None, day: str = None) -> Union[int, float]:
+        """
+        Returns the total spend of a user.
+
+        Args:
+            user_id: The ID of the user.
+            category (str, optional): Narrows the total to a single category.
+            month (str, optional): Narrows the total to a month in the format 'YYYY-MM'.
+            day (str, optional): Narrows the total to a day in the format 'YYYY-MM-DD', requires category.
+
+        Raises:
+            ValueError: If day is given without category or together with month.
+        """
+        if category is not None:
+            category = CATEGORIES.codes.get(category)
+            if category is None:
+                return 0
+
+        if day is not None:
+            if category is None or month is not None:
+                raise ValueError(
+                    "Daily totals are kept per category, provide category and day only.")
+            totals = self.by_day.get((user_id, category, day))
+        elif category is not None and month is not None:
+            totals = self.by_month.get((user_id, category, month))
+        elif category is not None:
+            totals = self.by_category.get((user_id, category))
+        elif month is not None:
+            totals = self.by_user_month.get((user_id, month))
+        else:
+            return sum(self.spend_by_payment_method(user_id).values())
+        return totals[0] if totals else 0
+
+    def spend_by_category(self, user_id, month: str = None) -> dict[str, Union[int, float]]:
+        spend = {}
+        for category in Transaction.ITEM_CATEOGIRES:
+            code = CATEGORIES.codes[category]
+            totals = self.by_category.get((user_id, code)) if month is None \
+                else self.by_month.get((user_id, code, month))
+            if totals and totals[0]:
+                spend[category] = totals[0]
+        return spend
+
+    def spend_by_payment_method(self, user_id) -> dict[str, Union[int, float]]:
+        spend = {}
+        for payment_method in Transaction.PAYMENT_METHODS:
+            totals = self.by_payment_method.get((user_id, payment_method))
+            if totals:
+                spend[payment_method] = totals[0]
+        return spend
+
+    def rebuild(self, workers: int = None) -> None:
+        """
+        Drops all rollups and recomputes them from the transactions stored in the manager.
+
+        Args:
+            workers (int, optional): Number of worker processes the transactions are aggregated in, see
+                parallel_rollups. The transactions are aggregated in this process if None.
+        """
+        if workers is not None:
+            for rollup, totals in parallel_rollups(self.transaction_manager, workers).items():
+                setattr(self, rollup, totals)
+            return
+
+        for rollup in self.ROLLUPS:
+            setattr(self, rollup, {})
+        for transaction in self.scan():
+            self.apply(transaction, 1)
+
+    def verify(self) -> list[tuple[str, tuple]]:
+        """
+        Recomputes the rollups with a full scan of the stored transactions and compares them with the current ones.
+
+        Returns:
+            list: (rollup name, key) of every total that does not match, empty if the rollups are consistent.
+        """
+        expected = SpendingRollups.__new__(SpendingRollups)
+        expected.transaction_manager = self.transaction_manager
+        expected.rebuild()
+
+        mismatches = []
+        for rollup in self.ROLLUPS:
+            current, scanned = getattr(self, rollup), getattr(expected, rollup)
+            for key in current.keys() | scanned.keys():
+                current_totals, scanned_totals = current.get(key), scanned.get(key)
+                if current_totals is None or scanned_totals is None or current_totals[1] != scanned_totals[1] \
+                        or not isclose(current_totals[0], scanned_totals[0], rel_tol=1e-9, abs_tol=1e-6):
+                    mismatches.append((rollup, key))
+        return mismatches
+
+    def scan(self) -> Iterable[Transaction]:
+        store = self.transaction_manager.store
+        for user_id in store.users():
+            yield from store.get_user_transactions(user_id) or []
+
+
+# columns of the transactions written for the report workers, "rows" lists the rows grouped by user
+REPORT_COLUMNS = (("users", "L"), ("costs", "d"), ("payment_methods", "B"), ("categories", "H"), ("dates", "l"),
+                  ("deleted", "B"), ("rows", "Q"))
+# columns of the transactions mapped by a report worker, set by attach_columns
+worker_columns = None
+
+
+def export_columns(store, f) -> tuple[dict, list, list[int]]:
+    """
+    Writes the columns the rollups are computed from to a file.
+
+    Columnar stores are written column by column as they are, other stores are converted transaction by transaction.
+
+    Args:
+        store: Storage engine of a TransactionManager.
+        f: File opened for binary writing.
+
+    Returns:
+        tuple: Layout of the file, a dictionary where the key is the column name and the value is a
+            (typecode, offset, length) tuple, the user IDs indexed by the user codes of the users column, and the
+            cumulative number of rows of the users in the rows column.
+    """
+    if hasattr(store, "user_rows"):
+        users = store.user_ids.values
+        columns = {"users": store.user_column, "costs": store.costs, "payment_methods": store.payment_methods,
+                   "categories": store.category_column, "dates": store.dates, "deleted": array("B", store.deleted)}
+        rows = array("Q")
+        sizes = []
+        for user_id, user_rows in store.user_rows.items():
+            rows.extend(user_rows)
+            sizes.append(len(user_rows))
+        columns["rows"] = rows
+    else:
+        users = store.users()
+        columns = {name: array(typecode) for name, typecode in REPORT_COLUMNS}
+        sizes = []
+        methods = Transaction.PAYMENT_METHODS
+        for code, user_id in enumerate(users):
+            transactions = store.get_user_transactions(user_id) or []
+            sizes.append(len(transactions))
+            columns["users"].extend([code] * len(transactions))
+            for transaction in transactions:
+                columns["costs"].append(transaction.cost)
+                columns["payment_methods"].append(
+                    methods.index(transaction.payment_method))
+                columns["categories"].append(transaction.item_category_code)
+                columns["dates"].append(transaction.transaction_ordinal)
+        columns["deleted"] = array("B", bytes(len(columns["costs"])))
+        columns["rows"] = array("Q", range(len(columns["costs"])))
+
+    layout = {}
+    offset = 0
+    for name, typecode in REPORT_COLUMNS:
+        column = columns[name]
+        # columns start at multiples of 8 bytes, so the mapped file can be cast to any of the typecodes
+        f.write(bytes(-offset % 8))
+        offset += -offset % 8
+        f.write(column)
+        layout[name] = (typecode, offset, len(column))
+        offset += len(column) * column.itemsize
+    return layout, users, list(accumulate(sizes, initial=0))
+
+
+def attach_columns(path: str, layout: dict) -> None:
+    """
+    Maps the column file read-only into a report worker, the pages are shared with every other process mapping it.
+    """
+    global worker_columns
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+    view = memoryview(mapped)
+    worker_columns = {name: view[offset:offset + length * array(typecode).itemsize].cast(typecode)
+                      for name, (typecode, offset, length) in layout.items()}
+
+
+# rollup keys are packed into one integer, user code << USER_SHIFT | category code << CATEGORY_SHIFT | day ordinal,
+# month as year * 100 + month or payment method index, integers hash faster and cross processes as plain arrays
+USER_SHIFT = 36
+CATEGORY_SHIFT = 20
+LOW_BITS = (1 << CATEGORY_SHIFT) - 1
+
+
+def group(keys: list, costs: Iterable, counts: Iterable = None) -> tuple[array, array, array]:
+    """
+    Sums the costs and the counts, one per key if not given, of equal keys.
+
+    Returns:
+        tuple: Arrays of the distinct keys, their total costs and their counts.
+    """
+    totals = dict.fromkeys(keys, 0.0)
+    for key, cost in zip(keys, costs):
+        totals[key] += cost
+    if counts is None:
+        counted = Counter(keys)
+    else:
+        counted = dict.fromkeys(keys, 0)
+        for key, count in zip(keys, counts):
+            counted[key] += count
+    # both dictionaries keep the keys in the order of their first occurrence
+    return array("Q", totals), array("d", totals.values()), array("Q", counted.values())
+
+
+def aggregate_shard(start: int, end: int) -> dict[str, tuple[array, array, array]]:
+    """
+    Aggregates the rows start to end of the rows column, the rows of whole users, in a report worker.
+
+    Returns:
+        dict: Rollups keyed by the rollup name, as arrays of packed keys, total costs and counts, see group.
+    """
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        columns = worker_columns
+        rows = columns["rows"][start:end]
+        deleted = columns["deleted"]
+        rows = list(compress(rows, map((0).__eq__, map(deleted.__getitem__, rows))))
+
+        users = [user << USER_SHIFT for user in map(columns["users"].__getitem__, rows)]
+        costs = list(map(columns["costs"].__getitem__, rows))
+        day_keys = [user | category << CATEGORY_SHIFT | day for user, category, day in zip(
+            users, map(columns["categories"].__getitem__, rows), map(columns["dates"].__getitem__, rows))]
+
+        rollups = {"by_day": group(day_keys, costs),
+                   "by_payment_method": group(list(map(int.__or__, users, map(columns["payment_methods"].__getitem__,
+                                                                                rows))), costs)}
+
+        # the other rollups are sums of the daily totals, which are fewer than the rows
+        keys, totals, counts = rollups["by_day"]
+        months = {}
+        for day in {key & LOW_BITS for key in keys}:
+            day_date = date.fromordinal(day)
+            months[day] = day_date.year * 100 + day_date.month
+        month_keys = [key & ~LOW_BITS | months[key & LOW_BITS] for key in keys]
+        rollups["by_month"] = group(month_keys, totals, counts)
+        rollups["by_category"] = group([key & ~LOW_BITS for key in keys], totals, counts)
+        user_mask = ~((1 << USER_SHIFT) - 1)
+        rollups["by_user_month"] = group(
+            [key & user_mask | months[key & LOW_BITS] for key in keys], totals, counts)
+        return rollups
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def shard_bounds(offsets: list[int], shards: int) -> list[tuple[int, int]]:
+    """
+    Splits the rows column into at most the given number of shards of whole users with about the same number of rows.
+    """
+    total = offsets[-1]
+    bounds = []
+    start = 0
+    for offset in offsets[1:]:
+        if offset - start >= total / shards or offset == total:
+            if offset > start:
+                bounds.append((start, offset))
+            start = offset
+    return bounds
+
+
+def parallel_rollups(transaction_manager: TransactionManager, workers: int = None, shards_per_worker: int = 4,
+                     directory: str = None) -> dict[str, dict]:
+    """
+    Computes the rollups of SpendingRollups in worker processes.
+
+    The transactions are written once as columns to a temporary file which every worker maps into memory, so no
+    transaction is pickled. The users are split into shards of about the same number of rows and the workers
+    aggregate the shards in code space. The partial rollups are merged in this process, where the codes are decoded
+    to user IDs, category codes, dates, months and payment methods.
+
+    Args:
+        transaction_manager (TransactionManager): Manager whose transactions are aggregated.
+        workers (int, optional): Number of worker processes, os.cpu_count() if None.
+        shards_per_worker (int): Shards per worker, more shards even out the load of the workers.
+        directory (str, optional): Directory of the temporary column file, e.g. /dev/shm to keep it in memory.
+
+    Returns:
+        dict: Rollups keyed by their names in SpendingRollups.ROLLUPS.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers < 1 or shards_per_worker < 1:
+        raise ValueError("Number of workers and shards per worker should be positive.")
+
+    with tempfile.NamedTemporaryFile(prefix="report-columns-", dir=directory) as f:
+        layout, users, offsets = export_columns(transaction_manager.store, f)
+        f.flush()
+
+        bounds = shard_bounds(offsets, workers * shards_per_worker)
+        with ProcessPoolExecutor(max_workers=min(workers, len(bounds)) or 1, initializer=attach_columns,
+                                 initargs=(f.name, layout)) as executor:
+            partials = list(executor.map(aggregate_shard, *zip(*bounds))) if bounds else []
+
+    # keys are decoded by chains of maps over builtin methods, the merge is the serial part of the computation
+    methods = Transaction.PAYMENT_METHODS
+    category_mask = (1 << (USER_SHIFT - CATEGORY_SHIFT)) - 1
+    rollups = {name: {} for name in SpendingRollups.ROLLUPS}
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for partial in partials:
+            for name, (keys, totals, counts) in partial.items():
+                key_users = map(users.__getitem__, map(
+                    USER_SHIFT.__rrshift__, keys))
+                low = map(LOW_BITS.__and__, keys)
+                if name in ("by_day", "by_month", "by_category"):
+                    categories = map(category_mask.__and__, map(
+                        CATEGORY_SHIFT.__rrshift__, keys))
+                if name == "by_day":
+                    days = {ordinal: format_date(ordinal) for ordinal in set(
+                        map(LOW_BITS.__and__, keys))}
+                    decoded = zip(key_users, categories,
+                                  map(days.__getitem__, low))
+                elif name in ("by_month", "by_user_month"):
+                    months = {month: f"{month // 100:04d}-{month % 100:02d}" for month in set(
+                        map(LOW_BITS.__and__, keys))}
+                    decoded = zip(key_users, categories, map(months.__getitem__, low)) if name == "by_month" \
+                        else zip(key_users, map(months.__getitem__, low))
+                elif name == "by_category":
+                    decoded = zip(key_users, categories)
+                else:
+                    decoded = zip(key_users, map(methods.__getitem__, low))
+                # shards hold different users, so their keys never collide
+                rollups[name].update(
+                    zip(decoded, map(list, zip(totals, counts))))
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return rollups
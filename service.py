@@ -0,0 +1,434 @@
+from models import Account, AccountManager, Transaction, TransactionManager
+from metrics import METRICS
+
+from typing import Union
+from urllib.parse import parse_qsl, unquote, urlsplit
+import asyncio
+import json
+import warnings
+
+
+class FinanceService:
+    """
+    Exposes the AccountManager and TransactionManager operations as coroutines, for callers running in one event loop.
+
+    The managers are only ever called from the event loop thread, so they need no locking. Transactions created with
+    create_transaction are not registered one by one: they are queued and a background task coalesces them into
+    batches registered with TransactionManager.create_transactions_bulk, which validates and writes a whole batch at
+    once. A batch is committed when it reaches batch_size transactions or batch_delay seconds after its first
+    transaction arrived, whichever comes first. The queue is bounded by max_pending, once it is full
+    create_transaction waits for free space, which pushes back on the callers instead of letting the queue grow.
+
+    Use the service as an async context manager, or call start and stop, so that the batching task runs:
+
+        async with FinanceService(account_manager, transaction_manager) as service:
+            transaction = await service.create_transaction(user_id, 9.99, "CARD", "coffee", 1, "GROCERIES", "cafe")
+
+    Attributes:
+        account_manager (AccountManager): Manager of the accounts.
+        transaction_manager (TransactionManager): Manager of the transactions.
+        batch_size (int): Maximal number of transactions registered in one bulk commit.
+        batch_delay (float): Seconds a transaction waits for others to join its batch.
+        max_pending (int): Maximal number of queued transactions.
+    """
+
+    def __init__(self, account_manager: AccountManager, transaction_manager: TransactionManager,
+                 batch_size: int = 500, batch_delay: float = 0.002, max_pending: int = 10_000):
+        if not isinstance(account_manager, AccountManager):
+            raise TypeError(
+                f"AccountManager instance is expected, {type(account_manager)} type was given")
+        if not isinstance(transaction_manager, TransactionManager):
+            raise TypeError(
+                f"TransactionManager instance is expected, {type(transaction_manager)} type was given")
+        if batch_size < 1 or max_pending < 1:
+            raise ValueError(
+                "Batch size and maximal number of pending transactions should be positive.")
+
+        self.account_manager = account_manager
+        self.transaction_manager = transaction_manager
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.max_pending = max_pending
+        self._queue = None
+        self._batcher = None
+
+    async def start(self) -> None:
+        if self._batcher is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._batcher = asyncio.create_task(self._run_batches())
+
+    async def stop(self) -> None:
+        """
+        Commits the queued transactions and stops the batching task.
+        """
+        if self._batcher is not None:
+            await self._queue.join()
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+            self._batcher = None
+
+    async def __aenter__(self) -> "FinanceService":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.stop()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    # accounts
+
+    async def create_account(self, name: str, second_name: str, balance_cash: Union[int, float],
+                             balance_card: Union[int, float]) -> Account:
+        account = Account(name, second_name, balance_cash, balance_card)
+        self.account_manager.add_account(account)
+        return account
+
+    async def get_account(self, id: str) -> Account:
+        return self.account_manager.get_account(id)
+
+    async def get_accounts(self) -> list[Account]:
+        return self.account_manager.get_accounts()
+
+    async def update_account(self, id: str, fields: dict[str, Union[str, int, float]]) -> Account:
+        self.account_manager.update_account(id, fields)
+        return self.account_manager.get_account(fields.get("id", id))
+
+    async def delete_account(self, id: str, account_created_date: str, name: str, second_name: str) -> None:
+        self.account_manager.delete_account(
+            id, account_created_date, name, second_name)
+
+    async def filter_account_name(self, pattern_search: bool = False, **kwargs) -> list[Account]:
+        return self.account_manager.filter_account_name(pattern_search, **kwargs)
+
+    async def filter_account_balance(self, **kwargs) -> list[Account]:
+        return self.account_manager.filter_account_balance(**kwargs)
+
+    async def filter_account_date(self, start_date: str = None, end_date: str = None) -> list[Account]:
+        return self.account_manager.filter_account_date(start_date, end_date)
+
+    # transactions
+
+    async def create_transaction(self, user_id, cost, payment_method, item, quantity, item_category, vendor) -> Transaction:
+        """
+        Queues a transaction for the next bulk commit and waits until it is committed.
+
+        Returns:
+            Transaction: The registered transaction.
+
+        Raises:
+            RuntimeError: If the service was not started.
+            ValueError, TypeError: If the transaction was rejected by the validation.
+        """
+        if self._batcher is None:
+            raise RuntimeError(
+                "Service was not started, use it as an async context manager or call start first.")
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(((user_id, cost, payment_method, item, quantity, item_category, vendor), future))
+        return await future
+
+    async def get_user_transactions(self, user_id) -> list[Transaction]:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            transactions = self.transaction_manager.get_user_transactions(
+                user_id)
+        return list(transactions) if transactions is not None else []
+
+    async def get_user_transaction(self, user_id, transaction_id) -> Union[Transaction, None]:
+        return self.transaction_manager.get_user_transaction(user_id, transaction_id)
+
+    async def reverse_transaction(self, user_id, transaction_id) -> None:
+        self.transaction_manager.reverse_transaction(user_id, transaction_id)
+
+    async def _run_batches(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_delay
+            while len(batch) < self.batch_size:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(self._queue.get_nowait())
+
+            try:
+                self._commit(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _commit(self, batch: list) -> None:
+        try:
+            result = self.transaction_manager.create_transactions_bulk(
+                [row for row, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        errors = dict(result.errors)
+        transactions = iter(result.transactions)
+        for index, (_, future) in enumerate(batch):
+            outcome = errors.get(index)
+            # callers which gave up waiting leave cancelled futures behind, their rows are registered anyway
+            if future.done():
+                if outcome is None:
+                    next(transactions)
+            elif outcome is None:
+                future.set_result(next(transactions))
+            else:
+                future.set_exception(outcome)
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class FinanceServer:
+    """
+    Minimal HTTP/1.1 JSON API of a FinanceService, served over TCP or a Unix socket by asyncio streams.
+
+    Routes:
+        POST   /accounts                                      create an account
+        GET    /accounts                                      list accounts, name and second_name query parameters
+                                                              filter them, pattern=1 searches substrings
+        GET    /accounts/{id}                                 get an account
+        PATCH  /accounts/{id}                                 update attributes of an account
+        DELETE /accounts/{id}                                 delete an account, the body repeats its
+                                                              account_created_date, name and second_name
+        POST   /transactions                                  create a transaction
+        GET    /accounts/{id}/transactions                    list transactions of an account
+        GET    /accounts/{id}/transactions/{transaction_id}   get a transaction
+        DELETE /accounts/{id}/transactions/{transaction_id}   reverse a transaction
+        GET    /metrics                                       metrics.METRICS in the Prometheus text format,
+                                                              format=json returns them as JSON
+
+    Validation errors are answered with status 400, unknown accounts, transactions and routes with 404.
+    Connections are kept alive between requests. A connection is read only after the previous request on it was
+    answered, so a client waiting on the full transaction queue stops being read and TCP pushes back on it.
+
+    Attributes:
+        service (FinanceService): Service the requests are dispatched to.
+        max_body_size (int): Maximal size of a request body in bytes.
+    """
+
+    STATUS_REASONS = {200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+                      405: "Method Not Allowed", 413: "Payload Too Large", 414: "URI Too Long",
+                      431: "Request Header Fields Too Large", 500: "Internal Server Error"}
+
+    def __init__(self, service: FinanceService, max_body_size: int = 1 << 20):
+        self.service = service
+        self.max_body_size = max_body_size
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080, path: str = None) -> None:
+        """
+        Serves requests until cancelled, on the Unix socket at path if it is given and on host and port otherwise.
+        """
+        async with self.service:
+            if path is not None:
+                server = await asyncio.start_unix_server(self.handle_connection, path=path)
+            else:
+                server = await asyncio.start_server(self.handle_connection, host, port)
+            async with server:
+                await server.serve_forever()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+
+                try:
+                    status, payload = await self.dispatch(method, target, body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except (ValueError, TypeError, KeyError) as e:
+                    # validation errors of the models and the managers
+                    status, payload = 400, {"error": str(e)}
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self.write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except HTTPError as e:
+            await self.write_response(writer, e.status, {"error": str(e)}, False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_line(reader: asyncio.StreamReader, status: int, message: str) -> bytes:
+        try:
+            return await reader.readline()
+        except ValueError:
+            # the line is longer than the limit of the reader, the rest of the request cannot be parsed
+            raise HTTPError(status, message)
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Union[tuple, None]:
+        line = await self.read_line(reader, 414, "Request line is too long.")
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(400, "Malformed request line.")
+
+        headers = {}
+        while True:
+            line = await self.read_line(reader, 431, "Header line is too long.")
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            raise HTTPError(400, "Content-Length should be an integer.")
+        if length > self.max_body_size:
+            raise HTTPError(413, "Request body is too large.")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    async def write_response(self, writer: asyncio.StreamWriter, status: int, payload, keep_alive: bool) -> None:
+        # text payloads are Prometheus snapshots, everything else is sent as JSON
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), "text/plain; version=0.0.4"
+        else:
+            body, content_type = b"" if payload is None else json.dumps(payload).encode(), "application/json"
+        head = (f"HTTP/1.1 {status} {self.STATUS_REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def dispatch(self, method: str, target: str, body: bytes) -> tuple[int, object]:
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.split("/") if part]
+        query = dict(parse_qsl(url.query))
+        service = self.service
+
+        if parts == ["metrics"]:
+            if method != "GET":
+                raise HTTPError(405, f"Method {method} is not allowed.")
+            return 200, METRICS.snapshot() if query.get("format") == "json" else METRICS.to_prometheus()
+
+        if parts == ["transactions"]:
+            if method != "POST":
+                raise HTTPError(405, f"Method {method} is not allowed.")
+            fields = self.parse_body(body)
+            transaction = await service.create_transaction(*(fields.get(field) for field in TransactionManager.BULK_FIELDS))
+            return 201, self.transaction_to_dict(transaction)
+
+        if not parts or parts[0] != "accounts" or len(parts) > 4 or len(parts) >= 3 and parts[2] != "transactions":
+            raise HTTPError(404, "Not found.")
+
+        if len(parts) == 1:
+            if method == "POST":
+                fields = self.parse_body(body)
+                account = await service.create_account(fields.get("name"), fields.get("second_name"),
+                                                       fields.get("balance_cash"), fields.get("balance_card"))
+                return 201, self.account_to_dict(account)
+            if method == "GET":
+                pattern_search = query.pop("pattern", "0") not in ("0", "")
+                try:
+                    accounts = await service.filter_account_name(pattern_search, **query) if query \
+                        else await service.get_accounts()
+                except AttributeError as e:
+                    # the filter rejects attributes accounts cannot be searched by
+                    raise HTTPError(400, str(e))
+                return 200, [self.account_to_dict(account) for account in accounts]
+            raise HTTPError(405, f"Method {method} is not allowed.")
+
+        id = parts[1]
+        if id not in service.account_manager:
+            raise HTTPError(404, f"Account with ID {id} does not exist.")
+
+        if len(parts) == 2:
+            if method == "GET":
+                return 200, self.account_to_dict(await service.get_account(id))
+            if method == "PATCH":
+                account = await service.update_account(id, self.parse_body(body))
+                return 200, self.account_to_dict(account)
+            if method == "DELETE":
+                fields = self.parse_body(body)
+                await service.delete_account(id, fields.get("account_created_date"), fields.get("name"),
+                                             fields.get("second_name"))
+                return 204, None
+            raise HTTPError(405, f"Method {method} is not allowed.")
+
+        if len(parts) == 3:
+            if method != "GET":
+                raise HTTPError(405, f"Method {method} is not allowed.")
+            transactions = await service.get_user_transactions(id)
+            return 200, [self.transaction_to_dict(transaction) for transaction in transactions]
+
+        transaction_id = parts[3]
+        transaction = await service.get_user_transaction(id, transaction_id)
+        if transaction is None:
+            raise HTTPError(
+                404, f"Transaction with ID {transaction_id} does not exist.")
+        if method == "GET":
+            return 200, self.transaction_to_dict(transaction)
+        if method == "DELETE":
+            await service.reverse_transaction(id, transaction_id)
+            return 204, None
+        raise HTTPError(405, f"Method {method} is not allowed.")
+
+    @staticmethod
+    def parse_body(body: bytes) -> dict:
+        try:
+            fields = json.loads(body or b"{}")
+        except json.JSONDecodeError as e:
+            raise HTTPError(400, f"Request body is not valid JSON: {e}")
+        if not isinstance(fields, dict):
+            raise HTTPError(400, "Request body should be a JSON object.")
+        return fields
+
+    @staticmethod
+    def account_to_dict(account: Account) -> dict:
+        return {field: getattr(account, field) for field in Account.FIELDS}
+
+    @staticmethod
+    def transaction_to_dict(transaction: Transaction) -> dict:
+        return {field: getattr(transaction, field) for field in Transaction.FIELDS}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Serves the finance manager over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--unix", help="path of a Unix socket to serve on instead of TCP")
+    arguments = parser.parse_args()
+
+    account_manager = AccountManager()
+    service = FinanceService(
+        account_manager, TransactionManager(account_manager))
+    try:
+        asyncio.run(FinanceServer(service).serve(
+            arguments.host, arguments.port, arguments.unix))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,209 @@
+from utils import format_date
+
+from math import sqrt
+from typing import Iterable, Union
+
+
+class RunningStats:
+    """
+    Count, sum and sum of squares of a stream of values, updated in O(1) when a value is added or removed.
+
+    Attributes:
+        count (int): Number of values.
+        total (int | float): Sum of the values.
+        total_squares (int | float): Sum of the squares of the values.
+    """
+
+    __slots__ = ("count", "total", "total_squares")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.total_squares = 0
+
+    def add(self, value: Union[int, float]) -> None:
+        self.count += 1
+        self.total += value
+        self.total_squares += value * value
+
+    def remove(self, value: Union[int, float]) -> None:
+        self.count -= 1
+        if self.count:
+            self.total -= value
+            self.total_squares -= value * value
+        else:
+            # the last value is gone, starting from zero again drops the rounding errors of the removals
+            self.total = 0
+            self.total_squares = 0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def variance(self) -> float:
+        """
+        Population variance of the values, clamped at 0 against rounding errors.
+        """
+        if not self.count:
+            return 0.0
+        mean = self.total / self.count
+        return max(self.total_squares / self.count - mean * mean, 0.0)
+
+    @property
+    def std(self) -> float:
+        return sqrt(self.variance)
+
+    def copy(self) -> "RunningStats":
+        stats = RunningStats()
+        stats.count, stats.total, stats.total_squares = self.count, self.total, self.total_squares
+        return stats
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "total": self.total, "mean": self.mean, "variance": self.variance,
+                "std": self.std}
+
+
+class AccountStats:
+    """
+    Running aggregates of the transactions of one account.
+
+    The first and last transaction dates are kept from a count of transactions per day. Adding a transaction moves
+    them in O(1). Reversing the last transaction of the first or the last day leaves the boundary to be found again
+    among the remaining days the next time it is read.
+
+    Attributes:
+        costs (RunningStats): Costs of all transactions of the account.
+        by_payment_method (dict): RunningStats of the costs keyed by the payment method.
+        days (dict): Number of transactions keyed by the day ordinal.
+    """
+
+    __slots__ = ("costs", "by_payment_method", "days", "_first", "_last")
+
+    def __init__(self):
+        self.costs = RunningStats()
+        self.by_payment_method = {}
+        self.days = {}
+        self._first = None
+        self._last = None
+
+    def add(self, cost: Union[int, float], payment_method: str, day: int) -> None:
+        self.costs.add(cost)
+        stats = self.by_payment_method.get(payment_method)
+        if stats is None:
+            stats = self.by_payment_method[payment_method] = RunningStats()
+        stats.add(cost)
+
+        self.days[day] = self.days.get(day, 0) + 1
+        if self._first is not None and day < self._first or len(self.days) == 1:
+            self._first = day
+        if self._last is not None and day > self._last or len(self.days) == 1:
+            self._last = day
+
+    def remove(self, cost: Union[int, float], payment_method: str, day: int) -> None:
+        self.costs.remove(cost)
+        stats = self.by_payment_method[payment_method]
+        stats.remove(cost)
+        if not stats.count:
+            del self.by_payment_method[payment_method]
+
+        remaining = self.days[day] - 1
+        if remaining:
+            self.days[day] = remaining
+            return
+        del self.days[day]
+        if day == self._first:
+            self._first = None
+        if day == self._last:
+            self._last = None
+
+    @property
+    def first_ordinal(self) -> Union[int, None]:
+        if self._first is None and self.days:
+            self._first = min(self.days)
+        return self._first
+
+    @property
+    def last_ordinal(self) -> Union[int, None]:
+        if self._last is None and self.days:
+            self._last = max(self.days)
+        return self._last
+
+    @property
+    def first_date(self) -> Union[str, None]:
+        first = self.first_ordinal
+        return format_date(first) if first is not None else None
+
+    @property
+    def last_date(self) -> Union[str, None]:
+        last = self.last_ordinal
+        return format_date(last) if last is not None else None
+
+    def copy(self) -> "AccountStats":
+        stats = AccountStats()
+        stats.costs = self.costs.copy()
+        stats.by_payment_method = {payment_method: payment_stats.copy()
+                                   for payment_method, payment_stats in self.by_payment_method.items()}
+        stats.days = dict(self.days)
+        stats._first, stats._last = self._first, self._last
+        return stats
+
+    def to_dict(self) -> dict:
+        summary = self.costs.to_dict()
+        summary["first_date"] = self.first_date
+        summary["last_date"] = self.last_date
+        summary["by_payment_method"] = {payment_method: stats.to_dict()
+                                        for payment_method, stats in sorted(self.by_payment_method.items())}
+        return summary
+
+
+class AccountStatistics:
+    """
+    Running aggregates of the transactions of every account of a TransactionManager.
+
+    The statistics are registered as a listener of the manager, so every registered and reversed transaction updates
+    the aggregates of its account in O(1) and summaries and fraud heuristics read them without scanning the
+    transactions. The aggregates are built from the store in one pass when the manager is created. Transactions added
+    to the store directly are not seen, rebuild recomputes the aggregates from the store, e.g. at the end of oplog
+    recovery.
+
+    Attributes:
+        accounts (dict): AccountStats keyed by the user ID, accounts without transactions have no entry.
+
+    Methods:
+        get: Returns the aggregates of an account.
+        rebuild: Recomputes the aggregates of all accounts from a transaction store.
+    """
+
+    def __init__(self, transactions: Iterable = ()):
+        self.accounts = {}
+        for transaction in transactions:
+            self.transaction_added(transaction)
+
+    def transaction_added(self, transaction) -> None:
+        stats = self.accounts.get(transaction.user_id)
+        if stats is None:
+            stats = self.accounts[transaction.user_id] = AccountStats()
+        stats.add(transaction.cost, transaction.payment_method,
+                  transaction.transaction_ordinal)
+
+    def transaction_reversed(self, transaction) -> None:
+        stats = self.accounts.get(transaction.user_id)
+        if stats is None:
+            return
+        stats.remove(transaction.cost, transaction.payment_method,
+                     transaction.transaction_ordinal)
+        if not stats.costs.count:
+            del self.accounts[transaction.user_id]
+
+    def get(self, user_id) -> Union[AccountStats, None]:
+        return self.accounts.get(user_id)
+
+    def rebuild(self, store) -> None:
+        """
+        Drops all aggregates and recomputes them from the transactions of a store.
+        """
+        self.accounts = {}
+        for user_id in store.users():
+            for transaction in store.get_user_transactions(user_id) or ():
+                self.transaction_added(transaction)
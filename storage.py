@@ -0,0 +1,305 @@
+from models import Transaction
+from utils import format_date
+from config import CATEGORIES
+from query import Predicate, scan_columns
+
+from array import array
+from typing import Iterable, Iterator, Union
+
+
+class ColumnEncoder:
+    """
+    Dictionary encoder for repetitive string columns, every distinct value is stored once and rows keep its integer code.
+
+    Attributes:
+        values (list): Distinct values, the position in the list is the value's code.
+        codes (dict): Reverse lookup from value to its code.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def decode(self, code: int):
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class TransactionView(Transaction):
+    """
+    Read-only Transaction backed by a single row of a ColumnarTransactionStore.
+
+    Views are created only when transactions are requested from the store and hold nothing but a reference
+    to the store, the transaction ID and the row number, all fields are decoded from the columns on access.
+    The row number is looked up again after the store was compacted.
+    """
+
+    __slots__ = ("_store", "_row", "_generation")
+
+    def __init__(self, store: "ColumnarTransactionStore", row: int):
+        self._store = store
+        self._row = row
+        self._generation = store.generation
+        self._transaction_id = store.transaction_ids[row]
+
+    @property
+    def row(self) -> int:
+        if self._generation != self._store.generation:
+            row = self._store.row_index.get(self._transaction_id)
+            if row is None:
+                raise ValueError(
+                    f"Transaction {self._transaction_id} was removed from the store.")
+            self._row = row
+            self._generation = self._store.generation
+        return self._row
+
+    @property
+    def transaction_id(self):
+        return self._transaction_id
+
+    @property
+    def user_id(self):
+        return self._store.user_ids.decode(self._store.user_column[self.row])
+
+    @property
+    def cost(self):
+        return self._store.costs[self.row]
+
+    @property
+    def payment_method(self):
+        return Transaction.PAYMENT_METHODS[self._store.payment_methods[self.row]]
+
+    @property
+    def item(self):
+        return self._store.items.decode(self._store.item_column[self.row])
+
+    @property
+    def quantity(self):
+        return self._store.quantities[self.row]
+
+    @property
+    def item_category(self):
+        return CATEGORIES.name(self._store.category_column[self.row])
+
+    @property
+    def item_category_code(self):
+        return self._store.category_column[self.row]
+
+    @property
+    def vendor(self):
+        return self._store.vendors.decode(self._store.vendor_column[self.row])
+
+    @property
+    def transaction_date(self):
+        return format_date(self._store.dates[self.row])
+
+    @property
+    def transaction_ordinal(self):
+        return self._store.dates[self.row]
+
+    def __repr__(self):
+        return f"TransactionView(transaction_id={self._transaction_id!r})"
+
+
+class ColumnarTransactionStore:
+    """
+    Storage engine for TransactionManager that keeps transactions in typed, array-backed columns instead of
+    one Transaction object per row.
+
+    Costs are kept as float64, quantities as int64, dates as day ordinals, categories as their codes in
+    config.CATEGORIES and payment methods as indexes into Transaction.PAYMENT_METHODS.
+    User IDs, items and vendors are dictionary-encoded.
+    Transactions are handed out as TransactionView objects only when asked for.
+
+    Rows are found through an index from transaction ID to row number. Removed rows are only flagged as deleted
+    and the columns are compacted once deleted rows make up compaction_ratio of the store. Compaction renumbers the
+    rows and increments generation, which tells the views handed out before to look their rows up again.
+
+    Rows are partitioned by user and by transaction date, which lets query look only at the rows of the users or the
+    days a query is limited to.
+
+    Attributes:
+        user_rows (dict): A dictionary where the key is the user ID and the value is an array of the user's row numbers.
+        date_rows (dict): A dictionary where the key is the day ordinal and the value is an array of the row numbers of
+            that day.
+        row_index (dict): A dictionary where the key is the transaction ID and the value is its row number.
+        deleted (bytearray): Deleted flag of every row.
+        compaction_ratio (float): Share of deleted rows that triggers compaction.
+        generation (int): Number of compactions done so far.
+    """
+
+    PAYMENT_METHODS = Transaction.PAYMENT_METHODS
+
+    def __init__(self, compaction_ratio: float = 0.25):
+        if not (0 < compaction_ratio <= 1):
+            raise ValueError("Compaction ratio should be between 0 and 1.")
+
+        self.compaction_ratio = compaction_ratio
+
+        self.user_ids = ColumnEncoder()
+        self.items = ColumnEncoder()
+        self.vendors = ColumnEncoder()
+
+        self.transaction_ids = []
+        self.user_column = array("L")
+        self.costs = array("d")
+        self.quantities = array("q")
+        self.dates = array("l")
+        self.payment_methods = array("B")
+        self.item_column = array("L")
+        self.category_column = array("H")
+        self.vendor_column = array("L")
+        self.deleted = bytearray()
+
+        self.user_rows = {}
+        self.date_rows = {}
+        self._date_keys = None
+        self.row_index = {}
+        self._tombstones = 0
+        self.generation = 0
+
+    @property
+    def transactions(self) -> dict:
+        return {user_id: self.get_user_transactions(user_id) for user_id in self.user_rows}
+
+    def add(self, transaction: Transaction) -> None:
+        row = len(self.transaction_ids)
+
+        self.transaction_ids.append(transaction.transaction_id)
+        self.user_column.append(self.user_ids.encode(transaction.user_id))
+        self.costs.append(transaction.cost)
+        self.quantities.append(transaction.quantity)
+        self.dates.append(transaction.transaction_ordinal)
+        self.payment_methods.append(
+            Transaction.PAYMENT_METHODS.index(transaction.payment_method))
+        self.item_column.append(self.items.encode(transaction.item))
+        self.category_column.append(transaction.item_category_code)
+        self.vendor_column.append(self.vendors.encode(transaction.vendor))
+        self.deleted.append(0)
+
+        self.row_index[transaction.transaction_id] = row
+        if transaction.user_id in self.user_rows.keys():
+            self.user_rows[transaction.user_id].append(row)
+        else:
+            self.user_rows[transaction.user_id] = array("Q", [row])
+        day = transaction.transaction_ordinal
+        if day in self.date_rows:
+            self.date_rows[day].append(row)
+        else:
+            self.date_rows[day] = array("Q", [row])
+            self._date_keys = None
+
+    def add_many(self, transactions: Iterable[Transaction]) -> None:
+        for transaction in transactions:
+            self.add(transaction)
+
+    def get_user_transactions(self, user_id) -> Union[list[TransactionView], None]:
+        rows = self.user_rows.get(user_id)
+        if rows is None:
+            return None
+        deleted = self.deleted
+        return [TransactionView(self, row) for row in rows if not deleted[row]]
+
+    def find_row(self, user_id, transaction_id) -> Union[int, None]:
+        row = self.row_index.get(transaction_id)
+        if row is not None and self.user_column[row] == self.user_ids.codes.get(user_id):
+            return row
+
+    def get_transaction(self, user_id, transaction_id) -> Union[TransactionView, None]:
+        row = self.find_row(user_id, transaction_id)
+        if row is not None:
+            return TransactionView(self, row)
+
+    def remove(self, user_id, transaction_id) -> Union[Transaction, None]:
+        row = self.find_row(user_id, transaction_id)
+        if row is None:
+            return None
+
+        # removed transaction is returned detached from the columns, as compaction below renumbers the rows
+        transaction = self.materialize(row)
+        self.deleted[row] = 1
+        del self.row_index[transaction_id]
+        self._tombstones += 1
+
+        if self._tombstones >= len(self.transaction_ids) * self.compaction_ratio:
+            self.compact()
+        return transaction
+
+    def materialize(self, row: int) -> Transaction:
+        """
+        Copies a row into a standalone Transaction object.
+        """
+        view = TransactionView(self, row)
+        return Transaction.from_record(view.transaction_id, view.user_id, view.cost, view.payment_method, view.item,
+                                       view.quantity, view.item_category_code, view.vendor, view.transaction_ordinal)
+
+    def compact(self) -> None:
+        """
+        Rewrites the columns without the deleted rows and rebuilds the row indexes.
+        """
+        if not self._tombstones:
+            return
+
+        deleted = self.deleted
+        kept = [row for row in range(len(deleted)) if not deleted[row]]
+
+        self.transaction_ids = [self.transaction_ids[row] for row in kept]
+        for name in ("user_column", "costs", "quantities", "dates", "payment_methods", "item_column",
+                     "category_column", "vendor_column"):
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode,
+                    [column[row] for row in kept]))
+        self.deleted = bytearray(len(kept))
+
+        self.row_index = {transaction_id: row for row,
+                          transaction_id in enumerate(self.transaction_ids)}
+        self.user_rows = {user_id: array("Q") for user_id in self.user_rows}
+        decode = self.user_ids.decode
+        for row, code in enumerate(self.user_column):
+            self.user_rows[decode(code)].append(row)
+        self.date_rows = {}
+        for row, day in enumerate(self.dates):
+            if day in self.date_rows:
+                self.date_rows[day].append(row)
+            else:
+                self.date_rows[day] = array("Q", [row])
+        self._date_keys = None
+        self._tombstones = 0
+        self.generation += 1
+
+    def users(self) -> list:
+        return list(self.user_rows.keys())
+
+    def date_keys(self) -> list[int]:
+        """
+        Returns the sorted day ordinals the store has rows of.
+        """
+        if self._date_keys is None:
+            self._date_keys = sorted(self.date_rows)
+        return self._date_keys
+
+    def view(self, row: int) -> TransactionView:
+        return TransactionView(self, row)
+
+    def query(self, predicate: Predicate = None, fields: Iterable[str] = None, order_by=None, limit: int = None,
+              offset: int = 0) -> Iterator:
+        """
+        Runs a query over the columns, see TransactionManager.query.
+        """
+        return scan_columns(self, predicate, fields, order_by, limit, offset)
+
+    def __contains__(self, transaction_id) -> bool:
+        return transaction_id in self.row_index
+
+    def __len__(self):
+        return len(self.row_index)
@@ -0,0 +1,87 @@
+from anomaly import AnomalyDetector, VendorSketch, vendor_key
+from models import AccountManager, TransactionManager
+
+import unittest
+
+
+class AnomalyDetectorTest(unittest.TestCase):
+    """
+    The detector has to learn new accounts for warmup transactions and then flag outlier costs and new vendors,
+    whether the transactions are added one by one or in bulk.
+    """
+
+    def setUp(self):
+        self.account_manager = AccountManager({})
+        self.account_manager.create_account("John", "Smith", 10 ** 9, 10 ** 9)
+        self.user_id, = self.account_manager.accounts
+        self.manager = TransactionManager(self.account_manager)
+
+    def rows(self, vendors, cost: int = 20) -> list[tuple]:
+        return [(self.user_id, cost, "CASH", "item", 1, "GROCERIES", vendor) for vendor in vendors]
+
+    def test_bulk_insert_alerts_only_after_the_warmup(self):
+        detector = AnomalyDetector(self.manager, warmup=10)
+        self.manager.create_transactions_bulk(self.rows(f"Vendor {letter}" for letter in "ABCDEFGHIJKLMNO"))
+
+        alerts = detector.drain()
+        self.assertEqual([alert.value for alert in alerts], [f"Vendor {letter}" for letter in "KLMNO"])
+        self.assertTrue(all(alert.kind == "vendor" for alert in alerts))
+
+    def test_vendors_differing_in_digits_are_different(self):
+        detector = AnomalyDetector(self.manager, warmup=0)
+        self.manager.create_transactions_bulk(self.rows(["Store 114", "store  114", "Store 115", "STORE 115 "]))
+
+        self.assertEqual([alert.value for alert in detector.drain()], ["Store 114", "Store 115"])
+        self.assertEqual(vendor_key(" Store\t114 "), "store 114")
+
+    def test_outlier_cost_is_flagged(self):
+        detector = AnomalyDetector(self.manager, warmup=10)
+        for cost in (18, 20, 22, 19, 21, 20, 23, 17, 20, 21, 19, 20):
+            self.manager.create_transaction(self.user_id, cost, "CASH", "item", 1, "GROCERIES", "vendor")
+        self.assertEqual(detector.drain(), [])
+
+        self.manager.create_transaction(self.user_id, 5000, "CASH", "item", 1, "GROCERIES", "vendor")
+        alert, = detector.drain()
+        self.assertEqual((alert.kind, alert.value, alert.item_category), ("cost", 5000, "GROCERIES"))
+        self.assertGreaterEqual(alert.score, detector.threshold)
+
+    def test_history_is_learned_without_alerts(self):
+        self.manager.create_transactions_bulk(self.rows(f"Vendor {index}" for index in range(20)))
+        detector = AnomalyDetector(self.manager, warmup=10)
+
+        self.manager.create_transaction(self.user_id, 20, "CASH", "item", 1, "GROCERIES", "Vendor 3")
+        self.assertEqual(detector.drain(), [])
+        self.manager.create_transaction(self.user_id, 20, "CASH", "item", 1, "GROCERIES", "Vendor 20")
+        self.assertEqual([alert.value for alert in detector.drain()], ["Vendor 20"])
+
+    def test_alerts_beyond_the_queue_limit_are_dropped(self):
+        detector = AnomalyDetector(self.manager, warmup=0, max_alerts=3)
+        self.manager.create_transactions_bulk(self.rows(f"Vendor {index}" for index in range(5)))
+
+        self.assertEqual(len(detector.drain()), 3)
+        self.assertEqual(detector.dropped, 2)
+
+
+class VendorSketchTest(unittest.TestCase):
+
+    def test_added_keys_are_seen(self):
+        # keys of integers hash the same in every run
+        sketch = VendorSketch(1000)
+        self.assertFalse(any(sketch.add((1, index)) for index in range(1000)))
+        # only the fingerprints overwritten in full buckets are forgotten
+        missing = sum((1, index) not in sketch for index in range(1000))
+        self.assertLessEqual(missing, sketch.evicted)
+        self.assertLess(sum((2, index) in sketch for index in range(10_000)), 10)
+
+    def test_memory_is_fixed(self):
+        sketch = VendorSketch(100)
+        nbytes = sketch.nbytes
+        for index in range(10_000):
+            sketch.add((1, index))
+        self.assertEqual(sketch.nbytes, nbytes)
+        self.assertLessEqual(sketch.size, sketch.buckets * sketch.SLOTS)
+        self.assertGreater(sketch.evicted, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
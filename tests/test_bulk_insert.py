@@ -0,0 +1,84 @@
+from models import AccountManager, TransactionManager
+
+import unittest
+
+
+class BulkInsertTest(unittest.TestCase):
+    """
+    A bulk insert has to register the valid rows of a batch like create_transaction would and reject every invalid
+    row on its own, with the index of the row and the reason.
+    """
+
+    def setUp(self):
+        self.account_manager = AccountManager({})
+        self.account_manager.create_account("John", "Smith", 100, 50)
+        self.user_id, = self.account_manager.accounts
+        self.manager = TransactionManager(self.account_manager)
+
+    def row(self, cost=10, payment_method="CASH", **fields) -> dict:
+        row = {"user_id": self.user_id, "cost": cost, "payment_method": payment_method, "item": "item",
+               "quantity": 1, "item_category": "GROCERIES", "vendor": "vendor"}
+        row.update(fields)
+        return row
+
+    def balances(self) -> tuple:
+        account = self.account_manager.get_account(self.user_id)
+        return account.balance_cash, account.balance_card
+
+    def test_valid_rows_are_registered(self):
+        result = self.manager.create_transactions_bulk([
+            self.row(10), (self.user_id, 2.5, "CARD", "item", 2, "PETS", "vendor", "2024-01-10"),
+            self.row(5, transaction_date="2024-02-01")])
+
+        self.assertEqual((result.inserted, result.rejected), (3, 0))
+        self.assertEqual([transaction.cost for transaction in result.transactions], [10, 2.5, 5])
+        self.assertEqual([transaction.transaction_date for transaction in result.transactions][1:],
+                         ["2024-01-10", "2024-02-01"])
+        self.assertEqual(self.balances(), (85, 47.5))
+        self.assertEqual(len(self.manager.get_user_transactions(self.user_id)), 3)
+        self.assertEqual(self.manager.statistics.get(self.user_id).costs.count, 3)
+
+    def test_invalid_rows_are_rejected_on_their_own(self):
+        result = self.manager.create_transactions_bulk([
+            self.row(10), self.row(-1), self.row(quantity=0), self.row(payment_method="CHEQUE"),
+            self.row(item_category="UNKNOWN"), self.row(user_id="missing"), "row", (self.user_id, 1),
+            self.row(transaction_date="yesterday"), self.row(20)])
+
+        self.assertEqual(result.inserted, 2)
+        self.assertEqual([index for index, _ in result.errors], list(range(1, 9)))
+        self.assertIsInstance(dict(result.errors)[6], TypeError)
+        self.assertTrue(all(isinstance(error, ValueError)
+                            for index, error in result.errors if index != 6))
+        self.assertEqual(self.balances(), (70, 50))
+
+    def test_rows_over_the_balance_are_rejected(self):
+        result = self.manager.create_transactions_bulk([
+            self.row(60), self.row(60), self.row(30, "CARD"), self.row(30, "CARD"), self.row(40)])
+
+        self.assertEqual([index for index, _ in result.errors], [1, 3])
+        self.assertEqual(str(result.errors[0][1]), "Balance cannot be less than 0")
+        self.assertEqual(self.balances(), (0, 20))
+
+    def test_column_batch_is_registered(self):
+        result = self.manager.create_transactions_bulk({
+            "user_id": [self.user_id] * 3, "cost": [1, 2, -3], "payment_method": ["CASH", "CARD", "CASH"],
+            "item": ["item"] * 3, "quantity": [1, 1, 1], "item_category": ["GROCERIES"] * 3,
+            "vendor": ["vendor"] * 3})
+
+        self.assertEqual(result.inserted, 2)
+        self.assertEqual([index for index, _ in result.errors], [2])
+        self.assertEqual(self.balances(), (99, 48))
+
+    def test_malformed_column_batch_is_refused(self):
+        columns = {field: [self.row()[field]] * 2 for field in TransactionManager.BULK_FIELDS}
+        columns["cost"] = [1]
+        with self.assertRaises(ValueError):
+            self.manager.create_transactions_bulk(columns)
+        del columns["vendor"]
+        with self.assertRaises(KeyError):
+            self.manager.create_transactions_bulk(columns)
+        self.assertEqual(self.balances(), (100, 50))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+from concurrency import ConcurrentTransactionManager
+from models import AccountManager, Transaction
+
+import sys
+import threading
+import unittest
+
+
+THREADS = 8
+TRANSACTIONS_PER_THREAD = 500
+ACCOUNTS = 5
+INITIAL_BALANCE = 1_000_000
+
+
+class ConcurrentPostingTest(unittest.TestCase):
+    """
+    Threads post transactions with fixed costs to the same few accounts at once, the final balances and the store
+    have to account for every transaction exactly once.
+    """
+
+    def setUp(self):
+        self.switch_interval = sys.getswitchinterval()
+        # switching threads as often as possible makes the interleavings the locks guard against likely
+        sys.setswitchinterval(1e-6)
+        self.account_manager = AccountManager({})
+        for _ in range(ACCOUNTS):
+            self.account_manager.create_account(
+                "John", "Smith", INITIAL_BALANCE, INITIAL_BALANCE)
+        self.account_ids = sorted(self.account_manager.accounts)
+        self.manager = ConcurrentTransactionManager(self.account_manager)
+
+    def tearDown(self):
+        sys.setswitchinterval(self.switch_interval)
+
+    def run_threads(self, target) -> None:
+        errors = []
+        start = threading.Barrier(THREADS)
+
+        def run(thread):
+            try:
+                start.wait()
+                target(thread)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(thread,))
+                   for thread in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    @staticmethod
+    def planned(thread: int) -> list[tuple[int, int, str]]:
+        """
+        Returns the (account index, cost, payment method) of every transaction a thread posts, the same every run.
+        """
+        return [((thread + index) % ACCOUNTS, 1 + (thread * 7 + index) % 13, ("CARD", "CASH")[index % 2])
+                for index in range(TRANSACTIONS_PER_THREAD)]
+
+    def expected_balances(self, threads: range) -> dict:
+        balances = {user_id: {"CARD": INITIAL_BALANCE, "CASH": INITIAL_BALANCE}
+                    for user_id in self.account_ids}
+        for thread in threads:
+            for account, cost, payment_method in self.planned(thread):
+                balances[self.account_ids[account]][payment_method] -= cost
+        return balances
+
+    def assert_balances(self, expected: dict) -> None:
+        for user_id, balances in expected.items():
+            account = self.account_manager.get_account(user_id)
+            self.assertEqual(account.balance_card, balances["CARD"])
+            self.assertEqual(account.balance_cash, balances["CASH"])
+
+    def post(self, thread: int) -> list[tuple[str, str]]:
+        posted = []
+        for account, cost, payment_method in self.planned(thread):
+            user_id = self.account_ids[account]
+            transaction = Transaction(
+                user_id, cost, payment_method, "item", 1, "GROCERIES", "vendor")
+            self.manager.add_transcation(transaction)
+            posted.append((user_id, transaction.transaction_id))
+        return posted
+
+    def test_posting_from_many_threads_loses_no_transaction(self):
+        posted = {}
+        self.run_threads(lambda thread: posted.setdefault(thread, self.post(thread)))
+
+        self.assert_balances(self.expected_balances(range(THREADS)))
+        self.assertEqual(len(self.manager.store), THREADS * TRANSACTIONS_PER_THREAD)
+        for transactions in posted.values():
+            for user_id, transaction_id in transactions:
+                self.assertIsNotNone(
+                    self.manager.get_user_transaction(user_id, transaction_id))
+
+    def test_reversing_from_many_threads_restores_balances(self):
+        posted = {thread: self.post(thread) for thread in range(THREADS)}
+
+        # odd threads reverse the transactions posted by the even ones while the even ones post them again
+        def work(thread):
+            if thread % 2:
+                for user_id, transaction_id in posted[thread - 1]:
+                    self.manager.reverse_transaction(user_id, transaction_id)
+            else:
+                self.post(thread)
+
+        self.run_threads(work)
+
+        # every planned transaction is stored once again, the reversed ones were replaced by new ones
+        self.assert_balances(self.expected_balances(range(THREADS)))
+        self.assertEqual(len(self.manager.store), THREADS * TRANSACTIONS_PER_THREAD)
+        for thread in range(0, THREADS, 2):
+            for user_id, transaction_id in posted[thread]:
+                self.assertIsNone(
+                    self.manager.get_user_transaction(user_id, transaction_id))
+
+    def test_account_statistics_match_the_store(self):
+        self.run_threads(self.post)
+
+        for user_id in self.account_ids:
+            transactions = self.manager.get_user_transactions(user_id)
+            stats = self.manager.get_account_stats(user_id)
+            self.assertEqual(stats.costs.count, len(transactions))
+            self.assertEqual(stats.costs.total, sum(
+                transaction.cost for transaction in transactions))
+
+
+if __name__ == "__main__":
+    unittest.main()
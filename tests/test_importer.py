@@ -0,0 +1,88 @@
+from importer import StatementImporter
+from models import AccountManager, TransactionManager
+
+import json
+import os
+import tempfile
+import unittest
+
+
+class StatementImporterTest(unittest.TestCase):
+    """
+    Valid records of a statement have to be registered and every invalid one rejected on its own.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.account_manager = AccountManager({})
+        self.account_manager.create_account("John", "Smith", 10_000, 10_000)
+        self.user_id, = self.account_manager.accounts
+        self.manager = TransactionManager(self.account_manager)
+        self.importer = StatementImporter(self.manager, chunk_size=2, rejected_path=self.path("rejected.jsonl"),
+                                          checkpoint_path=self.path("checkpoint.json"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory.name, name)
+
+    def write(self, name: str, lines: list[bytes]) -> str:
+        path = self.path(name)
+        with open(path, "wb") as file:
+            file.write(b"\n".join(lines) + b"\n")
+        return path
+
+    def record(self, **fields) -> bytes:
+        record = {"user_id": self.user_id, "cost": 10, "payment_method": "CARD", "item": "item", "quantity": 1,
+                  "item_category": "GROCERIES", "vendor": "vendor", "transaction_date": "2024-01-10"}
+        record.update(fields)
+        return json.dumps(record).encode()
+
+    def rejected(self) -> list[dict]:
+        with open(self.path("rejected.jsonl"), encoding="utf-8") as file:
+            return [json.loads(line) for line in file]
+
+    def test_jsonl_records_are_imported_and_invalid_ones_rejected(self):
+        lines = [self.record(), self.record(cost=-1), b"not json", b"[1, 2]",
+                 self.record(vendor="v\xff").replace(b"\\u00ff", b"\xff"), self.record(cost=20.5)]
+        path = self.write("statement.jsonl", lines)
+
+        report = self.importer.import_file(path)
+
+        self.assertEqual((report.imported, report.rejected, report.offset),
+                         (2, 4, os.path.getsize(path)))
+        self.assertEqual(sorted(transaction.cost for transaction in self.manager.get_user_transactions(self.user_id)),
+                         [10, 20.5])
+        offsets = [sum(len(line) + 1 for line in lines[:index]) for index in range(len(lines))]
+        self.assertEqual([rejected["offset"] for rejected in self.rejected()], offsets[1:5])
+        self.assertEqual(self.rejected()[3]["error"], "Record is not valid utf-8 text.")
+
+    def test_csv_records_are_imported_and_invalid_ones_rejected(self):
+        path = self.write("statement.csv", [
+            b"user_id,cost,payment_method,item,quantity,item_category,vendor,transaction_date",
+            f"{self.user_id},10,CARD,item,1,GROCERIES,vendor,2024-01-10".encode(),
+            f"{self.user_id},ten,CARD,item,1,GROCERIES,vendor,".encode(),
+            f"{self.user_id},5,CASH,item,1,GROCERIES,vendor\xff,".encode("latin-1"),
+            f"{self.user_id},2.5,CASH,item,2,GROCERIES,vendor,".encode()])
+
+        report = self.importer.import_file(path)
+
+        self.assertEqual((report.imported, report.rejected), (2, 2))
+        self.assertEqual(self.account_manager.get_account(self.user_id).balance_cash, 10_000 - 2.5)
+        self.assertEqual(self.account_manager.get_account(self.user_id).balance_card, 10_000 - 10)
+
+    def test_import_resumes_after_the_checkpoint(self):
+        path = self.write("statement.jsonl", [self.record(cost=cost) for cost in range(1, 5)])
+        self.importer.import_file(path)
+        with open(path, "ab") as file:
+            file.write(self.record(cost=5) + b"\n")
+
+        report = self.importer.import_file(path, resume=True)
+
+        self.assertEqual((report.imported, report.rejected, report.offset), (5, 0, os.path.getsize(path)))
+        self.assertEqual(len(self.manager.get_user_transactions(self.user_id)), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
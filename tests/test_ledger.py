@@ -0,0 +1,74 @@
+from ledger import BalanceLedger, day_start
+from models import AccountManager, TransactionManager
+from utils import parse_date
+
+from datetime import date
+import random
+import unittest
+
+
+class BalanceLedgerTest(unittest.TestCase):
+    """
+    Balances at a point in time have to include exactly the transactions dated up to it, whatever order the
+    transactions were registered and reversed in.
+    """
+
+    def setUp(self):
+        self.account_manager = AccountManager({})
+        self.account_manager.create_account("John", "Smith", 1000, 500)
+        self.user_id, = self.account_manager.accounts
+        self.manager = TransactionManager(self.account_manager)
+        self.ledger = BalanceLedger(self.manager, checkpoint_interval=2,
+                                    clock=lambda: day_start(parse_date("2024-01-01")))
+
+    def add(self, cost, transaction_date: str, payment_method: str = "CASH"):
+        result = self.manager.create_transactions_bulk(
+            [(self.user_id, cost, payment_method, "item", 1, "GROCERIES", "vendor", transaction_date)])
+        self.assertEqual(result.errors, [])
+        return result.transactions[0]
+
+    def test_historical_transactions_and_reversals(self):
+        self.add(10, "2024-03-01")
+        reversed = self.add(20, "2024-02-01")
+        self.add(5, "2024-02-15", "CARD")
+        self.add(1, "2024-01-10")
+        self.add(100, "2024-03-05")
+        self.manager.reverse_transaction(self.user_id, reversed.transaction_id)
+
+        self.assertEqual(self.ledger.balance_at(self.user_id, "2024-01-01"), (1000, 500))
+        self.assertEqual(self.ledger.balance_at(self.user_id, "2024-02-10"), (999, 500))
+        self.assertEqual(self.ledger.balance_at(self.user_id, date(2024, 2, 20)), (999, 495))
+        self.assertEqual(self.ledger.balances_at("2024-03-31"), {self.user_id: (889, 495)})
+        self.assertEqual(self.ledger.reconcile(), [])
+
+    def test_balances_match_a_replay_of_the_transactions(self):
+        generator = random.Random(7)
+        first = parse_date("2024-01-01")
+        costs = {}
+        for _ in range(60):
+            day = first + generator.randrange(90)
+            cost = generator.randint(1, 9)
+            self.add(cost, date.fromordinal(day).isoformat())
+            costs[day] = costs.get(day, 0) + cost
+
+        for day in range(first, first + 90):
+            expected = 1000 - sum(cost for paid, cost in costs.items() if paid <= day)
+            self.assertEqual(self.ledger.balance_at(self.user_id, date.fromordinal(day)), (expected, 500))
+
+    def test_changes_outside_the_transactions_are_reconciled(self):
+        self.add(10, "2024-01-05")
+        self.account_manager.update_account(self.user_id, {"balance_card": 300})
+
+        self.assertEqual(self.ledger.reconcile(), [(self.user_id, "balance_card", 500, 300)])
+
+    def test_unknown_history_is_refused(self):
+        with self.assertRaises(KeyError):
+            self.ledger.balance_at("missing", "2024-01-01")
+        with self.assertRaises(ValueError):
+            self.ledger.balance_at(self.user_id, "2023-12-31")
+        with self.assertRaises(TypeError):
+            self.ledger.balance_at(self.user_id, [2024, 1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+from models import AccountManager, TransactionManager
+from oplog import OperationLog, SEGMENT_NAME, encode_account
+
+import os
+import tempfile
+import unittest
+
+
+class RecoveryTest(unittest.TestCase):
+    """
+    Changes logged by an OperationLog have to be recovered into the same accounts, balances and transactions.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.account_manager = AccountManager({})
+        self.transaction_manager = TransactionManager(self.account_manager)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def attach(self, **options) -> OperationLog:
+        log = OperationLog(self.directory.name, **options)
+        log.attach(self.account_manager, self.transaction_manager)
+        return log
+
+    def create_accounts(self, count: int) -> list:
+        for _ in range(count):
+            self.account_manager.create_account("John", "Smith", 1000, 500.5)
+        return sorted(self.account_manager.accounts)
+
+    def assert_recovered(self) -> TransactionManager:
+        account_manager, transaction_manager = OperationLog(self.directory.name).recover()
+        self.assertEqual(
+            {id: (account.name, account.balance_cash, account.balance_card)
+             for id, account in account_manager.accounts.items()},
+            {id: (account.name, account.balance_cash, account.balance_card)
+             for id, account in self.account_manager.accounts.items()})
+        expected = self.transaction_manager.store
+        self.assertEqual(len(transaction_manager.store), len(expected))
+        for user_id in expected.users():
+            self.assertEqual(
+                sorted((transaction.transaction_id, transaction.cost, transaction.vendor)
+                       for transaction in transaction_manager.store.get_user_transactions(user_id) or ()),
+                sorted((transaction.transaction_id, transaction.cost, transaction.vendor)
+                       for transaction in expected.get_user_transactions(user_id) or ()))
+        return transaction_manager
+
+    def test_changes_are_recovered(self):
+        with self.attach():
+            first, second = self.create_accounts(2)
+            for cost in (10, 20.5, 30):
+                self.transaction_manager.create_transaction(
+                    first, cost, "CASH", "item", 1, "GROCERIES", "Store 114")
+            self.transaction_manager.create_transaction(
+                second, 7, "CARD", "item", 2, "GROCERIES", "Store 115")
+            reversed_id = self.transaction_manager.get_user_transactions(first)[1].transaction_id
+            self.transaction_manager.reverse_transaction(first, reversed_id)
+            self.account_manager.update_account(second, {"name": "Jane", "balance_cash": 250})
+
+        self.assert_recovered()
+
+    def test_bulk_insert_across_a_snapshot_is_recovered_once(self):
+        with self.attach(snapshot_every=4):
+            user_id, = self.create_accounts(1)
+            result = self.transaction_manager.create_transactions_bulk(
+                [(user_id, cost, "CASH", "item", 1, "GROCERIES", "vendor") for cost in range(1, 6)])
+            self.assertEqual(result.errors, [])
+
+        recovered = self.assert_recovered()
+        self.assertEqual(len(recovered.store), 5)
+
+    def test_snapshot_and_later_segments_are_recovered(self):
+        with self.attach() as log:
+            user_id, = self.create_accounts(1)
+            self.transaction_manager.create_transaction(
+                user_id, 5, "CASH", "item", 1, "GROCERIES", "vendor")
+            log.snapshot()
+            self.transaction_manager.create_transaction(
+                user_id, 6, "CARD", "item", 1, "GROCERIES", "vendor")
+
+        self.assert_recovered()
+
+    def test_transaction_without_the_record_of_its_balance_is_recovered(self):
+        with self.attach() as log:
+            user_id, = self.create_accounts(1)
+            self.transaction_manager.create_transaction(
+                user_id, 5, "CARD", "item", 1, "GROCERIES", "vendor")
+            account = self.account_manager.get_account(user_id)
+            log.sync()
+
+        # a crash right after the record of the transaction loses the record of the account written after it
+        (_, path), = log.files(SEGMENT_NAME)
+        os.truncate(path, os.path.getsize(path) - len(encode_account(account)))
+
+        account_manager, transaction_manager = OperationLog(self.directory.name).recover()
+        self.assertEqual(account_manager.get_account(user_id).balance_card, 495.5)
+        self.assertEqual(len(transaction_manager.store), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+from models import AccountManager, TransactionManager
+from query import where
+from storage import ColumnarTransactionStore
+
+import unittest
+
+
+class QueryTest(unittest.TestCase):
+    """
+    Queries have to return the same transactions whether the store is scanned row by row or evaluated over columns.
+    """
+
+    def setUp(self):
+        self.account_manager = AccountManager({})
+        for _ in range(2):
+            self.account_manager.create_account("John", "Smith", 10_000, 10_000)
+        self.first, self.second = sorted(self.account_manager.accounts)
+        self.managers = [TransactionManager(self.account_manager),
+                         TransactionManager(self.account_manager, ColumnarTransactionStore())]
+
+        rows = []
+        for index in range(30):
+            rows.append((self.first if index % 3 else self.second, index + 1, "CARD" if index % 2 else "CASH",
+                         f"item {index % 4}", index % 5 + 1, ("GROCERIES", "PETS", "HOLIDAYS")[index % 3],
+                         f"Store {index % 7}", f"2024-01-{index % 28 + 1:02}"))
+        for manager in self.managers:
+            result = manager.create_transactions_bulk(rows)
+            self.assertEqual(result.errors, [])
+            # a reversed transaction is deleted from the columns but its row stays until compaction
+            reversed = result.transactions[4]
+            manager.reverse_transaction(reversed.user_id, reversed.transaction_id)
+
+    def assert_query(self, expected, *args, **kwargs) -> None:
+        for manager in self.managers:
+            with self.subTest(store=type(manager.store).__name__):
+                self.assertEqual(list(manager.query(*args, **kwargs)), expected)
+
+    def test_predicates_are_combined(self):
+        predicate = (where("cost").between(10, 20) & where("item_category").isin(["PETS", "HOLIDAYS"])) | \
+            where("vendor").contains("Store 6")
+        expected = [(cost,) for cost in range(1, 31) if cost != 5 and (
+            (10 <= cost <= 20 and (cost - 1) % 3) or (cost - 1) % 7 == 6)]
+
+        self.assert_query(expected, predicate, fields=["cost"], order_by="cost")
+
+    def test_negated_predicate_and_keyword_filters(self):
+        expected = [(cost,) for cost in range(1, 31)
+                    if cost != 5 and (cost - 1) % 3 and (cost - 1) % 2 == 0 and cost >= 15]
+
+        self.assert_query(expected, ~where("payment_method").eq("CARD"), fields=["cost"], order_by="cost",
+                          user_id=self.first, min_cost=15)
+
+    def test_projection_order_and_pages(self):
+        costs = sorted((cost for cost in range(1, 31) if cost != 5), key=lambda cost: (-((cost - 1) % 5 + 1), cost))
+        expected = [((cost - 1) % 5 + 1, cost) for cost in costs]
+
+        self.assert_query(expected[3:8], fields=["quantity", "cost"], order_by=["-quantity", "cost"],
+                          limit=5, offset=3)
+
+    def test_dates_limit_the_transactions(self):
+        expected = sorted(("2024-01-02" if cost in (2, 30) else f"2024-01-{cost:02}", cost)
+                          for cost in range(1, 31) if cost != 5 and (cost - 1) % 28 + 1 in (2, 3, 4, 5))
+
+        self.assert_query(expected, fields=["transaction_date", "cost"], order_by=["transaction_date", "cost"],
+                          start_date="2024-01-02", end_date="2024-01-05")
+
+    def test_invalid_queries_are_refused(self):
+        for manager in self.managers:
+            with self.assertRaises(KeyError):
+                list(manager.query(color="red"))
+            with self.assertRaises(ValueError):
+                list(manager.query(limit=-1))
+            with self.assertRaises(ValueError):
+                list(manager.query(where("color").eq("red")))
+
+
+if __name__ == "__main__":
+    unittest.main()
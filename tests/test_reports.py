@@ -0,0 +1,65 @@
+from models import AccountManager, TransactionManager
+from reports import SpendingRollups, parallel_rollups
+from storage import ColumnarTransactionStore
+
+from math import isclose
+import unittest
+
+
+class ParallelRollupsTest(unittest.TestCase):
+    """
+    Rollups computed in worker processes have to match the ones computed transaction by transaction.
+    """
+
+    def setUp(self):
+        self.account_manager = AccountManager({})
+        for _ in range(5):
+            self.account_manager.create_account("John", "Smith", 10 ** 9, 10 ** 9)
+        users = sorted(self.account_manager.accounts)
+        self.rows = [(users[index % 5], index % 13 + 0.5, "CARD" if index % 3 else "CASH", "item", 1,
+                      ("GROCERIES", "PETS", "HOLIDAYS")[index % 3], "vendor",
+                      f"2024-{index % 4 + 1:02}-{index % 27 + 1:02}") for index in range(400)]
+
+    def manager(self, store=None) -> TransactionManager:
+        manager = TransactionManager(self.account_manager, store)
+        transactions = manager.create_transactions_bulk(self.rows).transactions
+        for transaction in transactions[::7]:
+            manager.reverse_transaction(transaction.user_id, transaction.transaction_id)
+        return manager
+
+    def assert_rollups_equal(self, serial: SpendingRollups, parallel: dict) -> None:
+        self.assertEqual(set(parallel), set(SpendingRollups.ROLLUPS))
+        for name in SpendingRollups.ROLLUPS:
+            expected, computed = getattr(serial, name), parallel[name]
+            self.assertEqual(computed.keys(), expected.keys(), name)
+            for key, (total, count) in expected.items():
+                self.assertEqual(computed[key][1], count, (name, key))
+                self.assertTrue(isclose(computed[key][0], total), (name, key))
+
+    def test_parallel_rollups_match_the_serial_ones(self):
+        for store in (None, ColumnarTransactionStore()):
+            manager = self.manager(store)
+            serial = SpendingRollups(manager)
+            for workers in (1, 3):
+                with self.subTest(store=type(manager.store).__name__, workers=workers):
+                    self.assert_rollups_equal(serial, parallel_rollups(manager, workers, shards_per_worker=2))
+
+    def test_rebuild_in_workers_is_consistent(self):
+        rollups = SpendingRollups(self.manager())
+        rollups.rebuild(workers=2)
+
+        self.assertEqual(rollups.verify(), [])
+        self.assertEqual(rollups.spend(sorted(self.account_manager.accounts)[0], "PETS", "2024-02"),
+                         sum(row[1] for index, row in enumerate(self.rows)
+                             if index % 7 and index % 5 == 0 and index % 3 == 1 and index % 4 == 1))
+
+    def test_empty_manager_has_no_rollups(self):
+        manager = TransactionManager(self.account_manager)
+
+        self.assertEqual(parallel_rollups(manager, 2), {name: {} for name in SpendingRollups.ROLLUPS})
+        with self.assertRaises(ValueError):
+            parallel_rollups(manager, 2, shards_per_worker=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+from models import AccountManager, TransactionManager
+from oplog import OperationLog
+
+from collections import Counter
+from statistics import pvariance
+import tempfile
+import unittest
+
+
+class AccountStatisticsTest(unittest.TestCase):
+    """
+    Running aggregates of the accounts have to match the transactions in the store after every kind of change.
+    """
+
+    def setUp(self):
+        self.account_manager = AccountManager({})
+        self.account_manager.create_account("John", "Smith", 10_000, 10_000)
+        self.user_id, = self.account_manager.accounts
+        self.manager = TransactionManager(self.account_manager)
+
+    def create(self, cost, payment_method: str = "CASH", transaction_date: str = "2024-01-10"):
+        return self.manager.create_transactions_bulk(
+            [(self.user_id, cost, payment_method, "item", 1, "GROCERIES", "vendor", transaction_date)]
+        ).transactions[0]
+
+    def assert_match(self, manager: TransactionManager) -> None:
+        transactions = manager.get_user_transactions(self.user_id) or []
+        stats = manager.get_account_stats(self.user_id)
+        if not transactions:
+            self.assertIsNone(stats)
+            return
+        costs = [transaction.cost for transaction in transactions]
+        self.assertEqual(stats.costs.count, len(costs))
+        self.assertAlmostEqual(stats.costs.total, sum(costs))
+        self.assertAlmostEqual(stats.costs.variance, pvariance(costs))
+        self.assertEqual(stats.first_date, min(transaction.transaction_date for transaction in transactions))
+        self.assertEqual(stats.last_date, max(transaction.transaction_date for transaction in transactions))
+        self.assertEqual({payment_method: payment_stats.count
+                          for payment_method, payment_stats in stats.by_payment_method.items()},
+                         dict(Counter(transaction.payment_method for transaction in transactions)))
+
+    def test_added_and_reversed_transactions_are_aggregated(self):
+        self.manager.create_transaction(self.user_id, 12.5, "CARD", "item", 1, "GROCERIES", "vendor")
+        first = self.create(10, transaction_date="2024-01-01")
+        self.create(30, "CARD", "2024-03-01")
+        last = self.create(7, transaction_date="2030-01-01")
+        self.assert_match(self.manager)
+
+        # reversing the transactions of the first and the last day moves the date boundaries
+        self.manager.reverse_transaction(self.user_id, first.transaction_id)
+        self.manager.reverse_transaction(self.user_id, last.transaction_id)
+        self.assert_match(self.manager)
+
+        for transaction in list(self.manager.get_user_transactions(self.user_id)):
+            self.manager.reverse_transaction(self.user_id, transaction.transaction_id)
+        self.assert_match(self.manager)
+
+    def test_statistics_are_built_from_the_store(self):
+        for cost in (5, 15, 25):
+            self.create(cost)
+        self.assert_match(TransactionManager(self.account_manager, self.manager.store))
+
+    def test_statistics_are_rebuilt_after_recovery(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log = OperationLog(directory)
+            log.attach(self.account_manager, self.manager)
+            for cost in (5, 15, 25):
+                self.create(cost)
+            self.manager.reverse_transaction(self.user_id, self.create(40).transaction_id)
+            log.close()
+
+            _, recovered = OperationLog(directory).recover()
+        self.assert_match(recovered)
+
+
+if __name__ == "__main__":
+    unittest.main()
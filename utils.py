@@ -1,6 +1,9 @@
-from datetime import datetime
+from ids import RANDOM_STRINGS
+
+from datetime import date, datetime
+from functools import lru_cache
 from string import ascii_letters, digits
-import random
+from typing import Union
 
 
 def string_has_numbers(input_string):
@@ -29,26 +32,6 @@ def string_has_special_characters(input_string):
     return any(not c.isalnum() for c in input_string)
 
 
-def validate_date(date_input):
-    """
-    Validates the format of a date string.
-
-    Args:
-        date_input (str): The date string to be validated.
-
-    Raises:
-        ValueError: If the date string is not in the format 'YYYY-mm-dd'.
-
-    Returns:
-        None
-    """
-    try:
-        datetime.strptime(date_input, "%Y-%m-%d")
-    except ValueError:
-        raise ValueError(
-            "Invalid date format. Date should be in the format 'YYYY-mm-dd'.")
-
-
 def get_attributes_and_values(obj):
     """
     Retrieves the attributes and their corresponding values of an object.
@@ -87,19 +70,64 @@ def validate_date(date_input: str) -> None:
     Returns:
     None
     """
+    parse_date(date_input)
+
+
+@lru_cache(maxsize=4096)
+def parse_date(date_input: str) -> int:
+    """
+    Parses a date string into its day ordinal, see datetime.date.toordinal.
+
+    Zero-padded 'YYYY-mm-dd' strings are parsed by slicing, anything else falls back to datetime.strptime.
+    Results are memoized, as the same dates repeat over and over in accounts and transactions.
+
+    Parameters:
+    date_input (str): The date string to be parsed.
+
+    Raises:
+    ValueError: If the date string is not in the format 'YYYY-mm-dd'.
+
+    Returns:
+    int: The day ordinal of the date.
+    """
     try:
-        datetime.strptime(date_input, "%Y-%m-%d")
+        if len(date_input) == 10 and date_input[4] == "-" and date_input[7] == "-" and date_input.isascii() \
+                and date_input[:4].isdigit() and date_input[5:7].isdigit() and date_input[8:].isdigit():
+            return date(int(date_input[:4]), int(date_input[5:7]), int(date_input[8:])).toordinal()
+        return datetime.strptime(date_input, "%Y-%m-%d").toordinal()
     except ValueError:
         raise ValueError(
             "Invalid date format. Date should be in the format 'YYYY-mm-dd'.")
 
 
-def random_string_generator(length=10):
-    # set of characters to pick, but the chance of getting a digit is increased compared to change of getting an ascii letter
-    character_set = list(ascii_letters) + \
-        (int(len(ascii_letters)/len(digits))*list(digits))
+@lru_cache(maxsize=4096)
+def format_date(ordinal: int) -> str:
+    """
+    Formats a day ordinal back into a 'YYYY-mm-dd' string.
+    """
+    return date.fromordinal(ordinal).isoformat()
+
+
+def validate_optional_date(date_input: Union[str, None]) -> None:
+    """
+    Validates the format of a date string, None is accepted as a missing date.
 
-    return "".join(random.choices(character_set, k=length))
+    Parameters:
+    date_input (str or None): The date string to be validated.
+
+    Raises:
+    ValueError: If the date string is not in the format 'YYYY-mm-dd'.
+
+    Returns:
+    None
+    """
+    if date_input is not None:
+        validate_date(date_input)
+
+
+def random_string_generator(length=10):
+    # characters are picked from ids.WEIGHTED_ALPHABET, where the chance of getting a digit is increased compared to chance of getting an ascii letter
+    return RANDOM_STRINGS.random_string(length)
 
 
 if __name__ == "__main__":